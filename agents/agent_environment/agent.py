@@ -1,12 +1,14 @@
 import pandas as pd
 from tqdm import tqdm
+import asyncio
 import json
 import os
 import shutil
-import subprocess
-import sys
-from agents.utils import change_directory
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime
+from agents.agent_environment.journal import WorkflowJournal
+from agents.code_execution import ExecutionResult, execute_script
 from abc import ABC, abstractmethod
 import ast
 import copy  # 在文件顶部添加这个导入
@@ -42,13 +44,38 @@ class MaxDebugRetriesExceeded(Exception):
     pass
 
 
+class ExecutionContext:
+    """Per-instruction state of one workflow run, so that instructions can run concurrently."""
+
+    def __init__(self, instruction, workspace, agents, workflow):
+        self.instruction = instruction
+        self.workspace = workspace
+        self.agents = agents
+        # Steps get their args filled in place, so each context works on its own copy.
+        self.workflow = copy.deepcopy(workflow)
+        self.data_store = {}
+
+
+def _run_instruction_in_process(env, workflow, workflow_aux, instruction):
+    return env.run_instruction(workflow, workflow_aux, instruction)
+
+
 class AgentEnvironment:
     def __init__(self, workspace, config):
         self.workspace = workspace
         self.config = config
         self.agents = {}
-        self.data_store = {}
+        self.agent_specs = {}
         self.instructions = None
+        # max_workers > 1 runs instructions concurrently; executor is 'thread', 'process' or 'asyncio'.
+        self.max_workers = config.get('max_workers', 1)
+        self.executor = config.get('executor', 'thread')
+        # Path of a WorkflowJournal; when set, a rerun skips the steps that already finished.
+        self.journal_path = config.get('journal')
+        self.journal = None
+        # Reuse results of unchanged reruns; only for workflows whose generated scripts are deterministic.
+        self.cache_execution = config.get('cache_execution', False)
+        self.output_lock = threading.Lock()
         self.data_folder = config.get('data_folder', './InfiAgent_data/da-dev-tables')
         self.log_file = os.path.join(workspace, 'agent_workflow.log')
         self.output_handlers = {
@@ -60,6 +87,24 @@ class AgentEnvironment:
     # Agent Management
     def add_agent(self, agent_name, agent_class, **kwargs):
         self.agents[agent_name] = agent_class(self.workspace, **kwargs)
+        self.agent_specs[agent_name] = (agent_class, kwargs)
+
+    def _agents_for_context(self, parallel):
+        # Agents keep chat history on self, so concurrent instructions each get fresh instances.
+        if not parallel:
+            return self.agents
+        return {name: agent_class(self.workspace, **kwargs)
+                for name, (agent_class, kwargs) in self.agent_specs.items()}
+
+    def __getstate__(self):
+        # Locks cannot be pickled for the process executor; each process makes its own.
+        state = self.__dict__.copy()
+        del state['output_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.output_lock = threading.Lock()
 
     # Data Processing Methods
     def process_instruction_file(self, input_file, data_ids=None, data_range=None):
@@ -93,15 +138,9 @@ class AgentEnvironment:
         return workspace_list
 
     # Execution and Logging Methods
-    def execute_code(self, file_name, individual_workspace):
-        with change_directory(individual_workspace):
-            if not os.path.exists(file_name):
-                return f"Error: File {file_name} not found in workspace."
-            try:
-                result = subprocess.run([sys.executable, file_name], capture_output=True, text=True)
-                return result.stdout + result.stderr
-            except Exception as e:
-                return f"Error executing {file_name}: {str(e)}"
+    def execute_code(self, file_name, individual_workspace, env=None, timeout=None):
+        """Run a generated script and return its ExecutionResult; with `cache_execution`, unchanged reruns are cache hits."""
+        return execute_script(file_name, individual_workspace, use_cache=self.cache_execution, env=env, timeout=timeout)
 
     def log_action(self, action, agent_name, model_type, code, log, individual_workspace):
         model_type = model_type.replace("qwen/", "").replace("openai/", "").replace("deepseek/", "").replace(":", "_")
@@ -125,10 +164,11 @@ LOG OUTPUT:
         individual_log_file = os.path.join(model_dependent_directory, f'{agent_name}_{model_type}_log.txt')
 
         # 如果是该文件的第一次写入，先清除内容
-        if individual_log_file not in self.cleared_log_files:
-            with open(individual_log_file, 'w') as f:
-                pass  # 清空文件
-            self.cleared_log_files.add(individual_log_file)
+        with self.output_lock:
+            if individual_log_file not in self.cleared_log_files:
+                with open(individual_log_file, 'w') as f:
+                    pass  # 清空文件
+                self.cleared_log_files.add(individual_log_file)
 
         # 追加写入新的日志
         with open(individual_log_file, 'a', encoding='utf-8') as f:
@@ -137,11 +177,14 @@ LOG OUTPUT:
         return log_entry
 
     def is_execution_successful(self, log):
+        # Script runs are judged by their exit status; strings (e.g. agent feedback) by their content.
+        if isinstance(log, ExecutionResult):
+            return log.success
         error_indicators = ['Traceback (most recent call last):', 'Incorrect Answer:', 'Error:']
         return not any(indicator in log for indicator in error_indicators)
 
     # Step Execution Methods
-    def _execute_step(self, step, config_args):
+    def _execute_step(self, ctx, step, config_args):
         """执行单个工作流步骤"""
         agent_args = step.get('args', {})
 
@@ -149,20 +192,20 @@ LOG OUTPUT:
         method_name = step['method']
         output_type = step.get('output_type', 'code')
         
-        workspace_list = self._handle_input(step)
-        self._handle_data_flow(config_args, agent_args)
+        workspace_list = self._handle_input(ctx, step)
+        self._handle_data_flow(ctx, config_args, agent_args)
         
         step_results = self._execute_agent_method(
-            agent_name, method_name, agent_args,
+            ctx, agent_name, method_name, agent_args,
             workspace_list, output_type, step.get('input', {})
         )
         
         if 'output' in step:
-            self.data_store[step['output']] = step_results
+            ctx.data_store[step['output']] = step_results
             
         return step_results, agent_name, method_name
 
-    def _handle_input(self, step):
+    def _handle_input(self, ctx, step):
         """处理步骤的输入数据"""
         if 'input' in step:
             input_file = step['input'].get('data')
@@ -172,27 +215,27 @@ LOG OUTPUT:
                     step.get('data_ids'), 
                     step.get('data_range')
                 )
-        return self.current_workspace  # Return current workspace as a single-item list
+        return ctx.workspace  # Return current workspace as a single-item list
 
-    def _handle_data_flow(self, config_args, agent_args):
+    def _handle_data_flow(self, ctx, config_args, agent_args):
         """处理数据流参数"""
         for arg_name, arg_value in config_args.items():
             if isinstance(arg_value, dict) and 'from' in arg_value:
-                agent_args[arg_name] = self.data_store[arg_value['from']]
+                agent_args[arg_name] = ctx.data_store[arg_value['from']]
 
-    def _execute_agent_method(self, agent_name, method_name, args, workspace_list, output_type, input_):
+    def _execute_agent_method(self, ctx, agent_name, method_name, args, workspace_list, output_type, input_):
         """执行agent方法并处理结果"""
-        agent = self.agents[agent_name]
+        agent = ctx.agents[agent_name]
         method = getattr(agent, method_name)
         
         result = self._process_single_instruction(
-            agent, method, args, input_, self.current_instruction,
-            self.current_workspace, output_type, agent_name
+            ctx, agent, method, args, input_, ctx.instruction,
+            ctx.workspace, output_type, agent_name
         )
         
         return result
 
-    def _process_single_instruction(self, agent, method, args, input_, instruction, individual_workspace, output_type, agent_name):
+    def _process_single_instruction(self, ctx, agent, method, args, input_, instruction, individual_workspace, output_type, agent_name):
         """处理单个指令"""
         self._prepare_instruction_args(args, input_, instruction, individual_workspace)
         
@@ -203,7 +246,7 @@ LOG OUTPUT:
             return None
 
         return self._handle_method_output(
-            method_output, output_type, agent_name, 
+            ctx, method_output, output_type, agent_name, 
             individual_workspace, args
         )
 
@@ -218,7 +261,7 @@ LOG OUTPUT:
         
         args['queries'] = instruction
 
-    def _handle_method_output(self, method_output, output_type, agent_name, individual_workspace, args):
+    def _handle_method_output(self, ctx, method_output, output_type, agent_name, individual_workspace, args):
         """处理方法输出"""
         handler = self.output_handlers.get(output_type)
         if not handler:
@@ -232,21 +275,21 @@ LOG OUTPUT:
         )
 
         return self._process_output_result(
-            output_type, agent_name, model_type,
+            ctx, output_type, agent_name, model_type,
             result, log, file_name, individual_workspace, args
         )
 
-    def _process_output_result(self, output_type, agent_name, model_type, result, log, file_name, individual_workspace, args):
+    def _process_output_result(self, ctx, output_type, agent_name, model_type, result, log, file_name, individual_workspace, args):
         """处理输出结果"""
-        full_log = self._handle_execution_and_logging(
+        full_log, execution = self._handle_execution_and_logging(
             output_type, agent_name, model_type,
             result, log, file_name, individual_workspace
         )
         
         if output_type == 'code':
             result = self._handle_code_execution(
-                agent_name, model_type, result, file_name,
-                individual_workspace, args, full_log
+                ctx, agent_name, model_type, result, file_name,
+                individual_workspace, args, full_log, execution
             )
             
         return {'log': full_log, 'result': result}
@@ -254,32 +297,35 @@ LOG OUTPUT:
     def _handle_execution_and_logging(self, output_type, agent_name, model_type, result, log, file_name, individual_workspace):
         """处理执行和日志记录"""
         full_log = self.log_action("Generate", agent_name, model_type, result, log, individual_workspace)
+        execution = None
         
         if output_type == 'code':
-            execution_output = self.execute_code(file_name, individual_workspace)
+            execution = self.execute_code(file_name, individual_workspace)
             full_log += self.log_action(
                 "Execute", agent_name, model_type,
-                result, execution_output, individual_workspace
+                result, execution.output, individual_workspace
             )
             
-        return full_log
+        return full_log, execution
 
-    def _handle_code_execution(self, agent_name, model_type, result, file_name, individual_workspace, args, full_log):
+    def _handle_code_execution(self, ctx, agent_name, model_type, result, file_name, individual_workspace, args, full_log, execution):
         """处理代码执行"""
-        execution_output = self.execute_code(file_name, individual_workspace)
-        if not self.is_execution_successful(execution_output):
+        # Reuse the run from _handle_execution_and_logging instead of executing the file again.
+        execution_output = execution.output
+        if not self.is_execution_successful(execution):
             retry_time = 0
-            while not self.is_execution_successful(execution_output) and retry_time < 1:
+            while not self.is_execution_successful(execution) and retry_time < 1:
                 try:
                     result = self._debug_code(
-                        agent_name, model_type, result,
+                        ctx, agent_name, model_type, result,
                         file_name, individual_workspace,
                         args, execution_output
                     )
                 except NotImplementedError as e:
                     print(f"debug method missing: {e}")
 
-                execution_output = self.execute_code(file_name, individual_workspace)
+                execution = self.execute_code(file_name, individual_workspace)
+                execution_output = execution.output
 
                 print(f"Self-debugging, current retry time: {retry_time}")
                 debug_log = "\n\n*********Debugged Code**********\n\n" + result +"\n\n****************Execution Output***************\n\n" + execution_output + "\n"
@@ -296,7 +342,7 @@ LOG OUTPUT:
                 retry_time += 1
                 
             if retry_time >= 10:
-                error_msg = f"Maximum debug retries (10) exceeded for instruction {self.current_instruction['id']}"
+                error_msg = f"Maximum debug retries (10) exceeded for instruction {ctx.instruction['id']}"
                 self.log_action(
                     "Debug Failed",
                     agent_name,
@@ -309,10 +355,10 @@ LOG OUTPUT:
                 
         return result
 
-    def _debug_code(self, agent_name, model_type, code, file_name, individual_workspace, args, error_output):
+    def _debug_code(self, ctx, agent_name, model_type, code, file_name, individual_workspace, args, error_output):
         """调试代码"""
         method_name = args.get('method_name', 'run')  # 获取方法名
-        debug_method = getattr(self.agents[agent_name], f"debug_{method_name}", None)
+        debug_method = getattr(ctx.agents[agent_name], f"debug_{method_name}", None)
         if not debug_method:
             print(f"No debug method found for {agent_name}")
             raise NotImplementedError
@@ -346,10 +392,16 @@ LOG OUTPUT:
                     return input_step
         return None
 
-    def run_workflow(self, workflow):
-        """执行工作流"""
-        all_results = []
-        
+    def run_workflow(self, workflow, max_workers=None, executor=None):
+        """执行工作流
+
+        Instructions are independent (each has its own example_{id} workspace), so with
+        max_workers > 1 they run concurrently on the chosen executor. Results keep the order of
+        the instruction file either way.
+        """
+        max_workers = max_workers or self.max_workers
+        executor = executor or self.executor
+
         # Find input step recursively
         input_step = self._find_input_step(workflow)
         if not input_step:
@@ -367,46 +419,131 @@ LOG OUTPUT:
         )
 
         workflow_aux = copy.deepcopy(workflow)
-        
-        # Now process each instruction
-        for instruction in tqdm(self.instructions):
-            try:
-                results = {}
-                # Create individual workspace for this instruction
-                individual_workspace = os.path.join(self.workspace, f'example_{instruction["id"]}')
-                os.makedirs(individual_workspace, exist_ok=True)
-                
-                # Copy data file if needed
-                if file_name := instruction.get('file_name'):
-                    src = os.path.join(self.data_folder, file_name)
-                    dst = os.path.join(individual_workspace, file_name)
-                    if os.path.exists(src):
-                        shutil.copy(src, dst)
-                    else:
-                        print(f"Warning: File {file_name} not found in data folder.")
-                
-                # Store current instruction and workspace
-                self.current_instruction = instruction
-                self.current_workspace = individual_workspace
-
-                # Execute each step for this instruction
-                for step, step_aux in zip(workflow, workflow_aux):
-                    if step.get('type') == 'loop':
-                        results.update(self._handle_loop_step(step, step_aux))
-                    else:
-                        config_args = step_aux.get('args')
-                        step_results, agent_name, method_name = self._execute_step(step, config_args)
-                        results[f"{agent_name}_{method_name}"] = step_results
-                
-                all_results.append(results)
-                
-            except MaxDebugRetriesExceeded as e:
-                print(f"Aborting instruction {instruction['id']}: {str(e)}")
-                continue  # Skip to next instruction
-            
+
+        if self.journal_path:
+            self.journal = WorkflowJournal(self.journal_path, workflow)
+            print(f"Resuming from journal {self.journal_path}: "
+                  f"{len(self.journal.statuses)} instructions already finished")
+
+        if max_workers <= 1:
+            all_results = [self.run_instruction(workflow, workflow_aux, instruction)
+                           for instruction in tqdm(self.instructions)]
+        elif executor == 'asyncio':
+            all_results = asyncio.run(self._arun_instructions(workflow, workflow_aux, max_workers))
+        elif executor in ('thread', 'process'):
+            all_results = self._run_instructions_in_pool(workflow, workflow_aux, max_workers, executor)
+        else:
+            raise ValueError(f"Unknown executor: {executor}")
+
+        # Aborted instructions return None and are left out, as in the serial run.
+        return [results for results in all_results if results is not None]
+
+    def _run_instructions_in_pool(self, workflow, workflow_aux, max_workers, executor):
+        if executor == 'process':
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+            submit = lambda instruction: pool.submit(_run_instruction_in_process, self, workflow, workflow_aux,
+                                                     instruction)
+        else:
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+            submit = lambda instruction: pool.submit(self.run_instruction, workflow, workflow_aux, instruction,
+                                                     True)
+
+        all_results = [None] * len(self.instructions)
+        with pool:
+            futures = {submit(instruction): index for index, instruction in enumerate(self.instructions)}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                all_results[futures[future]] = future.result()
         return all_results
 
-    def _handle_loop_step(self, step, step_aux):
+    async def _arun_instructions(self, workflow, workflow_aux, max_workers):
+        # Agents are synchronous, so the event loop only schedules them onto worker threads.
+        semaphore = asyncio.Semaphore(max_workers)
+        progress = tqdm(total=len(self.instructions))
+
+        async def run(instruction):
+            async with semaphore:
+                results = await asyncio.to_thread(self.run_instruction, workflow, workflow_aux, instruction, True)
+            progress.update(1)
+            return results
+
+        try:
+            return await asyncio.gather(*[run(instruction) for instruction in self.instructions])
+        finally:
+            progress.close()
+
+    def run_instruction(self, workflow, workflow_aux, instruction, parallel=False):
+        """Run every workflow step for one instruction; returns None if the instruction was aborted."""
+        journal = self.journal
+        if journal and journal.status(instruction['id']) == 'aborted':
+            return None
+        finished_steps = journal.finished_steps(instruction['id']) if journal else {}
+
+        try:
+            results = {}
+            # Create individual workspace for this instruction
+            individual_workspace = os.path.join(self.workspace, f'example_{instruction["id"]}')
+            os.makedirs(individual_workspace, exist_ok=True)
+            
+            # Copy data file if needed
+            if file_name := instruction.get('file_name'):
+                src = os.path.join(self.data_folder, file_name)
+                dst = os.path.join(individual_workspace, file_name)
+                if os.path.exists(src):
+                    shutil.copy(src, dst)
+                else:
+                    print(f"Warning: File {file_name} not found in data folder.")
+            
+            ctx = ExecutionContext(instruction, individual_workspace, self._agents_for_context(parallel), workflow)
+
+            # Execute each step for this instruction
+            journaled = True
+            for index, (step, step_aux) in enumerate(zip(ctx.workflow, workflow_aux)):
+                step_key = str(index)
+                if step_key in finished_steps:
+                    # Finished in an earlier run: restore its outputs instead of running it again.
+                    results.update(finished_steps[step_key]['results'])
+                    ctx.data_store.update(finished_steps[step_key]['data_store'])
+                    continue
+
+                if step.get('type') == 'loop':
+                    step_results = self._handle_loop_step(ctx, step, step_aux)
+                else:
+                    config_args = step_aux.get('args')
+                    result, agent_name, method_name = self._execute_step(ctx, step, config_args)
+                    step_results = {f"{agent_name}_{method_name}": result}
+                results.update(step_results)
+
+                if journal and not self._journal_step(journal, ctx, step_key, step, step_results):
+                    journaled = False
+
+            if journal and journaled and journal.status(instruction['id']) != 'done':
+                # A rerun of a finished instruction restores every step and writes nothing.
+                journal.record_status(instruction['id'], 'done')
+            return results
+            
+        except MaxDebugRetriesExceeded as e:
+            print(f"Aborting instruction {instruction['id']}: {str(e)}")
+            if journal:
+                journal.record_status(instruction['id'], 'aborted')
+            return None  # Skip to next instruction
+
+    def _journal_step(self, journal, ctx, step_key, step, step_results):
+        """Record a finished step; returns False when it was left out, so a resume runs it again."""
+        instruction_id = ctx.instruction['id']
+        if any(result is None for result in step_results.values()):
+            # The agent call failed (_process_single_instruction returned None).
+            print(f"Not journaling step {step_key} of instruction {instruction_id}: it did not succeed")
+            return False
+        outputs = [substep['output'] for substep in step.get('steps', [step]) if 'output' in substep]
+        try:
+            journal.record_step(instruction_id, step_key, step_results,
+                                {name: ctx.data_store[name] for name in outputs if name in ctx.data_store})
+        except TypeError as e:
+            print(f"Not journaling step {step_key} of instruction {instruction_id}: {e}")
+            return False
+        return True
+
+    def _handle_loop_step(self, ctx, step, step_aux):
         """处理循环步骤"""
         loop_results = {}
         loop_condition = True
@@ -421,24 +558,25 @@ LOG OUTPUT:
                 if iteration == 0:
                     # 首次迭代
                     config_args = substep_aux.get('args')
-                    step_results, agent_name, method_name = self._execute_step(substep, config_args)
+                    step_results, agent_name, method_name = self._execute_step(ctx, substep, config_args)
                 elif substep['agent'] != 'data_annotate_agent':
                     # 非 data_annotate_agent 时正常执行
                     config_args = substep_aux.get('args')
-                    step_results, agent_name, method_name = self._execute_step(substep, config_args)
+                    step_results, agent_name, method_name = self._execute_step(ctx, substep, config_args)
                 else:
                     # data_annotate_agent 的后续迭代使用 debug 方法
                     step_results, agent_name, method_name = self._execute_debug_step(
+                        ctx,
                         substep,
-                        self.data_store.get('verification_result', [])
+                        ctx.data_store.get('verification_result', [])
                     )
                 
                 result_key = f"{agent_name}_{method_name}"
                 loop_results[result_key] = step_results
-                self.data_store[substep['output']] = step_results
+                ctx.data_store[substep['output']] = step_results
             
             # 检查循环条件
-            verifier_result = self.data_store.get('verification_result', [])
+            verifier_result = ctx.data_store.get('verification_result', [])
             result_data = verifier_result.get('result')
             if isinstance(result_data, str):
                 result_data = ast.literal_eval(result_data)
@@ -446,7 +584,7 @@ LOG OUTPUT:
 
             # TODO: NOT APPLICABLE TO ALL AGENT WORKFLOWS
             if not loop_condition:
-                self._save_correct_code("easy_medium_da-dev-q-code-a.jsonl")
+                self._save_correct_code(ctx, "easy_medium_da-dev-q-code-a.jsonl")
             # TODO: NOT APPLICABLE TO ALL AGENT WORKFLOWS
 
             print(f"Iteration {iteration + 1}: {'Errors found' if loop_condition else 'No errors found'}")
@@ -457,9 +595,9 @@ LOG OUTPUT:
         
         return loop_results
 
-    def _execute_debug_step(self, step, verification_result):
+    def _execute_debug_step(self, ctx, step, verification_result):
         """执行 debug 步骤"""
-        agent = self.agents[step['agent']]
+        agent = ctx.agents[step['agent']]
         debug_method = getattr(agent, step['debug_method'])
         agent_args = step.get('args', {})
 
@@ -472,7 +610,7 @@ LOG OUTPUT:
         error_info = self._extract_error_info(verification_result)
         
         # 获取之前生成的代码
-        previous_result = self.data_store.get('data_analysis_result')
+        previous_result = ctx.data_store.get('data_analysis_result')
 
         if isinstance(previous_result, tuple):
             previous_code = previous_result[1]
@@ -492,8 +630,8 @@ LOG OUTPUT:
         method_output = debug_method(**debug_args)
 
         results = self._handle_method_output(
-            method_output, output_type, agent_name,
-            self.current_workspace, agent_args
+            ctx, method_output, output_type, agent_name,
+            ctx.workspace, agent_args
         )
 
         self.log_action(
@@ -502,7 +640,7 @@ LOG OUTPUT:
             step['args']['model_type'].replace('deepseek-ai/', ''),
             str(results['result']),
             results['log'],
-            self.current_workspace
+            ctx.workspace
         )
         
         return results, step['agent'], step['debug_method']
@@ -537,10 +675,10 @@ LOG OUTPUT:
             for err in error_info
         ])
 
-    def _save_correct_code(self, file_name):
+    def _save_correct_code(self, ctx, file_name):
         """保存正确的代码到jsonl文件"""
         # 获取当前的分析代码
-        analysis_result = self.data_store.get('data_analysis_result')
+        analysis_result = ctx.data_store.get('data_analysis_result')
         if isinstance(analysis_result, tuple):
             correct_code = analysis_result[1]
         elif isinstance(analysis_result, dict):
@@ -550,7 +688,7 @@ LOG OUTPUT:
             return
 
         # 更新当前instruction的内容
-        instruction_with_code = self.current_instruction.copy()
+        instruction_with_code = ctx.instruction.copy()
         instruction_with_code['correct_analysis_code'] = correct_code
 
         # 创建输出目录（如果不存在）
@@ -559,6 +697,6 @@ LOG OUTPUT:
         output_file = os.path.join(output_dir, file_name)
 
         # 追加写入jsonl文件
-        with open(output_file, 'a', encoding='utf-8') as f:
+        with self.output_lock, open(output_file, 'a', encoding='utf-8') as f:
             json.dump(instruction_with_code, f, ensure_ascii=False)
             f.write('\n')
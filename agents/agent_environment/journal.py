@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import threading
+
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def _check_json_native(value, where):
+    """Raise TypeError unless `value` is made of JSON types only, so a restored step gets back exactly
+    what it produced (tuples would come back as lists, int keys as strings, objects as their repr)."""
+    if isinstance(value, _JSON_SCALARS):
+        return
+    if isinstance(value, list):
+        for index, item in enumerate(value):
+            _check_json_native(item, f'{where}[{index}]')
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError(f"Cannot journal {where}: key {key!r} is not a string.")
+            _check_json_native(item, f'{where}[{key!r}]')
+    else:
+        raise TypeError(f"Cannot journal {where}: {type(value).__name__} is not a JSON type.")
+
+
+class WorkflowJournal:
+    """Append-only JSONL record of finished workflow steps, used to resume an interrupted run.
+
+    Every line is one step of one instruction, written and fsync'ed as soon as the step
+    finishes. Lines carry a fingerprint of the workflow definition, so a journal left behind
+    by a different workflow is ignored rather than replayed.
+    """
+
+    def __init__(self, path, workflow):
+        self.path = path
+        payload = json.dumps(workflow, sort_keys=True, default=str)
+        self.fingerprint = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+        self.lock = threading.Lock()
+        self.steps = {}
+        self.statuses = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write can leave a torn last line; that step simply reruns.
+                    continue
+                if record.get('workflow') != self.fingerprint:
+                    continue
+                instruction_id = str(record['instruction_id'])
+                if 'status' in record:
+                    self.statuses[instruction_id] = record['status']
+                else:
+                    self.steps.setdefault(instruction_id, {})[record['step']] = record
+
+    def finished_steps(self, instruction_id):
+        return self.steps.get(str(instruction_id), {})
+
+    def status(self, instruction_id):
+        return self.statuses.get(str(instruction_id))
+
+    def record_step(self, instruction_id, step, results, data_store):
+        """Raises TypeError if the step's results or outputs are not plain JSON values."""
+        _check_json_native(results, f'step {step} of instruction {instruction_id}: results')
+        _check_json_native(data_store, f'step {step} of instruction {instruction_id}: data_store')
+        self._append({
+            'workflow': self.fingerprint,
+            'instruction_id': instruction_id,
+            'step': step,
+            'results': results,
+            'data_store': data_store,
+        })
+
+    def record_status(self, instruction_id, status):
+        self._append({'workflow': self.fingerprint, 'instruction_id': instruction_id, 'status': status})
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            # One O_APPEND write per record keeps lines whole even with several worker processes.
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
@@ -0,0 +1,139 @@
+"""Keeps the chat history of multi-turn repair loops within a flat, per-model token budget.
+
+PlotAgent and DataAnalysisAgent append every prompt, reply and error prompt to one history that
+lives across instructions, and resend all of it. `compact_history` builds what is actually sent:
+the current task (the latest system prompt and the user message after it), the latest exchange(s)
+in full (latest code and its error), and one line per older failed attempt on that task folded
+into the last user message; exchanges that belong to earlier tasks are left out. If that is still
+over the model's budget, the longest messages are cut in the middle. The agents keep their full
+`chat_history` for logging.
+"""
+import re
+from functools import lru_cache
+
+from agents.config.openai import chat_history_keep_turns, chat_token_budgets, chat_default_token_budget
+from agents.rate_limiter import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # Optional: without it tokens are estimated at 4 characters each.
+    tiktoken = None
+
+# Per-message framing tokens added by chat templates (role markers, separators).
+_MESSAGE_OVERHEAD = 4
+_NOTE_CHARS = 200
+_MIN_KEEP_CHARS = 1000
+_ERROR_LINE = re.compile(r'^\s*((?:[A-Za-z_][\w.]*)?(?:Error|Exception|Warning)\b.*|No plot generated\..*)$', re.MULTILINE)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model_type):
+    try:
+        return tiktoken.encoding_for_model(model_type.split('/')[-1])
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens(messages, model_type=None):
+    """Prompt tokens of `messages`: tiktoken when installed, else the rate limiter's estimate."""
+    if tiktoken is None:
+        return estimate_tokens(messages) + _MESSAGE_OVERHEAD * len(messages)
+    encoding = _encoding(model_type or '')
+    total = 0
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, list):
+            total += estimate_tokens([message])  # Multimodal parts: images are charged a flat amount.
+        elif content:
+            total += len(encoding.encode(content, disallowed_special=()))
+        total += _MESSAGE_OVERHEAD
+    return total
+
+
+def token_budget(model_type):
+    return chat_token_budgets.get(model_type, chat_default_token_budget)
+
+
+def _error_note(content):
+    if not isinstance(content, str):
+        return None
+    matches = _ERROR_LINE.findall(content)
+    note = matches[-1] if matches else ' '.join(content.split())
+    note = note.strip()
+    return note[:_NOTE_CHARS] + ('...' if len(note) > _NOTE_CHARS else '')
+
+
+def _cut_middle(text, keep_chars):
+    head = keep_chars // 2
+    tail = keep_chars - head
+    dropped = len(text) - keep_chars
+    return f'{text[:head]}\n... [{dropped} characters omitted to fit the context budget] ...\n{text[-tail:]}'
+
+
+def _fit(messages, model_type, budget):
+    # Shorten the longest cuttable message until the prompt fits; system prompts go last.
+    for _ in range(len(messages) * 2):
+        excess = count_tokens(messages, model_type) - budget
+        if excess <= 0:
+            break
+        candidates = [
+            (message['role'] != 'system', len(message['content']), index)
+            for index, message in enumerate(messages)
+            if isinstance(message.get('content'), str) and len(message['content']) > _MIN_KEEP_CHARS
+        ]
+        if not candidates:
+            break
+        _, length, index = max(candidates)
+        keep = max(_MIN_KEEP_CHARS, length - excess * 4 - 200)
+        messages[index] = dict(messages[index], content=_cut_middle(messages[index]['content'], keep))
+    return messages
+
+
+def _current_prompt(messages):
+    """(start, end) of the latest task prompt: its system message(s) and the user message after them."""
+    start = 0
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index]['role'] == 'system':
+            start = index
+            while start > 0 and messages[start - 1]['role'] == 'system':
+                start -= 1
+            break
+    end = start
+    while end < len(messages) and messages[end]['role'] == 'system':
+        end += 1
+    if end < len(messages) and messages[end]['role'] == 'user':
+        end += 1
+    return start, end
+
+
+def compact_history(messages, model_type=None, keep_turns=None, budget=None):
+    """The messages to send for `messages`, which is left untouched."""
+    keep_turns = chat_history_keep_turns if keep_turns is None else keep_turns
+    budget = token_budget(model_type) if budget is None else budget
+
+    compacted = list(messages)
+    if keep_turns > 0:
+        # The agents keep one history across instructions, so the task is the latest prompt, not the first.
+        head_start, head_end = _current_prompt(messages)
+        compacted = list(messages[head_start:])
+
+        # A turn starts with a model reply; the user message after it carries that reply's error.
+        starts = [i for i in range(head_end, len(messages)) if messages[i]['role'] == 'assistant']
+        if len(starts) > keep_turns:
+            tail_start = starts[-keep_turns]
+            notes = [
+                _error_note(messages[i]['content'])
+                for i in range(head_end + 1, tail_start)
+                if messages[i]['role'] == 'user' and messages[i - 1]['role'] == 'assistant'
+            ]
+            notes = [note for note in notes if note]
+            tail = list(messages[tail_start:])
+            if notes and tail[-1]['role'] == 'user' and isinstance(tail[-1]['content'], str):
+                summary = '\n'.join(f'- attempt {number}: {note}' for number, note in enumerate(notes, 1))
+                tail[-1] = dict(tail[-1], content=tail[-1]['content']
+                                + f'\n\nEarlier attempts (omitted to save context) failed with:\n{summary}')
+            compacted = list(messages[head_start:head_end]) + tail
+
+    if budget:
+        compacted = _fit(compacted, model_type, budget)
+    return compacted
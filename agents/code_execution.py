@@ -0,0 +1,438 @@
+import atexit
+import copy
+import hashlib
+import json
+import os
+import select
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from agents.config.execution import zygote_enabled, zygote_preload, zygote_start_timeout, code_exec_timeout
+from agents.config.execution import code_exec_memory_mb, code_exec_cpu_seconds, code_exec_max_output
+
+
+class ExecutionResult:
+    """Outcome of running one generated script: combined stdout/stderr plus how the run went.
+
+    `returncode` is negative when the script was killed by a signal (wall-clock timeout, cancel,
+    CPU limit). `peak_rss` is in bytes, or None where the platform does not report it.
+    `truncated` means the middle of a very long output was dropped. `exception` is the uncaught
+    exception recorded in the child ({'type', 'message', 'lineno', 'line', 'frames'}), or None.
+    """
+
+    def __init__(self, output, returncode=None, duration=0.0, cached=False, timed_out=False, peak_rss=None,
+                 truncated=False, cancelled=False, exception=None):
+        self.output = output
+        self.returncode = returncode
+        self.duration = duration
+        self.cached = cached
+        self.timed_out = timed_out
+        self.peak_rss = peak_rss
+        self.truncated = truncated
+        self.cancelled = cancelled
+        self.exception = exception
+
+    @property
+    def killed(self):
+        return self.returncode is not None and self.returncode < 0
+
+    @property
+    def success(self):
+        return self.returncode == 0
+
+    def format_exception(self):
+        """The recorded exception as traceback text, without the 'Traceback ...' header line."""
+        if not self.exception:
+            return None
+        lines = []
+        for frame in self.exception['frames']:
+            lines.append(f'  File "{frame["file"]}", line {frame["lineno"]}, in {frame["function"]}')
+            if frame['line']:
+                lines.append(f'    {frame["line"]}')
+        if not self.exception['frames'] and self.exception['lineno']:
+            # SyntaxError and friends: the script never started, so there are no frames.
+            lines.append(f'  line {self.exception["lineno"]}')
+            lines.append(f'    {self.exception["line"]}')
+        lines.append(f'{self.exception["type"]}: {self.exception["message"]}')
+        return '\n' + '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """JSON-friendly status, stored next to execution outputs in the agents' JSONL files."""
+        return {
+            'returncode': self.returncode,
+            'duration': round(self.duration, 3),
+            'timed_out': self.timed_out,
+            'peak_rss': self.peak_rss,
+            'truncated': self.truncated,
+            'exception': self.exception,
+        }
+
+    def __str__(self):
+        return self.output
+
+
+_ZYGOTE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zygote.py')
+
+
+def _kill_group(pid):
+    # Scripts run in their own session, so this also takes down anything they spawned.
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # The child may not have called setsid() yet; it has not spawned anything either.
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def _watch(kill, done, timeout=None, cancel=None, state=None):
+    deadline = time.monotonic() + timeout if timeout else None
+    while not done.wait(0.05):
+        if cancel is not None and cancel.is_set():
+            state['cancelled'] = True
+            kill()
+            return
+        if deadline is not None and time.monotonic() > deadline:
+            state['timed_out'] = True
+            kill()
+            return
+
+
+def _start_watcher(kill, timeout, cancel, state):
+    if not timeout and cancel is None:
+        return None
+    done = threading.Event()
+    threading.Thread(target=_watch, args=(kill, done, timeout, cancel, state), daemon=True).start()
+    return done
+
+
+class Zygote:
+    """Client for the fork server in agents/zygote.py. Starts it on first use and again if it dies."""
+
+    def __init__(self, preload):
+        self.preload = preload
+        self.process = None
+        self.directory = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def supported():
+        return hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX') and sys.platform != 'win32'
+
+    @property
+    def socket_path(self):
+        return os.path.join(self.directory, 'zygote.sock')
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            self.directory = tempfile.mkdtemp(prefix='zygote-')
+            self.process = subprocess.Popen(
+                [sys.executable, _ZYGOTE_SCRIPT, self.socket_path, self.preload],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                env={**os.environ, 'MPLBACKEND': 'Agg'},
+            )
+            readable, _, _ = select.select([self.process.stdout], [], [], zygote_start_timeout)
+            if not readable or self.process.stdout.readline().strip() != b'ready':
+                self.close()
+                raise RuntimeError('zygote failed to start')
+
+    def run(self, request, cancel=None):
+        """Returns (returncode, peak_rss, state); the zygote enforces the timeout itself.
+
+        Raises only while the script has not started yet, so the caller may fall back to another
+        interpreter. Once it has started, losing the zygote stops the script and reports it as
+        killed (state['lost']) instead: running it again would repeat its side effects.
+        """
+        self._ensure_started()
+        state = {'timed_out': False, 'cancelled': False, 'lost': False}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(self.socket_path)
+            conn.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            with conn.makefile('rb') as replies:
+                started = replies.readline()
+                if not started:
+                    raise ConnectionError('zygote closed the connection before starting the script')
+                pid = json.loads(started)['pid']
+                done = _start_watcher(lambda: _kill_group(pid), None, cancel, state)
+                try:
+                    reply = replies.readline()
+                except OSError:
+                    reply = b''
+                finally:
+                    if done is not None:
+                        done.set()
+        try:
+            reply = json.loads(reply)
+        except ValueError:
+            reply = None
+        if not isinstance(reply, dict):
+            _kill_group(pid)
+            state['lost'] = True
+            return -signal.SIGKILL, None, state
+        state['timed_out'] = reply['timed_out']
+        return reply['returncode'], reply['peak_rss'], state
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+_ZYGOTE = Zygote(zygote_preload)
+atexit.register(_ZYGOTE.close)
+
+
+def _peak_rss(rusage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+
+
+def _run_subprocess(request, cancel=None):
+    """Fresh-interpreter fallback; the child runs the zygote's script runner, so limits, capture
+    and exception records are identical."""
+    posix = os.name == 'posix'
+    process = subprocess.Popen(
+        [sys.executable, _ZYGOTE_SCRIPT, '--run', json.dumps(request)],
+        stdin=subprocess.DEVNULL,
+        start_new_session=posix,
+    )
+    state = {'timed_out': False, 'cancelled': False, 'lost': False}
+    kill = (lambda: _kill_group(process.pid)) if posix else process.kill
+    done = _start_watcher(kill, request['timeout'], cancel, state)
+    try:
+        if posix:
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak_rss = _peak_rss(rusage)
+        else:
+            process.wait()
+            peak_rss = None
+    finally:
+        if done is not None:
+            done.set()
+    return process.returncode, peak_rss, state
+
+
+def _read_bounded(path, limit):
+    """Return (text, truncated): the whole file, or only its first and last limit/2 bytes."""
+    if not os.path.exists(path):
+        return '', False
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if not limit or size <= limit:
+            return f.read().decode('utf-8', 'replace'), False
+        half = limit // 2
+        head = f.read(half)
+        f.seek(size - half)
+        tail = f.read()
+    marker = f'\n... [{size - 2 * half} bytes of output truncated] ...\n'.encode('utf-8')
+    return (head + marker + tail).decode('utf-8', 'replace'), True
+
+
+def _read_exception(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        return None  # Killed while writing it.
+
+
+def run_python(script, cwd, merge_stderr=False, timeout=None, env=None, memory_mb=None, cpu_seconds=None,
+               max_output=None, cancel=None):
+    """Run `python script` in `cwd` inside the sandbox and return an ExecutionResult.
+
+    The caller's working directory is never changed, so this is safe to call from many threads.
+    `env` holds variables set on top of the current environment. `timeout` (wall-clock seconds),
+    `memory_mb` (RLIMIT_AS) and `cpu_seconds` (RLIMIT_CPU) default to the CODE_EXEC_* settings, where
+    0 means unlimited. Setting the optional `cancel` event kills the script early. stdout and
+    stderr are concatenated, or interleaved as with `2>&1` when merge_stderr is set, and keep at
+    most `max_output` bytes each (head and tail). Uses the warm zygote where fork() exists,
+    else a fresh interpreter.
+    """
+    if timeout is None:
+        timeout = code_exec_timeout
+    memory_mb = code_exec_memory_mb if memory_mb is None else memory_mb
+    cpu_seconds = code_exec_cpu_seconds if cpu_seconds is None else cpu_seconds
+    max_output = code_exec_max_output if max_output is None else max_output
+
+    capture = tempfile.mkdtemp(prefix='exec-')
+    request = {
+        'script': script,
+        'cwd': os.path.abspath(cwd),
+        'stdout': os.path.join(capture, 'stdout'),
+        'stderr': os.path.join(capture, 'stderr'),
+        'exception': os.path.join(capture, 'exception.json'),
+        'merge_stderr': merge_stderr,
+        'timeout': timeout or None,
+        'env': env or {},
+        'limits': {'memory': int(memory_mb * 1024 * 1024), 'cpu': int(cpu_seconds)},
+    }
+    start = time.monotonic()
+    try:
+        outcome = None
+        if zygote_enabled and Zygote.supported():
+            try:
+                outcome = _ZYGOTE.run(request, cancel)
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"Zygote execution failed ({e}); falling back to a fresh interpreter.")
+        if outcome is None:
+            outcome = _run_subprocess(request, cancel)
+        returncode, peak_rss, state = outcome
+        duration = time.monotonic() - start
+
+        output, truncated = _read_bounded(request['stdout'], max_output)
+        if not merge_stderr:
+            errors, errors_truncated = _read_bounded(request['stderr'], max_output)
+            output += errors
+            truncated = truncated or errors_truncated
+        if state['lost']:
+            output += '\nThe script was stopped: the execution server died before reporting its result.\n'
+        exception = _read_exception(request['exception'])
+    finally:
+        shutil.rmtree(capture, ignore_errors=True)
+
+    return ExecutionResult(output, returncode, duration, timed_out=state['timed_out'], peak_rss=peak_rss,
+                           truncated=truncated, cancelled=state['cancelled'], exception=exception)
+
+
+def _content_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _workspace_files(workspace, script):
+    # Only the top level is fingerprinted: data files sit next to the script, while agents keep
+    # writing their logs into per-model subdirectories. The script itself is covered by its
+    # content hash, since handlers rewrite it (new mtime) even when the code is unchanged.
+    files = {}
+    for entry in os.scandir(workspace):
+        if entry.is_file() and entry.name != script:
+            stat = entry.stat()
+            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _output_state(workspace, files, outputs):
+    # Stat plus content hash of what the run wrote; a hit needs the same artifacts still on disk.
+    return {name: (files[name], _content_hash(os.path.join(workspace, name))) for name in outputs}
+
+
+def _outputs_unchanged(workspace, files, outputs):
+    for name, (stat, digest) in outputs.items():
+        if name not in files:
+            return False
+        if files[name] == stat:
+            continue
+        try:
+            if _content_hash(os.path.join(workspace, name)) != digest:
+                return False  # Overwritten since, e.g. by another script writing the same plot.
+        except OSError:
+            return False
+    return True
+
+
+def _input_signature(files, outputs):
+    signature = hashlib.sha256()
+    for name in sorted(files):
+        if name not in outputs:
+            signature.update(f'{name}:{files[name]}\n'.encode('utf-8'))
+    return signature.hexdigest()
+
+
+class _Entry:
+    def __init__(self, result, signature, outputs):
+        self.result = result
+        self.signature = signature
+        self.outputs = outputs
+
+
+class ExecutionCache:
+    """Results of recent script runs, keyed by (workspace, script name, script content hash).
+
+    A hit also requires the workspace inputs to be unchanged, where the files the cached run
+    itself wrote (plots, result CSVs) are left out of the comparison, and those outputs
+    must still be on disk with the content the run left (same stat, or else same hash).
+    Otherwise the script runs again.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, files):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if _input_signature(files, entry.outputs) != entry.signature:
+                return None
+            if not _outputs_unchanged(key[0], files, entry.outputs):
+                return None
+            self._entries.move_to_end(key)
+            return entry.result
+
+    def put(self, key, result, files_before, files_after):
+        changed = {name for name, stat in files_after.items() if files_before.get(name) != stat}
+        try:
+            outputs = _output_state(key[0], files_after, changed)
+        except OSError:
+            return  # An output vanished already; nothing reliable to cache.
+        entry = _Entry(result, _input_signature(files_before, changed), outputs)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_CACHE = ExecutionCache()
+
+
+def execute_script(file_name, workspace, use_cache=False, env=None, timeout=None):
+    """Run `file_name` inside `workspace`.
+
+    With `use_cache`, the previous result is reused when the script and the top-level workspace
+    files are unchanged. Only turn it on for scripts known to be deterministic: the cache cannot
+    see randomness, the clock, or files outside the workspace's top level (subdirectories,
+    imported modules there).
+    """
+    path = os.path.join(workspace, file_name)
+    if not os.path.exists(path):
+        return ExecutionResult(f"Error: File {file_name} not found in workspace.")
+
+    key = (os.path.abspath(workspace), file_name, _content_hash(path), tuple(sorted((env or {}).items())))
+    files_before = _workspace_files(workspace, os.path.basename(file_name))
+    if use_cache:
+        cached = _CACHE.get(key, files_before)
+        if cached is not None:
+            hit = copy.copy(cached)
+            hit.cached = True
+            return hit
+
+    try:
+        result = run_python(file_name, workspace, timeout=timeout, env=env)
+    except Exception as e:
+        return ExecutionResult(f"Error executing {file_name}: {str(e)}")
+    if result.killed:
+        # Timeouts, cancels and CPU-limit kills depend on load; a rerun may well finish.
+        return result
+    _CACHE.put(key, result, files_before, _workspace_files(workspace, os.path.basename(file_name)))
+    return result
@@ -0,0 +1,203 @@
+"""In-process checks on generated code, run before a script is handed to the sandbox.
+
+Each check catches a mistake that would otherwise cost a whole execution to discover: the code
+does not parse, reads a name that is defined nowhere, imports a module that is not installed, or
+has no way of saving the image it is supposed to produce. `check_code` returns the first problem as
+the error text the repair prompts expect (the part of a traceback after its header line), or
+None when the code looks runnable. The checks are conservative: anything they cannot decide
+statically is left to the real run.
+"""
+import ast
+import builtins
+import importlib.util
+import os
+import symtable
+from functools import lru_cache
+
+from agents.config.execution import code_preflight_enabled
+
+# Names every module namespace has without defining them.
+_MODULE_NAMES = {'__name__', '__file__', '__doc__', '__spec__', '__loader__', '__package__',
+                 '__builtins__', '__cached__', '__annotations__', '__path__'}
+
+_IMPORT_ERRORS = {'ImportError', 'ModuleNotFoundError', 'Exception', 'BaseException'}
+
+
+def _format_error(file_name, lineno, line, message):
+    # Same shape as ExecutionResult.format_exception(): a single frame, then `Type: message`.
+    location = f'  File "{file_name}", line {lineno}' if lineno else f'  File "{file_name}"'
+    lines = [location]
+    if line:
+        lines.append(f'    {line.strip()}')
+    lines.append(message)
+    return '\n' + '\n'.join(lines) + '\n'
+
+
+def _source_line(code, lineno):
+    lines = code.splitlines()
+    if lineno and 0 < lineno <= len(lines):
+        return lines[lineno - 1]
+    return None
+
+
+def _check_syntax(code, file_name):
+    try:
+        tree = ast.parse(code, filename=file_name)
+    except SyntaxError as e:
+        message = f'{type(e).__name__}: {e.msg}'
+        return None, _format_error(file_name, e.lineno, e.text or _source_line(code, e.lineno), message)
+    except ValueError as e:  # e.g. source code containing null bytes
+        return None, _format_error(file_name, None, None, f'SyntaxError: {e}')
+    return tree, None
+
+
+def _global_reads(table, module_names):
+    """Names read in `table` (or any nested scope) that resolve to module globals."""
+    names = set()
+    for symbol in table.get_symbols():
+        if not symbol.is_referenced():
+            continue
+        if table.get_type() == 'module':
+            if not symbol.is_assigned() and not symbol.is_imported():
+                names.add(symbol.get_name())
+        elif symbol.is_global() and symbol.get_name() not in module_names:
+            names.add(symbol.get_name())
+    for child in table.get_children():
+        names |= _global_reads(child, module_names)
+    return names
+
+
+def _declared_globals(table):
+    """Names assigned in nested scopes under a `global` statement."""
+    names = set()
+    for child in table.get_children():
+        for symbol in child.get_symbols():
+            if symbol.is_declared_global() and symbol.is_assigned():
+                names.add(symbol.get_name())
+        names |= _declared_globals(child)
+    return names
+
+
+def _check_names(code, tree, file_name):
+    # `from x import *` and explicit namespace tricks make the set of globals unknowable.
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == '*' for alias in node.names):
+            return None
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ('globals', 'exec', 'eval', 'vars'):
+            return None
+
+    try:
+        table = symtable.symtable(code, file_name, 'exec')
+    except SyntaxError:
+        return None  # Errors only the compiler reports (e.g. misplaced nonlocal); the real run will show them.
+
+    module_names = {
+        symbol.get_name() for symbol in table.get_symbols()
+        if symbol.is_assigned() or symbol.is_imported()
+    } | _declared_globals(table)
+    defined = module_names | _MODULE_NAMES | set(dir(builtins))
+    unresolved = _global_reads(table, module_names) - defined
+    if not unresolved:
+        return None
+
+    # Report the first read in source order, as Python would stop there.
+    for node in sorted((n for n in ast.walk(tree) if isinstance(n, ast.Name)), key=lambda n: (n.lineno, n.col_offset)):
+        if node.id in unresolved and isinstance(node.ctx, ast.Load):
+            return _format_error(file_name, node.lineno, _source_line(code, node.lineno),
+                                 f"NameError: name '{node.id}' is not defined")
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _module_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _guarded_imports(tree):
+    # Imports inside `try: ... except ImportError:` are allowed to fail.
+    guarded = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Try):
+            continue
+        catches = False
+        for handler in node.handlers:
+            if handler.type is None:
+                catches = True
+            else:
+                types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+                catches = catches or any(isinstance(t, ast.Name) and t.id in _IMPORT_ERRORS for t in types)
+        if catches:
+            for statement in node.body:
+                guarded.update(id(n) for n in ast.walk(statement))
+    return guarded
+
+
+def _check_imports(code, tree, file_name, workspace):
+    guarded = _guarded_imports(tree)
+    for node in ast.walk(tree):
+        if id(node) in guarded:
+            continue
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            top = module.split('.')[0]
+            # The script runs with its own directory first on sys.path.
+            if workspace and (os.path.exists(os.path.join(workspace, top + '.py'))
+                              or os.path.isdir(os.path.join(workspace, top))):
+                continue
+            if not _module_available(top):
+                return _format_error(file_name, node.lineno, _source_line(code, node.lineno),
+                                     f"ModuleNotFoundError: No module named '{top}'")
+    return None
+
+
+# Calls that can write an image: savefig, imsave, save, save_fig, imwrite, write_image, ...
+_SAVE_CALL_NAMES = {'imwrite', 'write_image'}
+
+
+def _call_name(node):
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    return None
+
+
+def _check_target_file(tree, target_file):
+    # Paths are often built at runtime (`name + '.png'`, f-strings, os.path.join), so a missing
+    # literal proves nothing; only a script that names the file nowhere and saves nothing is reported.
+    target = os.path.basename(target_file)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and target in node.value:
+            return None
+        if isinstance(node, ast.Call):
+            name = _call_name(node) or ''
+            if 'save' in name.lower() or name in _SAVE_CALL_NAMES:
+                return None
+    return (f'No plot generated. When you complete a plot, remember to save it to a png file. '
+            f'The file name should be """{target_file}""".')
+
+
+def check_code(code, workspace=None, target_file=None, file_name='<generated>'):
+    """Return the first static problem found in `code` as repair-prompt error text, or None.
+
+    `workspace` is the directory the script will run in (its local modules count as importable);
+    `target_file`, when given, is the image the script must save.
+    """
+    if not code_preflight_enabled:
+        return None
+    tree, error = _check_syntax(code, file_name)
+    if error is not None:
+        return error
+    return (
+        _check_imports(code, tree, file_name, workspace)
+        or _check_names(code, tree, file_name)
+        or (_check_target_file(tree, target_file) if target_file else None)
+    )
@@ -0,0 +1,31 @@
+import os
+
+# Sandbox limits for one generated script (agents/code_execution.py); 0 disables a limit.
+# Wall-clock timeout and RLIMIT_CPU are in seconds, RLIMIT_AS in MiB. Captured stdout and stderr
+# keep at most CODE_EXEC_MAX_OUTPUT bytes each, split between the head and the tail.
+# By default a script is killed after 600 s of wall-clock or CPU time (scripts used to run
+# unbounded). RLIMIT_AS stays off by default: it caps virtual address space, not resident memory,
+# and numpy/pandas/BLAS reserve far more of it than they touch, so a cap raises MemoryError in
+# ordinary workloads.
+code_exec_timeout = float(os.getenv("CODE_EXEC_TIMEOUT", "600"))
+code_exec_cpu_seconds = int(os.getenv("CODE_EXEC_CPU_SECONDS", "600"))
+code_exec_memory_mb = int(os.getenv("CODE_EXEC_MEMORY_MB", "0"))
+code_exec_max_output = int(os.getenv("CODE_EXEC_MAX_OUTPUT", str(64 * 1024)))
+
+# Generated scripts run through a pre-forked interpreter (agents/zygote.py) that has already
+# imported ZYGOTE_PRELOAD. Set CODE_EXEC_ZYGOTE=0 to start a fresh interpreter per script instead;
+# platforms without fork() always do.
+zygote_enabled = os.getenv("CODE_EXEC_ZYGOTE", "1") != "0"
+zygote_preload = os.getenv("ZYGOTE_PRELOAD", "numpy,pandas,matplotlib,matplotlib.pyplot,seaborn,scipy,sklearn")
+zygote_start_timeout = float(os.getenv("ZYGOTE_START_TIMEOUT", "120"))
+
+# Static checks (syntax, undefined names, missing modules, unsaved target image) on generated code
+# before it is executed; see agents/code_preflight.py. CODE_PREFLIGHT=0 sends every script straight
+# to the sandbox.
+code_preflight_enabled = os.getenv("CODE_PREFLIGHT", "1") != "0"
+
+# PLOT_CANDIDATES > 1 makes PlotAgent generate that many answers concurrently for its first attempt
+# (one at temperature 0, the rest at PLOT_CANDIDATE_TEMPERATURE), run each in its own sandbox
+# directory, keep the first that saves the plot and cancel the others.
+plot_candidates = int(os.getenv("PLOT_CANDIDATES", "1"))
+plot_candidate_temperature = float(os.getenv("PLOT_CANDIDATE_TEMPERATURE", "0.8"))
@@ -1,7 +1,66 @@
+import json
 import os
 
 global_temperature = 0
 
+# Shared HTTP connection pool used by every client in agents/openai_chatComplete.py.
+http_pool_size = int(os.getenv("LLM_HTTP_POOL_SIZE", "100"))
+http_keepalive_expiry = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+http2_enabled = os.getenv("LLM_HTTP2", "1") != "0"
+
+# Maximum number of in-flight async completions per provider. Local vLLM servers are
+# limited per port, so two local models never starve each other.
+provider_concurrency = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "32")),
+    "openrouter": int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "32")),
+    "local": int(os.getenv("LOCAL_MAX_CONCURRENCY", "16")),
+}
+
+# On-disk completion cache (agents/llm_cache.py). Set LLM_CACHE=0 to bypass it globally;
+# LLM_CACHE_TTL is in seconds (0 never expires) and LLM_CACHE_MAX_BYTES=0 disables eviction.
+llm_cache_enabled = os.getenv("LLM_CACHE", "1") != "0"
+llm_cache_path = os.getenv("LLM_CACHE_PATH", os.path.join(".llm_cache", "completions.sqlite"))
+llm_cache_ttl = float(os.getenv("LLM_CACHE_TTL", "0"))
+llm_cache_max_bytes = int(os.getenv("LLM_CACHE_MAX_BYTES", str(1024 ** 3)))
+llm_cache_nondeterministic = os.getenv("LLM_CACHE_NONDETERMINISTIC", "0") == "1"
+
+# Coalesce concurrent identical temperature-0 requests into one upstream call.
+llm_single_flight = os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+
+# Shared rate limiter (agents/rate_limiter.py). LLM_RATE_LIMITS holds per-model budgets, e.g.
+# '{"gpt-4o": {"rpm": 500, "tpm": 300000, "concurrency": 16}}'; 0 means unlimited.
+llm_rate_limits = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+llm_default_rpm = int(os.getenv("LLM_DEFAULT_RPM", "0"))
+llm_default_tpm = int(os.getenv("LLM_DEFAULT_TPM", "0"))
+llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", "6"))
+llm_backoff_base = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+llm_backoff_max = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+
+# Replica routing for local models with several vLLM endpoints (agents/local_endpoints.py).
+# A replica whose latency EWMA exceeds LOCAL_SLOW_FACTOR x the median of its peers is ejected
+# for LOCAL_EJECTION_SECONDS; health probes hit /v1/models every LOCAL_HEALTH_INTERVAL seconds.
+local_health_interval = float(os.getenv("LOCAL_HEALTH_INTERVAL", "10"))
+local_probe_timeout = float(os.getenv("LOCAL_PROBE_TIMEOUT", "2"))
+local_slow_factor = float(os.getenv("LOCAL_SLOW_FACTOR", "3"))
+local_ejection_seconds = float(os.getenv("LOCAL_EJECTION_SECONDS", "30"))
+local_min_samples = int(os.getenv("LOCAL_MIN_SAMPLES", "5"))
+
+# LLM_ENGINE=offline runs local models in-process through vLLM's LLM class (agents/offline_engine.py)
+# instead of over HTTP; a MODEL_CONFIG entry can also set "engine": "offline" by itself.
+# LLM_OFFLINE_ENGINE_ARGS is passed to vllm.LLM, e.g. '{"device": "cpu"}' or '{"tensor_parallel_size": 2}'.
+llm_engine_mode = os.getenv("LLM_ENGINE", "server")
+llm_offline_max_batch = int(os.getenv("LLM_OFFLINE_MAX_BATCH", "256"))
+llm_offline_batch_wait = float(os.getenv("LLM_OFFLINE_BATCH_WAIT", "0.05"))
+llm_offline_engine_args = json.loads(os.getenv("LLM_OFFLINE_ENGINE_ARGS", "{}"))
+
+
+# Chat-history compaction for multi-turn repair loops (agents/chat_context.py). Only the last
+# CHAT_HISTORY_KEEP_TURNS assistant/user exchanges are resent in full, older ones are reduced to
+# their error line; 0 resends everything. CHAT_TOKEN_BUDGETS caps the prompt per model, e.g.
+# '{"gpt-4o": 100000}', with CHAT_DEFAULT_TOKEN_BUDGET for the rest (0 means no cap).
+chat_history_keep_turns = int(os.getenv("CHAT_HISTORY_KEEP_TURNS", "1"))
+chat_token_budgets = json.loads(os.getenv("CHAT_TOKEN_BUDGETS", "{}"))
+chat_default_token_budget = int(os.getenv("CHAT_DEFAULT_TOKEN_BUDGET", "0"))
 
 def _is_openai_model(model_name):
     normalized = (model_name or "").lower()
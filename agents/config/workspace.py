@@ -0,0 +1,7 @@
+import os
+
+# Budget for the workspace tree rendered into prompts (agents/workspace_tree.py); 0 means unlimited.
+# Directories deeper than WORKSPACE_TREE_MAX_DEPTH are shown collapsed, and rendering stops after
+# WORKSPACE_TREE_MAX_LINES lines.
+workspace_tree_max_depth = int(os.getenv("WORKSPACE_TREE_MAX_DEPTH", "0"))
+workspace_tree_max_lines = int(os.getenv("WORKSPACE_TREE_MAX_LINES", "0"))
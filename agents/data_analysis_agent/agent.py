@@ -5,7 +5,9 @@ import json
 from tenacity import RetryError
 from tqdm import tqdm
 
+from agents.chat_context import compact_history
 from agents.generic_agent import GenericAgent
+from agents.json_extract import extract_json
 from agents.openai_chatComplete import completion_with_backoff
 from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
 from agents.utils import print_filesys_struture
@@ -112,7 +114,8 @@ class DataAnalysisAgent(GenericAgent):
         messages.append({"role": "user", "content": fill_in_placeholders(self.prompts['user'], information)})
 
         self.chat_history = self.chat_history + messages
-        return completion_with_backoff(self.chat_history, model_type, backend=backend)
+        # Resending every earlier prompt grows linearly; only the current prompt goes out.
+        return completion_with_backoff(compact_history(self.chat_history, model_type), model_type, backend=backend)
         # return completion_with_backoff(messages, model_type)
 
     def generate_rubber_duck(self, user_prompt, model_type, code, backend='THU'):
@@ -402,17 +405,8 @@ If the query requires data manipulation from a csv file, process the data from t
 
                 result = self.generate_rubber_duck(prompt_dabench, model_type=model_type, code=modified_code, backend='THU')
 
-                # Locate the first curly brace to the last one for extracting the JSON object
-                start_index = result.rfind('{')
-                end_index = result.rfind('}')
-
-                if start_index == -1 or end_index == -1:
-                    raise ValueError("No valid JSON found in the LLM response.")
-
                 # Extract and parse JSON
-                json_str = result[start_index:end_index + 1]
-                # cleaned_json_str = clean_json_string(json_str)
-                rubber_duck_debug_info = json.loads(json_str)
+                rubber_duck_debug_info = extract_json(result, kind=dict, required=('cause_line',))
 
                 debug_info_without_cause = {key: value for key, value in rubber_duck_debug_info.items() if key not in ['cause_line']}
                 debug_info_without_effect = {key: value for key, value in rubber_duck_debug_info.items() if key not in ['effect_line']}
@@ -460,17 +454,8 @@ If the query requires data manipulation from a csv file, process the data from t
 
                 result = self.generate_rubber_duck(prompt_dabench, model_type=model_type, code=refined_code, backend='THU')
 
-                # Locate the first curly brace to the last one for extracting the JSON object
-                start_index = result.rfind('{')
-                end_index = result.rfind('}')
-
-                if start_index == -1 or end_index == -1:
-                    raise ValueError("No valid JSON found in the LLM response.")
-
                 # Extract and parse JSON
-                json_str = result[start_index:end_index + 1]
-                # cleaned_json_str = clean_json_string(json_str)
-                rubber_duck_debug_info = json.loads(json_str)
+                rubber_duck_debug_info = extract_json(result, kind=dict, required=('cause_line',))
 
                 debug_info_without_cause = {key: value for key, value in rubber_duck_debug_info.items() if
                                             key not in ['cause_line']}
@@ -1,11 +1,11 @@
-import json
 import os
 import re
 import shutil
 
 from agents.generic_agent import GenericAgent
+from agents.json_extract import extract_json
 from agents.openai_chatComplete import completion_with_backoff
-from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
+from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code, run_code_result
 from agents.utils import print_filesys_struture
 from agents.error_inject_agent.prompt import ERROR_TYPE_PROMPT
 from agents.utils import change_directory
@@ -38,21 +38,6 @@ def get_code(response):
     return all_code_blocks_combined
 
 
-def clean_json_string(json_str):
-    # Locate the injected_code value
-    start_index = json_str.find('"injected_code": "') + len('"injected_code": "')
-    end_index = json_str.find('",', start_index)
-
-    # Extract the code part and replace newlines and quotes
-    code_part = json_str[start_index:end_index]
-    cleaned_code_part = code_part.replace('\n', '\\n').replace('"', '\"')
-
-    # Replace the original code part in the json_str with the cleaned code part
-    cleaned_json_str = json_str[:start_index] + cleaned_code_part + json_str[end_index:]
-
-    return cleaned_json_str
-
-
 class ErrorInjectAgent(GenericAgent):
     def __init__(self, workspace, **kwargs):
         super().__init__(workspace, **kwargs)
@@ -117,24 +102,8 @@ class ErrorInjectAgent(GenericAgent):
             log.append("\nGenerating code...")
             result = self.generate(prompt, model_type=model_type, code=code, error_type=error_type)
 
-            # Use a more general approach to match the JSON portion in the string
-            try:
-                # Locate the first curly brace to the last one for extracting the JSON object
-                start_index = result.find('{')
-                end_index = result.rfind('}')
-
-                if start_index == -1 or end_index == -1:
-                    raise ValueError("No valid JSON found in the input string.")
-
-                # Extract the JSON substring
-                json_str = result[start_index:end_index + 1]
-                cleaned_json_str = clean_json_string(json_str)
-
-                # Convert the extracted JSON string to a Python dictionary
-                result_dict = json.loads(cleaned_json_str)
-
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Error decoding JSON: {e}")
+            # Extract the JSON object, repairing the unescaped code string if necessary
+            result_dict = extract_json(result, kind=dict, required=('error_injected_code',))
 
             # Extract and store the expected result
             injected_code = result_dict.get('error_injected_code', '')
@@ -146,7 +115,8 @@ class ErrorInjectAgent(GenericAgent):
             file_name = f'code_action_type_{idx}_error_injected.py'
             with open(os.path.join(error_code_directory, file_name), 'w') as f:
                 f.write(injected_code)
-            error_code_result = run_code(error_code_directory, file_name)
+            execution = run_code_result(error_code_directory, file_name)
+            error_code_result = execution.output
 
             # Use the extracted variables as needed
             log.append(f"\nInjected Code:\n{injected_code}\n")
@@ -161,7 +131,8 @@ class ErrorInjectAgent(GenericAgent):
                 'error_type': error_type,
                 'error_explanation': error_explanation,
                 'expected_outcome': expected_outcome,
-                'error_code_log': error_code_result
+                'error_code_log': error_code_result,
+                'execution_status': execution.summary()
             })
 
             # log.append(f"Generated code for Query {index}:")
@@ -7,8 +7,9 @@ import pandas as pd
 from tqdm import tqdm
 
 from agents.generic_agent import GenericAgent
+from agents.json_extract import extract_json
 from agents.openai_chatComplete import completion_with_backoff
-from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
+from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code, run_code_result
 from agents.utils import print_filesys_struture
 from agents.error_inject_agent.prompt import ERROR_TYPE_PROMPT
 from agents.utils import change_directory
@@ -41,21 +42,6 @@ def get_code(response):
     return all_code_blocks_combined
 
 
-def clean_json_string(json_str):
-    # Locate the injected_code value
-    start_index = json_str.find('"error_code": "') + len('"error_code": "')
-    end_index = json_str.find('",', start_index)
-
-    # Extract the code part and replace newlines and quotes
-    code_part = json_str[start_index:end_index]
-    cleaned_code_part = code_part.replace('\n', '\\n').replace('"', '\"')
-
-    # Replace the original code part in the json_str with the cleaned code part
-    cleaned_json_str = json_str[:start_index] + cleaned_code_part + json_str[end_index:]
-
-    return cleaned_json_str
-
-
 def extract_csv_info_as_string(file_path):
     # Load the CSV file
     df = pd.read_csv(file_path)
@@ -183,19 +169,9 @@ class ErrorSuggestAgent(GenericAgent):
             raise ValueError(f"Error decoding JSON: {e}")'''
 
         try:
-            # Locate the first curly brace to the last one for extracting the JSON object
-            start_index = result.find('{')
-            end_index = result.rfind('}')
-
-            if start_index == -1 or end_index == -1:
-                raise ValueError("No valid JSON found in the input string.")
-
-            # Extract the JSON substring and clean it if necessary
-            json_str = result[start_index:end_index + 1]
-            cleaned_json_str = clean_json_string(json_str)
-
-            # Convert the extracted JSON string to a Python dictionary
-            result_dict = json.loads(cleaned_json_str)
+            # Extract the {concept: [{error_code, ...}, ...]} object, repairing unescaped code strings if
+            # necessary; an inner error object alone does not match and raises ValueError.
+            result_dict = extract_json(result, kind=dict, value_item_required=('error_code',))
 
             # Write the entire dictionary as a single line to a jsonl file
             with open(os.path.join(error_code_directory, 'logical_error_data.jsonl'), 'w') as jsonl_file:
@@ -288,19 +264,8 @@ class ErrorSuggestAgent(GenericAgent):
         result = self.generate(prompt, model_type=model_type, code=code, csv_info=csv_info, concepts=concepts)
 
         try:
-            # Locate the first curly brace to the last one for extracting the JSON object
-            start_index = result.find('{')
-            end_index = result.rfind('}')
-
-            if start_index == -1 or end_index == -1:
-                raise ValueError("No valid JSON found in the input string.")
-
-            # Extract the JSON substring and clean it if necessary
-            json_str = result[start_index:end_index + 1]
-            cleaned_json_str = clean_json_string(json_str)
-
-            # Convert the extracted JSON string to a Python dictionary
-            result_dict = json.loads(cleaned_json_str)
+            # Extract the JSON object, repairing unescaped code strings if necessary
+            result_dict = extract_json(result, kind=dict, required=('error_code',))
 
             injected_code = result_dict['error_code']
 
@@ -370,13 +335,7 @@ class ErrorSuggestAgent(GenericAgent):
 
         try:
             # Parse JSON response
-            start_index = result.find('{')
-            end_index = result.rfind('}')
-            if start_index == -1 or end_index == -1:
-                raise ValueError("No valid JSON found in the input string.")
-            
-            json_str = result[start_index:end_index + 1]
-            result_dict = json.loads(json_str)
+            result_dict = extract_json(result, kind=dict, required=('errors',))
             
             # Process each error case
             for error_case in result_dict.get('errors', []):
@@ -415,7 +374,7 @@ class ErrorSuggestAgent(GenericAgent):
         log_string = "\n".join(log)
         return log_string, result_dict
 
-    def run_snoop(self, queries, model_type, data_folder, individual_workspace):
+    def run_snoop(self, queries, model_type, data_folder, individual_workspace, timeout=None):
         log = []
         error_code_directory = os.path.join(self.workspace, 'sklearn_pandas_errors')
         individual_error_code_directory = os.path.join(individual_workspace, 'error_code_dir')
@@ -491,10 +450,12 @@ class ErrorSuggestAgent(GenericAgent):
             # Capture the execution output
             try:
                 # Run the code and capture output
-                output = run_code(individual_error_code_directory, error_file)
+                execution = run_code_result(individual_error_code_directory, error_file, timeout=timeout)
+                output = execution.output
                     
                 # Update the error case with execution results
                 error_case['execution_output'] = output
+                error_case['execution_status'] = execution.summary()
                 error_case['monitored_code'] = monitored_code
                     
                 log.append(f"\nExecuting error case {i}:")
@@ -629,13 +590,7 @@ The expected output format is given below:
         # Call LLM to identify sklearn and pandas code
         print(f"**********Running example {queries['id']}**********")
         result = self.raw_generate(identify_prompt, model_type=model_type)
-        start_index = result.find('{')
-        end_index = result.rfind('}')
-        if start_index == -1 or end_index == -1:
-            raise ValueError("No valid JSON found in the input string.")
-        
-        json_str = result[start_index:end_index + 1]
-        result_dict = json.loads(json_str)
+        result_dict = extract_json(result, kind=dict, required=('original_package_code',))
         original_code_lines = result_dict.get('original_package_code', [])
 
         # Step 2: Inject errors for each identified line
@@ -675,14 +630,8 @@ The expected output format is given below:
 """
             # Call LLM to inject error
             error_result = self.raw_generate(error_injection_prompt, model_type=model_type)
-            error_start_index = error_result.find('{')
-            error_end_index = error_result.rfind('}')
-            if error_start_index == -1 or error_end_index == -1:
-                continue
-            
             try:
-                error_json_str = error_result[error_start_index:error_end_index + 1]
-                error_dict = json.loads(error_json_str)
+                error_dict = extract_json(error_result, kind=dict, required=('modified_line',))
                 errors.append(error_dict)
                 
                 log.append(f"\nProcessing original line: {code_line}")
@@ -691,7 +640,7 @@ The expected output format is given below:
                 log.append(f"Explanation: {error_dict.get('explanation', '')}")
                 log.append("-" * 80)
                 
-            except json.JSONDecodeError as e:
+            except ValueError as e:
                 log.append(f"Error processing line {code_line}: {str(e)}")
                 continue
 
@@ -4,12 +4,16 @@ import re
 import shutil
 import traceback
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from tenacity import RetryError
 from tqdm import tqdm
 from agents.generic_agent import GenericAgent
 from agents.openai_chatComplete import completion_with_backoff
-from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
+from agents.utils import compile_prompt, fill_in_placeholders, get_error_message, is_run_code_success, run_code
+from agents.error_verifier_agent.prompt import BATCH_EVAL_PROMPT
+from agents.error_verifier_agent.rule_judge import prejudge
+from agents.json_extract import extract_json
 from agents.utils import print_filesys_struture
 from agents.utils import change_directory
 
@@ -26,19 +30,22 @@ def extract_traceback(error_str):
         return None
 
 
-def clean_json_string(json_str):
-    # Locate the injected_code value
-    start_index = json_str.find('"error_code": "') + len('"error_code": "')
-    end_index = json_str.find('",', start_index)
+def execution_error_message(error_version):
+    """Last traceback line of a recorded run, or why the sandbox killed it when there is no traceback."""
+    status = error_version.get('execution_status') or {}
+    if status.get('exception'):
+        # Recorded in the child by the sandbox; no need to scan the output.
+        return f"{status['exception']['type']}: {status['exception']['message']}"
+    error_message = extract_traceback(error_version.get('execution_output', ''))
+    if error_message is None and status.get('timed_out'):
+        return 'TimeoutError: the script exceeded the time limit and was killed.'
+    if error_message is None and (status.get('returncode') or 0) < 0:
+        return f"The script was killed by signal {-status['returncode']}."
+    return error_message
 
-    # Extract the code part and replace newlines and quotes
-    code_part = json_str[start_index:end_index]
-    cleaned_code_part = code_part.replace('\n', '\\n').replace('"', '\"')
 
-    # Replace the original code part in the json_str with the cleaned code part
-    cleaned_json_str = json_str[:start_index] + cleaned_code_part + json_str[end_index:]
-
-    return cleaned_json_str
+# Fields every judge result must carry, each a score in [0, 1].
+JUDGE_SCORE_KEYS = ('cause_line_score', 'effect_line_score', 'error_type_score', 'error_message_score')
 
 
 def get_code(response):
@@ -52,13 +59,7 @@ def _format_verification_result(result, code):
     """格式化验证结果为标准格式"""
     try:
         # 尝试从结果中提取 JSON 部分
-        start_index = result.find('{')
-        end_index = result.rfind('}')
-        if start_index == -1 or end_index == -1:
-            raise ValueError("No valid JSON found in the result")
-
-        json_str = result[start_index:end_index + 1]
-        result_dict = json.loads(json_str)
+        result_dict = extract_json(result, kind=dict, required=('is_error',))
 
         # 构建标准格式的结果
         formatted_result = {
@@ -108,15 +109,14 @@ class ErrorVerifierAgent(GenericAgent):
         self.chat_history = []
         self.query = kwargs.get('query', '')
         self.data_information = kwargs.get('data_information', None)
-
-    def _get_self_consistent_answer(self, list_of_parsed_json):
-        """
-        Performs a majority vote to find the most consistent answer.
-        Votes are cast based on the (cause_line, effect_line) tuple.
-        """
-        if not list_of_parsed_json:
-            return None
-
+        # rubber_duck_eval: how many error versions of one query are verified and judged at once.
+        self.version_workers = kwargs.get('version_workers', 1)
+        # Judge calls: >1 grades up to this many (ground truth, prediction) pairs in one request.
+        self.judge_batch_size = kwargs.get('judge_batch_size', 1)
+        # Settle clear-cut judge cases with the local rule-based matcher (rule_judge.py) instead of the LLM.
+        self.prejudge = kwargs.get('prejudge', True)
+
+    def _count_votes(self, list_of_parsed_json):
         votes = []
         for output in list_of_parsed_json:
             # 确保每个输出都是有效的字典
@@ -125,11 +125,32 @@ class ErrorVerifierAgent(GenericAgent):
                 cause = str(output['cause_line']).strip()
                 effect = str(output['effect_line']).strip()
                 votes.append((cause, effect))
+        return Counter(votes)
+
+    def _samples_needed(self, list_of_parsed_json, remaining):
+        """How many more samples could settle the vote; 0 once the leader can no longer be overturned.
 
-        if not votes:
+        The leader is safe when it has more votes than the runner-up could reach with every
+        remaining sample, so the full vote would pick the same (cause_line, effect_line).
+        """
+        counts = [count for _, count in self._count_votes(list_of_parsed_json).most_common(2)] + [0, 0]
+        leader, runner_up = counts[0], counts[1]
+        if leader > runner_up + remaining:
+            return 0
+        return min(remaining, (runner_up + remaining - leader) // 2 + 1)
+
+    def _get_self_consistent_answer(self, list_of_parsed_json):
+        """
+        Performs a majority vote to find the most consistent answer.
+        Votes are cast based on the (cause_line, effect_line) tuple.
+        """
+        if not list_of_parsed_json:
+            return None
+
+        vote_counts = self._count_votes(list_of_parsed_json)
+        if not vote_counts:
             return None
 
-        vote_counts = Counter(votes)
         most_common_answer_tuple, _ = vote_counts.most_common(1)[0]
 
         # 找到与最常见答案匹配的第一个完整JSON对象
@@ -141,7 +162,99 @@ class ErrorVerifierAgent(GenericAgent):
 
         return None  # 理论上不应该到这里，但作为保障
 
-    def generate(self, user_prompt, model_type, code, backend='OpenRouter', temperature=0.0):
+    def _judge_one(self, information, backend='OpenRouter', use_cache=True):
+        # Clear-cut cases (exact matches, plainly unrelated answers) are scored locally.
+        if self.prejudge:
+            eval_result = prejudge(information)
+            if eval_result is not None:
+                return eval_result
+
+        messages = []
+        messages.append({"role": "system", "content": ''})
+        messages.append({"role": "user", "content": fill_in_placeholders(self.prompts['eval'], information)})
+        eval_completion = completion_with_backoff(messages, 'gpt-4o', backend=backend, use_cache=use_cache)
+
+        eval_result = extract_json(eval_completion, kind=dict, required=JUDGE_SCORE_KEYS)
+        if not self._valid_judgement(eval_result):
+            raise ValueError("Judge result has scores that are not numbers in [0, 1].")
+        return eval_result
+
+    def _judge_one_with_retries(self, information, backend='OpenRouter', MAX_RETRIES=3):
+        for attempt in range(MAX_RETRIES):
+            try:
+                # A retry must not get the same cached (invalid) answer back.
+                return self._judge_one(information, backend, use_cache=attempt == 0)
+            except (ValueError, json.JSONDecodeError, KeyError, TypeError, AttributeError, RetryError) as e:
+                print(f"Error in judge attempt {attempt + 1}: {str(e)}")
+        return None
+
+    def _judge(self, information, backend='OpenRouter'):
+        """Judge one item with retries; raises ValueError when no valid judgement comes back."""
+        eval_result = self._judge_one_with_retries(information, backend)
+        if eval_result is None:
+            raise ValueError("The judge returned no valid scores.")
+        return eval_result
+
+    def _valid_judgement(self, item):
+        return isinstance(item, dict) and all(
+            isinstance(item.get(key), (int, float)) and 0 <= item[key] <= 1 for key in JUDGE_SCORE_KEYS
+        )
+
+    def _judge_batch(self, informations, backend='OpenRouter'):
+        template = compile_prompt(self.prompts['eval'])
+        slots = list(dict.fromkeys(template.slots))
+        # The instructions go out once; each slot points at the per-task data below.
+        instructions = template.render({slot: f'(the "{slot}" of each task below)' for slot in slots})
+        tasks = []
+        for number, information in enumerate(informations, 1):
+            sections = '\n'.join(f'{slot}:\n```json\n{information.get(slot)}\n```' for slot in slots)
+            tasks.append(f'#### Task {number}\n{sections}')
+
+        batch_prompt = self.prompts.get('batch_eval', BATCH_EVAL_PROMPT)
+        messages = []
+        messages.append({"role": "system", "content": ''})
+        messages.append({"role": "user", "content": fill_in_placeholders(batch_prompt, {
+            'instructions': instructions,
+            'count': len(informations),
+            'tasks': '\n\n'.join(tasks),
+        })})
+
+        judgements = [None] * len(informations)
+        try:
+            eval_completion = completion_with_backoff(messages, 'gpt-4o', backend=backend)
+            parsed = extract_json(eval_completion, kind=list)
+            for position, item in enumerate(parsed):
+                if not isinstance(item, dict):
+                    continue
+                number = item.pop('task', position + 1)
+                if isinstance(number, int) and 1 <= number <= len(informations) and self._valid_judgement(item):
+                    judgements[number - 1] = item
+        except (ValueError, json.JSONDecodeError, TypeError, AttributeError, RetryError) as e:
+            print(f"Batched judge failed ({str(e)}); grading its {len(informations)} items one by one.")
+
+        # Items missing from, or malformed in, the batched answer are graded on their own.
+        for index, information in enumerate(informations):
+            if judgements[index] is None:
+                judgements[index] = self._judge_one_with_retries(information, backend)
+        return judgements
+
+    def judge_many(self, informations, backend='OpenRouter', batch_size=None):
+        """Judge results for a list of `self.prompts['eval']` inputs, in order; None where grading failed."""
+        batch_size = self.judge_batch_size if batch_size is None else batch_size
+        judgements = [prejudge(information) if self.prejudge else None for information in informations]
+        ambiguous = [index for index, judgement in enumerate(judgements) if judgement is None]
+        for start in range(0, len(ambiguous), max(batch_size, 1)):
+            chunk = ambiguous[start:start + max(batch_size, 1)]
+            if len(chunk) == 1:
+                results = [self._judge_one_with_retries(informations[chunk[0]], backend)]
+            else:
+                results = self._judge_batch([informations[index] for index in chunk], backend)
+            for index, judgement in zip(chunk, results):
+                judgements[index] = judgement
+        return judgements
+
+    def _verifier_messages(self, user_prompt, code):
+        """The system and user messages of one verification request; built fresh for every call."""
         workspace_structure = print_filesys_struture(self.workspace)
 
         information = {
@@ -153,8 +266,13 @@ class ErrorVerifierAgent(GenericAgent):
         messages = []
         messages.append({"role": "system", "content": fill_in_placeholders(self.prompts['system'], information)})
         messages.append({"role": "user", "content": fill_in_placeholders(self.prompts['user'], information)})
+        return messages
 
-        self.chat_history = self.chat_history + messages
+    def generate(self, user_prompt, model_type, code, backend='OpenRouter', temperature=0.0, record=True):
+        """`record=False` leaves chat_history alone; concurrent workers must not read-modify-write it."""
+        messages = self._verifier_messages(user_prompt, code)
+        if record:
+            self.chat_history = self.chat_history + messages
         return completion_with_backoff(messages, model_type, backend, temperature)
 
     def generate_for_self_refine(self, user_prompt, model_type, code, initial_analysis=None, backend='OpenRouter'):
@@ -395,19 +513,8 @@ class ErrorVerifierAgent(GenericAgent):
         print(f"\n...............Verifying query {query['id']}...............")
         result = self.generate(prompt, model_type=model_type, code=error_hidden_code)
 
-        # Locate the first curly brace to the last one for extracting the JSON object
-        start_index = result.find('{')
-        end_index = result.rfind('}')
-
-        if start_index == -1 or end_index == -1:
-            raise ValueError("No valid JSON found in the input string.")
-
-        # Extract the JSON substring and clean it if necessary
-        json_str = result[start_index:end_index + 1]
-        cleaned_json_str = clean_json_string(json_str)
-
-        # Convert the extracted JSON string to a Python dictionary
-        result_dict = json.loads(cleaned_json_str)
+        # Extract the JSON object, repairing unescaped code strings if necessary
+        result_dict = extract_json(result, kind=dict)
 
         information = {
             'ground_truth': ground_truth_dict,
@@ -438,7 +545,82 @@ class ErrorVerifierAgent(GenericAgent):
         log_string = "\n".join(log)
         return log_string, result_dict
 
-    def rubber_duck_eval(self, queries, model_type, eval_folder, individual_workspace):
+    def _rubber_duck_eval_version(self, prompt, idx, total, error_version, model_type, MAX_RETRIES=5, judge=True):
+        """Verify and judge one error version; returns (its log lines, its eval result or None).
+
+        With judge=False the judge call is left to the caller and the judge's input is returned instead.
+        """
+        log = []
+        eval_result = None
+        retries = 0  # 重试计数器
+        success = False  # 标记是否成功处理
+
+        while retries < MAX_RETRIES and not success:
+            try:
+                log.append(
+                    f"\n--- Processing Error Version {idx + 1}/{total} (Attempt {retries + 1}) ---")
+
+                modified_code = error_version['modified_code']
+                error_message = execution_error_message(error_version)
+                if error_message is not None:
+                    ground_truth = {
+                        "cause_error_line": error_version["cause_error_line"],
+                        "effect_error_line": error_version["effect_error_line"],
+                        "execution_output": error_message
+                    }
+                    # Log error version details
+                    log.append(f"\nModified Code:\n{modified_code}")
+                    log.append(f"Ground Truth: {json.dumps(ground_truth, indent=2)}")
+
+                    log.append("\n...............Verifying code with LLM...............")
+                    print(
+                        f"\n...............Verifying error version {idx + 1}/{total} (Attempt {retries + 1})...............")
+
+                    result = self.generate(prompt, model_type=model_type, code=modified_code, backend='OpenRouter',
+                                           record=False)
+
+                    # Extract and parse JSON
+                    llm_output = extract_json(result, kind=dict, required=('cause_line',))
+
+                    information = {
+                        'ground_truth': ground_truth,
+                        'eval_dict': llm_output
+                    }
+                    if not judge:
+                        log.append(f"LLM Output: {json.dumps(result, indent=2)}")
+                        log.append(f"JSON Output: {json.dumps(llm_output, indent=2)}")
+                        return log, information
+
+                    print(
+                        f"\n...............Evaluating error version {idx + 1}/{total} (Attempt {retries + 1})...............")
+                    eval_result = self._judge(information, backend='OpenRouter')
+
+                    # Log comparison result
+                    log.append(f"LLM Output: {json.dumps(result, indent=2)}")
+                    print(f"LLM Output: {json.dumps(result, indent=2)}")
+                    log.append(f"JSON Output: {json.dumps(llm_output, indent=2)}")
+                    log.append(f"Eval Result: {eval_result}")
+
+                    # 如果成功处理，设置 success 为 True
+                    success = True
+
+                else:
+                    break  # 如果没有错误信息，跳过该 error_version
+
+            except (ValueError, json.JSONDecodeError, KeyError, TypeError, RetryError) as e:
+                retries += 1
+                log.append(f"Error encountered in Attempt {retries}: {str(e)}")
+                print(f"Error in Attempt {retries}: {str(e)}")
+                # traceback.print_exc()
+
+        # 如果重试次数用尽仍未成功
+        if not success:
+            log.append(f"Failed to process Error Version {idx + 1} after {MAX_RETRIES} attempts.")
+            print(f"Failed to process Error Version {idx + 1} after {MAX_RETRIES} attempts.")
+
+        return log, eval_result if success else None
+
+    def rubber_duck_eval(self, queries, model_type, eval_folder, individual_workspace, max_workers=None):
         log = []
         query = queries
 
@@ -461,90 +643,35 @@ class ErrorVerifierAgent(GenericAgent):
 
         MAX_RETRIES = 5
         eval_results = []
+        max_workers = self.version_workers if max_workers is None else max_workers
         print(f"\n**********Verifying ID: {query['id']}**********")
+        judge_batched = self.judge_batch_size > 1
         try:
-            for idx, error_version in enumerate(error_versions):
-                retries = 0  # 重试计数器
-                success = False  # 标记是否成功处理
-
-                while retries < MAX_RETRIES and not success:
-                    try:
-                        log.append(
-                            f"\n--- Processing Error Version {idx + 1}/{len(error_versions)} (Attempt {retries + 1}) ---")
-
-                        modified_code = error_version['modified_code']
-                        error_message = extract_traceback(error_version['execution_output'])
-                        if error_message is not None:
-                            ground_truth = {
-                                "cause_error_line": error_version["cause_error_line"],
-                                "effect_error_line": error_version["effect_error_line"],
-                                "execution_output": error_message
-                            }
-                            # Log error version details
-                            log.append(f"\nModified Code:\n{modified_code}")
-                            log.append(f"Ground Truth: {json.dumps(ground_truth, indent=2)}")
-
-                            log.append("\n...............Verifying code with LLM...............")
-                            print(
-                                f"\n...............Verifying error version {idx + 1}/{len(error_versions)} (Attempt {retries + 1})...............")
-
-                            result = self.generate(prompt, model_type=model_type, code=modified_code, backend='OpenRouter')
-
-                            # Locate the first curly brace to the last one for extracting the JSON object
-                            start_index = result.rfind('{')
-                            end_index = result.rfind('}')
-
-                            if start_index == -1 or end_index == -1:
-                                raise ValueError("No valid JSON found in the LLM response.")
-
-                            # Extract and parse JSON
-                            json_str = result[start_index:end_index + 1]
-                            # cleaned_json_str = clean_json_string(json_str)
-                            llm_output = json.loads(json_str)
-
-                            information = {
-                                'ground_truth': ground_truth,
-                                'eval_dict': llm_output
-                            }
-
-                            messages = []
-                            messages.append({"role": "system", "content": ''})
-                            messages.append(
-                                {"role": "user", "content": fill_in_placeholders(self.prompts['eval'], information)})
-
-                            print(
-                                f"\n...............Evaluating error version {idx + 1}/{len(error_versions)} (Attempt {retries + 1})...............")
-                            eval_completion = completion_with_backoff(messages, 'gpt-4o', backend='OpenRouter')
-
-                            start_index = eval_completion.rfind('{')
-                            end_index = eval_completion.rfind('}')
-                            json_str = eval_completion[start_index:end_index + 1]
-                            eval_result = json.loads(json_str)
-                            eval_results.append(eval_result)
-
-                            # Log comparison result
-                            log.append(f"LLM Output: {json.dumps(result, indent=2)}")
-                            print(f"LLM Output: {json.dumps(result, indent=2)}")
-                            log.append(f"JSON Output: {json.dumps(llm_output, indent=2)}")
-                            log.append(f"Eval Result: {eval_result}")
-
-                            # 如果成功处理，设置 success 为 True
-                            success = True
-
-                        else:
-                            break  # 如果没有错误信息，跳过该 error_version
-
-                    except (ValueError, json.JSONDecodeError, KeyError, TypeError, RetryError) as e:
-                        retries += 1
-                        log.append(f"Error encountered in Attempt {retries}: {str(e)}")
-                        print(f"Error in Attempt {retries}: {str(e)}")
-                        # traceback.print_exc()
-
-                # 如果重试次数用尽仍未成功
-                if not success:
-                    log.append(f"Failed to process Error Version {idx + 1} after {MAX_RETRIES} attempts.")
-                    print(f"Failed to process Error Version {idx + 1} after {MAX_RETRIES} attempts.")
-
+            def process(item):
+                idx, error_version = item
+                return self._rubber_duck_eval_version(prompt, idx, len(error_versions), error_version, model_type,
+                                                      MAX_RETRIES, judge=not judge_batched)
+
+            if max_workers > 1:
+                # Versions are independent; map() hands results back in version order, so the log
+                # and the JSONL line are the same as for the serial loop.
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(error_versions))) as executor:
+                    outcomes = list(executor.map(process, enumerate(error_versions)))
+            else:
+                outcomes = map(process, enumerate(error_versions))
+            if judge_batched:
+                # Verify every version first, then grade them together in batched judge calls.
+                informations = []
+                for version_log, information in outcomes:
+                    log.extend(version_log)
+                    if information is not None:
+                        informations.append(information)
+                print(f"\n...............Evaluating {len(informations)} error versions in batches...............")
+                outcomes = [([f"Eval Result: {eval_result}"], eval_result) for eval_result in self.judge_many(informations)]
+            for version_log, eval_result in outcomes:
+                log.extend(version_log)
+                if eval_result is not None:
+                    eval_results.append(eval_result)
 
         except (ValueError, json.JSONDecodeError, KeyError) as e:
             print(f"Exception occurred: {str(e)}")
@@ -606,54 +733,41 @@ class ErrorVerifierAgent(GenericAgent):
 
                         result = self.generate(prompt, model_type=model_type, code=modified_code, backend='THU')
 
-                        # start_index = result.rfind('[')  # Expecting JSON list now for multi-bug detection
-                        # end_index = result.rfind(']')
-
-                        match = re.search(r"\[\s*\{.*?\}\s*\]", result, re.DOTALL)
-
-                        if match:
-                            json_list_str = match.group(0)
-                        else:
-                            json_list_str = None
-
-                        # if start_index == -1 or end_index == -1:
-                            # raise ValueError("No valid JSON List found in the LLM response (Error Detection).")
-
-                        llm_output_errors = json.loads(json_list_str)
-
-                        # json_list_str = result[start_index:end_index + 1]
-                        # cleaned_json_list_str = clean_json_string(json_list_str)
-                        # llm_output_errors = json.loads(json_list_str)  # Now LLM output is expected to be a list of errors
+                        # Expecting a JSON list of error objects for multi-bug detection
+                        llm_output_errors = extract_json(result, kind=list, item_required=('cause_line',))
 
                         log.append(f"LLM Output (Error Detection): {json.dumps(llm_output_errors, indent=2)}")
 
                         single_error_eval_results = []  # List to store eval results for each detected error
-                        for llm_error_index, llm_error in enumerate(
-                                llm_output_errors):  # Loop through each detected error
-                            information_single_error = {
-                                'ground_truth': ground_truth_info,
-                                'llm_output_error': llm_error  # Pass the single LLM detected error
-                            }
-
-                            messages = []
-                            messages.append({"role": "system", "content": ''})
-                            messages.append(
-                                {"role": "user", "content": fill_in_placeholders(self.prompts['eval'],
-                                                                                 information_single_error)})  # Use single-error eval prompt
-
+                        if self.judge_batch_size > 1:
+                            # All detected errors of this version are graded in batched judge calls.
                             print(
-                                f"\n...............Evaluating detected error {llm_error_index + 1}/{len(llm_output_errors)} of error version {query['id']} (Attempt {retries + 1})...............")
-                            eval_result_str = completion_with_backoff(messages,
-                                                                      'gpt-4o', backend='THU')  # Get single-error eval result
+                                f"\n...............Evaluating {len(llm_output_errors)} detected errors of error version {query['id']} (Attempt {retries + 1})...............")
+                            judgements = self.judge_many([
+                                {'ground_truth': ground_truth_info, 'llm_output_error': llm_error}
+                                for llm_error in llm_output_errors
+                            ], backend='THU')
+                            if any(judgement is None for judgement in judgements):
+                                raise ValueError("Judge failed to grade a detected error.")
+                            for llm_error_index, single_error_eval_result in enumerate(judgements):
+                                single_error_eval_results.append(single_error_eval_result)
+                                log.append(
+                                    f"  Error {llm_error_index + 1} Eval Result: {json.dumps(single_error_eval_result, indent=2)}")
+                        else:
+                            for llm_error_index, llm_error in enumerate(
+                                    llm_output_errors):  # Loop through each detected error
+                                information_single_error = {
+                                    'ground_truth': ground_truth_info,
+                                    'llm_output_error': llm_error  # Pass the single LLM detected error
+                                }
 
-                            start_index = eval_result_str.rfind('{')
-                            end_index = eval_result_str.rfind('}')
-                            json_str = eval_result_str[start_index:end_index + 1]
-                            single_error_eval_result = json.loads(json_str)  # Parse single-error eval JSON
-                            single_error_eval_results.append(single_error_eval_result)  # Append single-error result
+                                print(
+                                    f"\n...............Evaluating detected error {llm_error_index + 1}/{len(llm_output_errors)} of error version {query['id']} (Attempt {retries + 1})...............")
+                                single_error_eval_result = self._judge(information_single_error, backend='THU')  # Single-error eval result
+                                single_error_eval_results.append(single_error_eval_result)  # Append single-error result
 
-                            log.append(
-                                f"  Error {llm_error_index + 1} Eval Result: {json.dumps(single_error_eval_result, indent=2)}")
+                                log.append(
+                                    f"  Error {llm_error_index + 1} Eval Result: {json.dumps(single_error_eval_result, indent=2)}")
 
                         eval_results.append(
                             single_error_eval_results)  # Append list of single-error results for this error_version
@@ -722,7 +836,7 @@ class ErrorVerifierAgent(GenericAgent):
                             f"\n--- Processing Error Version {idx + 1}/{len(error_versions)} (Attempt {retries + 1}) ---")
 
                         modified_code = error_version['modified_code']
-                        error_message = extract_traceback(error_version.get('execution_output', ''))
+                        error_message = execution_error_message(error_version)
 
                         if error_message is None:
                             log.append("Skipping error version due to missing execution output.")
@@ -755,13 +869,7 @@ class ErrorVerifierAgent(GenericAgent):
                         initial_cot_output = parts[0].replace("**CoT Output:**", "").strip()
                         json_part_raw = parts[1]
 
-                        start_index = json_part_raw.find('{')
-                        end_index = json_part_raw.rfind('}')
-                        if start_index == -1 or end_index == -1:
-                            raise ValueError("No valid JSON found in the initial LLM response.")
-
-                        initial_json_str = json_part_raw[start_index:end_index + 1]
-                        initial_llm_output = json.loads(initial_json_str)
+                        initial_llm_output = extract_json(json_part_raw, kind=dict, required=('cause_line',), prefer='first')
 
                         log.append(f"\n[STAGE 1] Initial CoT Output:\n{initial_cot_output}")
                         log.append(f"[STAGE 1] Initial JSON Output: {json.dumps(initial_llm_output, indent=2)}")
@@ -798,13 +906,7 @@ class ErrorVerifierAgent(GenericAgent):
                         refined_cot_output = final_parts[0].replace("**Refined CoT Output:**", "").strip()
                         final_json_part_raw = final_parts[1]
 
-                        start_index = final_json_part_raw.find('{')
-                        end_index = final_json_part_raw.rfind('}')
-                        if start_index == -1 or end_index == -1:
-                            raise ValueError("No valid JSON found in the final LLM response.")
-
-                        final_json_str = final_json_part_raw[start_index:end_index + 1]
-                        final_llm_output = json.loads(final_json_str)
+                        final_llm_output = extract_json(final_json_part_raw, kind=dict, required=('cause_line',), prefer='first')
 
                         # ------------------ EVALUATION ------------------
                         # 使用最终结果进行评估
@@ -813,18 +915,8 @@ class ErrorVerifierAgent(GenericAgent):
                             'eval_dict': final_llm_output  # 使用最终的输出进行评估
                         }
 
-                        messages = [
-                            {"role": "system", "content": ''},  # 你的评估System Prompt
-                            {"role": "user", "content": fill_in_placeholders(self.prompts['eval'], information)}
-                        ]
-
                         print(f"\n............... Evaluating final refined output ...............")
-                        eval_completion = completion_with_backoff(messages, 'gpt-4o', backend='OpenRouter')
-
-                        start_index = eval_completion.rfind('{')
-                        end_index = eval_completion.rfind('}')
-                        json_str = eval_completion[start_index:end_index + 1]
-                        eval_result = json.loads(json_str)
+                        eval_result = self._judge(information, backend='OpenRouter')
                         eval_results.append(eval_result)
 
                         # 记录最终日志
@@ -861,11 +953,37 @@ class ErrorVerifierAgent(GenericAgent):
         log_string = "\n".join(log)
         return log_string, eval_results
 
+    def _self_consistency_sample(self, prompt, model_type, modified_code, temperature, i, n_samples, MAX_RETRIES=5):
+        """Draw sample `i` with retries; returns (its log lines, its parsed JSON or None)."""
+        log = []
+        retries = 0
+        while retries < MAX_RETRIES:
+            try:
+                # Samples run concurrently: each keeps its own messages and chat_history is not touched.
+                messages = self._verifier_messages(prompt, modified_code)
+                result = completion_with_backoff(messages, model_type, 'OpenRouter', temperature)
+
+                llm_output = extract_json(result, kind=dict, required=('cause_line',))
+
+                log.append(
+                    f"--- Sample {i + 1}/{n_samples} successful. JSON: {json.dumps(llm_output, indent=2)}")
+                return log, llm_output
+
+            except (ValueError, json.JSONDecodeError, KeyError, TypeError, RetryError) as e:
+                retries += 1
+                log.append(f"Error encountered in Sample {i + 1} Attempt {retries}: {str(e)}")
+                print(f"Error in Sample {i + 1} Attempt {retries}: {str(e)}")
+
+        log.append(
+            f"Failed to generate Sample {i + 1} after {MAX_RETRIES} attempts. Skipping this sample.")
+        return log, None
+
     def rubber_duck_eval_self_consistency(self, queries, model_type, eval_folder, individual_workspace, n_samples=5,
-                                          temperature=0.7):
+                                          temperature=0.7, early_stop=True):
         """
         Modified version of rubber_duck_eval for Self-Consistency.
         It generates multiple responses and uses a majority vote to determine the final answer.
+        Samples are requested concurrently; with early_stop, sampling ends as soon as the vote is settled.
         """
         log = []
         query = queries
@@ -884,6 +1002,7 @@ class ErrorVerifierAgent(GenericAgent):
 
         MAX_RETRIES = 5  # 这是针对每个样本的重试次数
         eval_results = []
+        pending_judgements = []
         print(f"\n**********Verifying ID: {query['id']} (Self-Consistency, n={n_samples})**********")
 
         try:
@@ -891,7 +1010,7 @@ class ErrorVerifierAgent(GenericAgent):
                 log.append(f"\n--- Processing Error Version {idx + 1}/{len(error_versions)} ---")
 
                 modified_code = error_version['modified_code']
-                error_message = extract_traceback(error_version.get('execution_output', ''))
+                error_message = execution_error_message(error_version)
 
                 if error_message is None:
                     log.append("Skipping error version due to missing execution output.")
@@ -907,41 +1026,36 @@ class ErrorVerifierAgent(GenericAgent):
                 log.append(f"Ground Truth: {json.dumps(ground_truth, indent=2)}")
 
                 # ------------------ SAMPLING STAGE ------------------
-                all_sample_outputs = []
                 log.append(f"\n............... Generating {n_samples} samples ...............")
                 print(f"\n............... Generating {n_samples} samples for error version {idx + 1}/{len(error_versions)} ...............")
 
-                for i in range(n_samples):
-                    retries = 0
-                    sample_success = False
-                    while retries < MAX_RETRIES and not sample_success:
-                        try:
-                            # 假设 self.generate 支持 temperature 参数
-                            # 如果不支持，需要在 self.generate 内部传递给 completion_with_backoff
-                            result = self.generate(prompt, model_type=model_type, code=modified_code,
-                                                   backend='OpenRouter', temperature=temperature)
-
-                            start_index = result.rfind('{')
-                            end_index = result.rfind('}')
-                            if start_index == -1 or end_index == -1:
-                                raise ValueError("No valid JSON found in the LLM sample response.")
-
-                            json_str = result[start_index:end_index + 1]
-                            llm_output = json.loads(json_str)
-
-                            all_sample_outputs.append(llm_output)
-                            log.append(
-                                f"--- Sample {i + 1}/{n_samples} successful. JSON: {json.dumps(llm_output, indent=2)}")
-                            sample_success = True
-
-                        except (ValueError, json.JSONDecodeError, KeyError, TypeError, RetryError) as e:
-                            retries += 1
-                            log.append(f"Error encountered in Sample {i + 1} Attempt {retries}: {str(e)}")
-                            print(f"Error in Sample {i + 1} Attempt {retries}: {str(e)}")
-
-                    if not sample_success:
-                        log.append(
-                            f"Failed to generate Sample {i + 1} after {MAX_RETRIES} attempts. Skipping this sample.")
+                # Samples are drawn in concurrent waves, each just large enough to possibly decide the
+                # vote; sampling stops once the majority can no longer change.
+                sample_logs = {}
+                sample_outputs = {}
+                drawn = 0
+                while drawn < n_samples:
+                    outputs_so_far = [sample_outputs[i] for i in sorted(sample_outputs)]
+                    wave = self._samples_needed(outputs_so_far, n_samples - drawn) if early_stop else n_samples - drawn
+                    if wave == 0:
+                        break
+                    wave = min(wave, n_samples - drawn)
+                    with ThreadPoolExecutor(max_workers=wave) as executor:
+                        samples = list(executor.map(
+                            lambda i: self._self_consistency_sample(prompt, model_type, modified_code, temperature,
+                                                                    i, n_samples, MAX_RETRIES),
+                            range(drawn, drawn + wave)))
+                    for i, (sample_log, llm_output) in zip(range(drawn, drawn + wave), samples):
+                        sample_logs[i] = sample_log
+                        if llm_output is not None:
+                            sample_outputs[i] = llm_output
+                    drawn += wave
+
+                for i in sorted(sample_logs):
+                    log.extend(sample_logs[i])
+                all_sample_outputs = [sample_outputs[i] for i in sorted(sample_outputs)]
+                if drawn < n_samples:
+                    log.append(f"Majority settled after {drawn}/{n_samples} samples; skipped the rest.")
 
                 # ------------------ VOTING STAGE ------------------
                 if not all_sample_outputs:
@@ -965,21 +1079,22 @@ class ErrorVerifierAgent(GenericAgent):
                     'ground_truth': ground_truth,
                     'eval_dict': final_llm_output
                 }
-
-                messages = [
-                    {"role": "system", "content": ''},  # 你的评估System Prompt
-                    {"role": "user", "content": fill_in_placeholders(self.prompts['eval'], information)}
-                ]
+                if self.judge_batch_size > 1:
+                    pending_judgements.append(information)  # Graded together after the last version.
+                    continue
 
                 print(f"\n............... Evaluating final voted output ...............")
-                eval_completion = completion_with_backoff(messages, 'gpt-4o', backend='OpenRouter')
-
-                start_index = eval_completion.rfind('{')
-                end_index = eval_completion.rfind('}')
-                json_str = eval_completion[start_index:end_index + 1]
-                eval_result = json.loads(json_str)
-                eval_results.append(eval_result)
-                log.append(f"Eval Result: {eval_result}")
+                eval_result = self._judge_one_with_retries(information, backend='OpenRouter')
+                if eval_result is not None:
+                    eval_results.append(eval_result)
+                    log.append(f"Eval Result: {eval_result}")
+
+            if pending_judgements:
+                print(f"\n............... Evaluating {len(pending_judgements)} voted outputs in batches ...............")
+                for eval_result in self.judge_many(pending_judgements):
+                    if eval_result is not None:
+                        eval_results.append(eval_result)
+                        log.append(f"Eval Result: {eval_result}")
 
         except Exception as e:
             print(f"An unexpected error occurred during processing of query {query['id']}: {str(e)}")
@@ -883,4 +883,24 @@ Your new, more thorough step-by-step reasoning here.
     "error_message": "Provide the definitive and concise error message"
 }
 ```
-'''
\ No newline at end of file
+'''
+
+# Wraps an eval prompt (rendered once, with its data slots pointing at the tasks) to grade many items in one call.
+BATCH_EVAL_PROMPT = '''{{instructions}}
+
+---
+
+### Tasks:
+The instructions above describe how to grade one task. Grade each of the following {{count}} tasks independently, using only that task's own data.
+
+{{tasks}}
+
+### Batch Output Format:
+Return one JSON array with exactly {{count}} objects, in task order. Each object contains the fields of the Output Format above plus "task", the task number.
+```json
+[
+    {"task": 1, ...},
+    {"task": 2, ...}
+]
+```
+'''
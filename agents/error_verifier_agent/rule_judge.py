@@ -0,0 +1,141 @@
+"""Local, deterministic pre-judge for the verifier evaluations.
+
+Before a (ground truth, prediction) pair goes to the LLM judge, `prejudge` compares the code
+lines (by AST where a line parses on its own, else by normalized tokens), the exception types
+and the error messages. When every dimension is clear-cut (an exact match, or plainly different
+lines and a different exception) it returns the judge's result fields itself, with the same
+`*_score` keys that compute_eval_result.py reads. Anything in between returns None and is left to
+the LLM judge.
+"""
+import ast
+import re
+from difflib import SequenceMatcher
+
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+_EXCEPTION = re.compile(r'\b((?:[A-Za-z_]\w*\.)*[A-Z]\w*(?:Error|Exception|Warning|Interrupt|Exit))\b(?::\s*(.*))?')
+
+# Below these similarities two lines / messages count as clearly different.
+_LINE_MISMATCH = 0.5
+_MESSAGE_MISMATCH = 0.3
+
+
+def _line_ast(line):
+    source = line.strip()
+    if source.endswith(':'):
+        source += '\n    pass'  # Compound statement headers (for/if/def/with) parse with a body.
+    try:
+        return ast.dump(ast.parse(source))
+    except (SyntaxError, ValueError):
+        return None
+
+
+def _tokens(text):
+    return _TOKEN.findall(re.sub(r'\s+#.*$', '', str(text).strip()))
+
+
+def compare_lines(truth, prediction):
+    """1 for the same line of code, 0 for a clearly different one, None when unsure."""
+    truth, prediction = str(truth or '').strip(), str(prediction or '').strip()
+    if not truth:
+        return None
+    if not prediction:
+        return 0
+    truth_ast, prediction_ast = _line_ast(truth), _line_ast(prediction)
+    if truth_ast is not None and truth_ast == prediction_ast:
+        return 1
+    truth_tokens, prediction_tokens = _tokens(truth), _tokens(prediction)
+    if truth_tokens == prediction_tokens:
+        return 1
+    if SequenceMatcher(None, truth_tokens, prediction_tokens).ratio() < _LINE_MISMATCH:
+        return 0
+    return None
+
+
+def _exception(text):
+    """(type, message) of the last exception line in `text`; the type is unqualified."""
+    matches = _EXCEPTION.findall(str(text or ''))
+    if not matches:
+        return None, None
+    name, message = matches[-1]
+    return name.split('.')[-1], (message or '').strip() or None
+
+
+def _normalize_message(text):
+    text = str(text or '').strip()
+    name, message = _exception(text)
+    if name and message and text.split(':')[0].split('.')[-1].strip() == name:
+        text = message  # "ValueError: x" and "x" describe the same message.
+    return ' '.join(text.lower().strip(' .\'"`').split())
+
+
+def compare_errors(truth_output, prediction):
+    """(error_type_score, error_message_score), each None when unsure."""
+    truth_type, truth_message = _exception(truth_output)
+    if truth_type is None or truth_message is None:
+        return None, None
+    predicted_text = prediction.get('error_message', '')
+    predicted_type = prediction.get('error_type')
+    if not predicted_type or not _EXCEPTION.fullmatch(str(predicted_type).strip()):
+        predicted_type = _exception(predicted_text)[0]
+    else:
+        predicted_type = str(predicted_type).strip().split('.')[-1]
+
+    if not str(predicted_text or '').strip() and predicted_type is None:
+        return 0, 0.0  # Nothing predicted at all.
+    type_score = None
+    if predicted_type is not None:
+        type_score = 1 if predicted_type == truth_type else 0
+
+    truth_normalized = _normalize_message(truth_message)
+    predicted_normalized = _normalize_message(predicted_text)
+    message_score = None
+    if predicted_normalized and predicted_normalized == truth_normalized:
+        message_score = 1.0
+    elif type_score == 0 and SequenceMatcher(None, _tokens(truth_normalized), _tokens(predicted_normalized)).ratio() < _MESSAGE_MISMATCH:
+        message_score = 0.0
+    return type_score, message_score
+
+
+def _prejudge_single(ground_truth, prediction):
+    cause = compare_lines(ground_truth.get('cause_error_line'), prediction.get('cause_line'))
+    effect = compare_lines(ground_truth.get('effect_error_line'), prediction.get('effect_line'))
+    error_type, error_message = compare_errors(ground_truth.get('execution_output') or ground_truth.get('error_message'),
+                                               prediction)
+    scores = (cause, effect, error_type, error_message)
+    if None in scores:
+        return None
+    if scores == (1, 1, 1, 1.0):
+        reason = 'Cause line, effect line, error type and error message all match the ground truth exactly.'
+    elif scores == (0, 0, 0, 0.0):
+        reason = 'Cause line, effect line and error type all differ from the ground truth, and the error message is unrelated to it.'
+    else:
+        return None  # Mixed verdicts are left to the judge, which also weighs partial credit.
+    return {
+        'cause_line_score': cause,
+        'effect_line_score': effect,
+        'error_type_score': error_type,
+        'error_message_score': error_message,
+        'error_message_eval_reason': f'{reason} (settled by the local rule-based matcher)',
+    }
+
+
+def prejudge(information):
+    """Judge result for one `prompts['eval']` input when the case is clear-cut, else None.
+
+    Handles the single-error input ({'ground_truth', 'eval_dict'}) and the multi-error input
+    ({'ground_truth': [...], 'llm_output_error'}); for the latter only an exact match to one
+    ground-truth error is settled locally.
+    """
+    ground_truth = information.get('ground_truth')
+    prediction = information.get('eval_dict', information.get('llm_output_error'))
+    if not isinstance(prediction, dict):
+        return None
+    if isinstance(ground_truth, dict):
+        return _prejudge_single(ground_truth, prediction)
+    if isinstance(ground_truth, list):
+        for instance in ground_truth:
+            if isinstance(instance, dict):
+                result = _prejudge_single(instance, prediction)
+                if result is not None and result['cause_line_score'] == 1:
+                    return result
+    return None
@@ -0,0 +1,285 @@
+"""Tolerant JSON extraction from LLM replies, in one piece or as they stream in.
+
+Agents used to cut JSON out of replies with `find('{')`/`rfind('}')`, which picks the wrong span
+as soon as a reply holds an example object, a nested object, or prose with braces, and then
+retried the whole completion when `json.loads` failed. `JsonStream` instead scans for balanced
+top-level `{...}` / `[...]` values (string-aware, so braces inside strings do not count), parses
+each as soon as it closes, repairs the usual LLM mistakes (raw newlines and tabs inside strings,
+unescaped quotes and backslashes in code, trailing commas, Python's True/False/None) when plain
+parsing fails, and keeps the values that pass a small schema check. `extract_json` is the
+one-shot form.
+"""
+import json
+
+_OPENERS = {'{': '}', '[': ']'}
+_ESCAPES = set('"\\/bfnrtu')
+_CONTROL = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_PYTHON_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+_WHITESPACE = ' \t\r\n'
+# Rescanning after brackets that turn out not to open JSON is bounded, so replies full of stray
+# brackets stay linear: at most this many times the reply length (plus a flat allowance).
+_RESCAN_FACTOR = 20
+_RESCAN_SLACK = 200000
+
+
+def _string_ends(text, i, closer, is_key, final=True):
+    """Whether the unescaped quote at `i` closes the current string; None if the text so far cannot tell.
+
+    LLMs often leave the quotes inside code values unescaped, so a quote only counts as closing when
+    JSON structure follows it: `:` after a key; `,` or the enclosing bracket after a value (and, in
+    an object, the `,` has to be followed by the next `"key":`).
+    """
+    n = len(text)
+    j = i + 1
+    while j < n and text[j] in _WHITESPACE:
+        j += 1
+    if j >= n:
+        return True if final else None
+    if is_key:
+        return text[j] == ':'
+    if text[j] == closer:
+        return True
+    if text[j] != ',':
+        return False
+    if closer != '}':
+        return True
+    j += 1
+    while j < n and text[j] in _WHITESPACE:
+        j += 1
+    if j >= n:
+        return True if final else None
+    if text[j] != '"':
+        return text[j] == '}'
+    # The next key: a string followed by `:`.
+    j += 1
+    while j < n and text[j] != '"':
+        j += 2 if text[j] == '\\' else 1
+    j += 1
+    while j < n and text[j] in _WHITESPACE:
+        j += 1
+    if j >= n:
+        return True if final else None
+    return text[j] == ':'
+
+
+def repair_json(text):
+    """Best-effort fix of the JSON mistakes LLMs make, mostly inside code-valued strings."""
+    out = []
+    stack = []
+    expect_key = False
+    in_string = is_key = False
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if ch == '\\':
+                if i + 1 < n and text[i + 1] in _ESCAPES:
+                    out.append(text[i:i + 2])
+                    i += 2
+                    continue
+                out.append('\\\\')  # A lone backslash (regex, Windows path) in a code string.
+            elif ch in _CONTROL:
+                out.append(_CONTROL[ch])
+            elif ch == '"':
+                if _string_ends(text, i, stack[-1] if stack else None, is_key):
+                    in_string = False
+                    out.append(ch)
+                else:
+                    out.append('\\"')  # Part of the code, not the end of the value.
+            elif ord(ch) < 0x20:
+                out.append('\\u%04x' % ord(ch))
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+            is_key = expect_key
+            out.append(ch)
+        elif ch in _OPENERS:
+            stack.append(_OPENERS[ch])
+            expect_key = ch == '{'
+            out.append(ch)
+        elif ch in '}]':
+            if stack:
+                stack.pop()
+            expect_key = False
+            out.append(ch)
+        elif ch == ':':
+            expect_key = False
+            out.append(ch)
+        elif ch == ',':
+            j = i + 1
+            while j < n and text[j] in _WHITESPACE:
+                j += 1
+            if j < n and text[j] not in '}]':  # Drop trailing commas.
+                out.append(ch)
+            expect_key = bool(stack) and stack[-1] == '}'
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == '_'):
+                j += 1
+            word = text[i:j]
+            out.append(_PYTHON_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+def parse_json(text):
+    """json.loads, falling back to repair_json; raises json.JSONDecodeError if both fail."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(text))
+
+
+def _items_carry(items, keys):
+    return isinstance(items, list) and all(isinstance(item, dict) and all(key in item for key in keys)
+                                           for item in items)
+
+
+def matches_schema(value, kind=None, required=(), item_required=(), value_item_required=()):
+    """`kind` is dict or list; `required` keys for a dict; `item_required` keys for each item of a list;
+    `value_item_required` keys for each item of every value of a dict (a dict of lists of dicts)."""
+    if kind is not None and not isinstance(value, kind):
+        return False
+    if required and not (isinstance(value, dict) and all(key in value for key in required)):
+        return False
+    if item_required and not _items_carry(value, item_required):
+        return False
+    if value_item_required and not (isinstance(value, dict) and all(
+            _items_carry(items, value_item_required) for items in value.values())):
+        return False
+    return True
+
+
+class JsonStream:
+    """Feed reply text (whole or in streamed deltas); collects every balanced JSON value that parses
+    and passes the schema, in order of appearance.
+
+    `feed` returns the values completed by that delta, so a streaming caller can act on the first
+    acceptable value, or give up on a reply whose values keep failing, before it has finished.
+    """
+
+    def __init__(self, kind=None, required=(), item_required=(), value_item_required=()):
+        self.kind = kind
+        self.required = tuple(required)
+        self.item_required = tuple(item_required)
+        self.value_item_required = tuple(value_item_required)
+        self.text = ''
+        self.values = []
+        self.rejected = 0  # Balanced values that did not parse or did not match the schema.
+        self.position = 0
+        self.rescanned = 0
+        self._reset()
+
+    def _reset(self):
+        self.start = None
+        self.stack = []
+        self.expect_key = False
+        self.in_string = False
+        self.is_key = False
+        self.escaped = False
+
+    def _accept(self, candidate):
+        try:
+            value = parse_json(candidate)
+        except (json.JSONDecodeError, RecursionError):
+            self.rejected += 1
+            return None
+        if not matches_schema(value, self.kind, self.required, self.item_required, self.value_item_required):
+            self.rejected += 1
+            return None
+        self.values.append(value)
+        return value
+
+    def _retry_after_start(self):
+        # Not the JSON we want (prose brackets, or an unparsable span): look for a value after this opener.
+        self.rescanned += self.position - self.start
+        self.position = self.start + 1
+        self._reset()
+        if self.rescanned > _RESCAN_FACTOR * len(self.text) + _RESCAN_SLACK:
+            self.position = len(self.text)  # Give up on the rest of a degenerate reply.
+
+    def _scan(self, final):
+        completed = []
+        text = self.text
+        while self.position < len(text):
+            ch = text[self.position]
+            if self.start is None:
+                if ch in _OPENERS:
+                    self.start = self.position
+                    self.stack = [_OPENERS[ch]]
+                    self.expect_key = ch == '{'
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    ends = _string_ends(text, self.position, self.stack[-1], self.is_key, final)
+                    if ends is None:
+                        break  # Wait for the next delta to decide.
+                    self.in_string = not ends
+            elif ch == '"':
+                self.in_string = True
+                self.is_key = self.expect_key
+            elif ch in _OPENERS:
+                self.stack.append(_OPENERS[ch])
+                self.expect_key = ch == '{'
+            elif ch == ':':
+                self.expect_key = False
+            elif ch == ',':
+                self.expect_key = self.stack[-1] == '}'
+            elif ch in '}]':
+                if ch != self.stack[-1]:
+                    self._retry_after_start()
+                    continue
+                self.stack.pop()
+                self.expect_key = False
+                if not self.stack:
+                    value = self._accept(text[self.start:self.position + 1])
+                    if value is None:
+                        # Maybe an inner value is the JSON we want (e.g. prose "[see {...}]").
+                        self._retry_after_start()
+                        continue
+                    completed.append(value)
+                    self._reset()
+            self.position += 1
+        return completed
+
+    def feed(self, delta):
+        self.text += delta
+        if self.rescanned > _RESCAN_FACTOR * len(self.text) + _RESCAN_SLACK:
+            return []
+        return self._scan(final=False)
+
+    def finish(self):
+        """Call once the reply is complete: settles the tail and retries an opener that never closed."""
+        completed = self._scan(final=True)
+        while self.start is not None:
+            self._retry_after_start()
+            completed.extend(self._scan(final=True))
+        return completed
+
+
+def extract_json(text, kind=None, required=(), item_required=(), value_item_required=(), prefer='last'):
+    """The JSON value in an LLM reply, repaired and checked against the schema.
+
+    With several acceptable values, `prefer` picks the 'last' (the final answer after examples)
+    or the 'first'. Raises ValueError, like json.loads, when the reply has none.
+    """
+    if not isinstance(text, str):
+        raise ValueError(f"Expected an LLM reply string, got {type(text).__name__}.")
+    stream = JsonStream(kind, required, item_required, value_item_required)
+    stream.text = text
+    stream.finish()
+    if not stream.values:
+        raise ValueError("No valid JSON found in the LLM response.")
+    return stream.values[-1] if prefer == 'last' else stream.values[0]
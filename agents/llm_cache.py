@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from agents.config.openai import llm_cache_enabled, llm_cache_path, llm_cache_ttl, llm_cache_max_bytes
+from agents.config.openai import llm_cache_nondeterministic
+
+
+class CompletionCache:
+    """Content-addressed store of chat completions backed by a single SQLite file.
+
+    Entries are keyed by a SHA-256 over the request, expire after `ttl` seconds (0 keeps them
+    forever) and are evicted least-recently-used first once the stored answers exceed
+    `max_bytes`.
+    """
+
+    def __init__(self, path, ttl=0, max_bytes=0):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._evict_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions(accessed_at)")
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, so keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute("SELECT response, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created_at = row
+        now = time.time()
+        if self.ttl and now - created_at > self.ttl:
+            conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return response
+
+    def put(self, key, model, response):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO completions (key, model, response, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, len(response.encode("utf-8")), now, now),
+        )
+        conn.commit()
+        if self.max_bytes:
+            self._evict(conn)
+
+    def _evict(self, conn):
+        with self._evict_lock:
+            (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()
+            if total <= self.max_bytes:
+                return
+            # Trim to 90% of the budget so that eviction does not run on every insert.
+            target = int(self.max_bytes * 0.9)
+            rows = conn.execute("SELECT key, size FROM completions ORDER BY accessed_at ASC").fetchall()
+            evicted = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                evicted.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM completions WHERE key = ?", evicted)
+            conn.commit()
+
+    def purge_expired(self):
+        if not self.ttl:
+            return 0
+        conn = self._connection()
+        cursor = conn.execute("DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl,))
+        conn.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM completions")
+        conn.commit()
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = CompletionCache(llm_cache_path, ttl=llm_cache_ttl, max_bytes=llm_cache_max_bytes)
+    return _CACHE
+
+
+def is_cacheable(temperature, use_cache=True):
+    # Sampled completions are only cached on request, otherwise self-consistency style
+    # sampling would keep getting the same answer back.
+    if not (use_cache and llm_cache_enabled):
+        return False
+    return llm_cache_nondeterministic or not temperature
+
+
+def make_key(model, messages, temperature, max_tokens=None):
+    # Messages are hashed verbatim, so base64 data URLs make image bytes part of the key.
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def lookup(model, messages, temperature, max_tokens=None, use_cache=True):
+    """Return (key, cached_answer). The key is None when the request must not be cached."""
+    if not is_cacheable(temperature, use_cache):
+        return None, None
+    key = make_key(model, messages, temperature, max_tokens)
+    return key, get_cache().get(key)
+
+
+def store(key, model, answer):
+    # Only successful answers are kept; exception objects and empty replies are retried next time.
+    if key is not None and isinstance(answer, str) and answer:
+        get_cache().put(key, model, answer)
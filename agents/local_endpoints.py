@@ -0,0 +1,136 @@
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+import openai
+
+from agents.config.openai import local_health_interval, local_probe_timeout, local_slow_factor
+from agents.config.openai import local_ejection_seconds, local_min_samples
+
+
+class Replica:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.outstanding = 0
+        self.latency = None  # EWMA of request latency in seconds
+        self.samples = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+
+    def available(self, now):
+        return self.healthy and self.ejected_until <= now
+
+
+class ReplicaPool:
+    """Routes requests for one local model across its vLLM replicas.
+
+    Each request goes to the available replica with the fewest outstanding requests (ties go
+    to the lower latency). A background thread probes `/v1/models` to mark replicas up or
+    down, and replicas much slower than their peers are ejected for a while.
+    """
+
+    def __init__(self, base_urls):
+        self.replicas = [Replica(base_url) for base_url in base_urls]
+        self.lock = threading.Lock()
+        self._prober = None
+
+    def acquire(self):
+        self._start_prober()
+        with self.lock:
+            now = time.monotonic()
+            candidates = [replica for replica in self.replicas if replica.available(now)]
+            if not candidates:
+                # Every replica is down or ejected: keep trying them rather than failing outright.
+                candidates = self.replicas
+            replica = min(candidates, key=lambda r: (r.outstanding, r.latency or 0.0))
+            replica.outstanding += 1
+            return replica
+
+    def release(self, replica, latency, error=None):
+        with self.lock:
+            replica.outstanding -= 1
+            if isinstance(error, openai.APIConnectionError):
+                # Take it out of rotation until the next successful health probe, so the
+                # rate limiter's retry fails over to another replica.
+                replica.healthy = False
+            if error is not None:
+                return
+            replica.samples += 1
+            replica.latency = latency if replica.latency is None else 0.8 * replica.latency + 0.2 * latency
+            self._eject_if_slow(replica)
+
+    def _eject_if_slow(self, replica):
+        now = time.monotonic()
+        peers = [r.latency for r in self.replicas
+                 if r is not replica and r.latency is not None and r.available(now)]
+        if not peers or replica.samples < local_min_samples:
+            return
+        if replica.latency > local_slow_factor * statistics.median(peers):
+            replica.ejected_until = now + local_ejection_seconds
+            # Let it back in with a clean slate once the ejection expires.
+            replica.latency = None
+            replica.samples = 0
+
+    @contextmanager
+    def route(self):
+        replica = self.acquire()
+        start = time.monotonic()
+        error = None
+        try:
+            yield replica.base_url
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(replica, time.monotonic() - start, error)
+
+    def probe(self):
+        for replica in self.replicas:
+            try:
+                response = httpx.get(f"{replica.base_url}/models", timeout=local_probe_timeout)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            with self.lock:
+                replica.healthy = healthy
+
+    def _start_prober(self):
+        if self._prober is not None or len(self.replicas) < 2:
+            return
+        with self.lock:
+            if self._prober is not None:
+                return
+            self._prober = threading.Thread(target=self._probe_loop, daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            self.probe()
+            time.sleep(local_health_interval)
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def replica_urls(model_config):
+    """Base URLs for a MODEL_CONFIG entry: `endpoints`, a list of ports, or a single port."""
+    if model_config.get("endpoints"):
+        return list(model_config["endpoints"])
+    ports = model_config["port"]
+    if not isinstance(ports, (list, tuple)):
+        ports = [ports]
+    return [f"http://localhost:{port}/v1" for port in ports]
+
+
+def get_replica_pool(model_type, model_config):
+    pool = _POOLS.get(model_type)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(model_type)
+            if pool is None:
+                pool = ReplicaPool(replica_urls(model_config))
+                _POOLS[model_type] = pool
+    return pool
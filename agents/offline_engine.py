@@ -0,0 +1,85 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from agents.config.openai import llm_offline_max_batch, llm_offline_batch_wait, llm_offline_engine_args
+
+
+class OfflineEngine:
+    """In-process vLLM engine that turns concurrent single requests into batched `LLM.chat` calls.
+
+    Callers from any thread `submit()` a conversation and get a Future back. A worker thread
+    drains the queue, waiting up to `batch_wait` seconds for more requests once the first one
+    arrives, and hands up to `max_batch` conversations to vLLM in one call.
+    """
+
+    def __init__(self, model_path, max_batch=llm_offline_max_batch, batch_wait=llm_offline_batch_wait,
+                 engine_args=None):
+        # vllm is heavy and only needed in this mode, so it is imported on first use.
+        from vllm import LLM, SamplingParams
+
+        self._sampling_params = SamplingParams
+        self.llm = LLM(model=model_path, **(engine_args or {}))
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def _params(self, temperature, max_tokens):
+        return self._sampling_params(temperature=temperature, max_tokens=max_tokens)
+
+    def submit(self, messages, temperature=0.0, max_tokens=None):
+        future = Future()
+        self._queue.put((messages, self._params(temperature, max_tokens), future))
+        return future
+
+    def complete(self, messages, temperature=0.0, max_tokens=None):
+        return self.submit(messages, temperature, max_tokens).result()
+
+    def complete_many(self, messages_list, temperature=0.0, max_tokens=None):
+        """Answer a list of conversations in order; the worker still splits them into max_batch chunks."""
+        futures = [self.submit(messages, temperature, max_tokens) for messages in messages_list]
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                outputs = self.llm.chat(
+                    [messages for messages, _, _ in batch],
+                    sampling_params=[params for _, params, _ in batch],
+                    use_tqdm=False,
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), output in zip(batch, outputs):
+                future.set_result(output.outputs[0].text)
+
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_offline_engine(model_type, model_path):
+    # Building an engine loads the weights, so hold the lock for the whole construction.
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(model_type)
+        if engine is None:
+            engine = OfflineEngine(model_path, engine_args=llm_offline_engine_args)
+            _ENGINES[model_type] = engine
+    return engine
@@ -1,43 +1,206 @@
+import asyncio
+import importlib.util
 import logging
+import random
+import threading
+import time
 import traceback
+import weakref
+from contextlib import ExitStack, contextmanager
 
+import httpx
 import openai
-from agents.config.openai import get_api_config, global_temperature
+from agents.config.openai import get_api_config, global_temperature, http_pool_size, http_keepalive_expiry, http2_enabled
+from agents.config.openai import provider_concurrency, llm_backoff_base, llm_single_flight, llm_engine_mode
+from agents import llm_cache
+from agents.local_endpoints import get_replica_pool
+from agents.offline_engine import get_offline_engine
+from agents.rate_limiter import call_with_limits, acall_with_limits, estimate_tokens, holding_limits
+from agents.single_flight import SingleFlight, AsyncSingleFlight
 from models.model_config import MODEL_CONFIG
 
 
+# Process-wide client registry, keyed by (base_url, api_key, provider). Every client keeps its
+# own keep-alive pool, so repeated turns reuse TCP/TLS connections instead of reconnecting.
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Async clients and semaphores are bound to the event loop that created them.
+_ASYNC_STATE = weakref.WeakKeyDictionary()
+
+_IN_FLIGHT = SingleFlight()
+
+
 def print_chat_message(messages):
     for message in messages:
         logging.info(f"{message['role']}: {message['content']}")
 
 
-def completion_with_backoff(messages, model_type, backend='OpenRouter', temperature=0.0):
+def _http2_available():
+    # httpx only speaks HTTP/2 when the optional `h2` package is installed.
+    return http2_enabled and importlib.util.find_spec("h2") is not None
+
+
+def _http_limits():
+    return httpx.Limits(
+        max_connections=http_pool_size,
+        max_keepalive_connections=http_pool_size,
+        keepalive_expiry=http_keepalive_expiry,
+    )
 
+
+def _build_http_client():
+    return openai.DefaultHttpxClient(limits=_http_limits(), http2=_http2_available())
+
+
+def _resolve_endpoint(model_type):
     if model_type in MODEL_CONFIG.keys():
+        # The replica, and so the base URL, is picked per request by _route().
+        replicas = get_replica_pool(model_type, MODEL_CONFIG[model_type])
+        return {
+            "name": model_type,
+            "base_url": None,
+            "replicas": replicas,
+            "api_key": "EMPTY",
+            "provider": "local",
+            "engine": MODEL_CONFIG[model_type].get('engine', llm_engine_mode),
+            "model": MODEL_CONFIG[model_type]['model'],
+            "max_tokens": 4096,
+            "concurrency": provider_concurrency["local"] * len(replicas.replicas),
+            "concurrency_key": f"local:{model_type}",
+        }
 
-        port = MODEL_CONFIG[model_type]['port']
-        model_full_path= MODEL_CONFIG[model_type]['model']
-        
-        openai_api_key = "EMPTY"
-        openai_api_base = f"http://localhost:{port}/v1"
+    api_config = get_api_config(model_type)
+    return {
+        "name": model_type,
+        "base_url": api_config["base_url"],
+        "api_key": api_config["api_key"],
+        "provider": api_config["provider"],
+        "replicas": None,
+        "engine": "server",
+        "model": model_type,
+        "max_tokens": None,
+        "concurrency": provider_concurrency[api_config["provider"]],
+        "concurrency_key": api_config["provider"],
+    }
 
-        client = openai.OpenAI(
 
-            api_key=openai_api_key,
-            base_url=openai_api_base,
-        )
+@contextmanager
+def _route(endpoint):
+    if endpoint["replicas"] is None:
+        yield endpoint["base_url"]
+        return
+    with endpoint["replicas"].route() as base_url:
+        yield base_url
+
+
+def get_client(base_url, api_key, provider):
+    key = (base_url, api_key, provider)
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                # Retries are owned by agents/rate_limiter.py, not by the SDK.
+                client = openai.OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    max_retries=0,
+                    http_client=_build_http_client(),
+                )
+                _CLIENTS[key] = client
+    return client
+
+
+def get_client_for_model(model_type):
+    # The pooled clients do not retry; call their create() through create_chat_completion().
+    api_config = get_api_config(model_type)
+    return get_client(api_config["base_url"], api_config["api_key"], api_config["provider"])
+
+
+def close_clients():
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        client.close()
+
+
+def _empty_response_backoff(attempt):
+    return random.uniform(0, llm_backoff_base * 2 ** attempt)
+
+
+def _limited_create(endpoint, messages, request):
+    """Run `request(client)` under the model's limits; every retry is routed to a replica afresh."""
+    def routed():
+        with _route(endpoint) as base_url:
+            return request(get_client(base_url, endpoint["api_key"], endpoint["provider"]))
+
+    return call_with_limits(
+        endpoint["name"],
+        endpoint["concurrency"],
+        estimate_tokens(messages, endpoint["max_tokens"]),
+        routed,
+    )
+
+
+@contextmanager
+def _limited_stream(endpoint, messages, request):
+    """_limited_create for `stream=True` requests: the limiter slot and the replica stay taken, and the
+    replica's latency keeps running, until the stream has been read to the end or closed."""
+    def routed():
+        with ExitStack() as stack:
+            base_url = stack.enter_context(_route(endpoint))
+            stream = request(get_client(base_url, endpoint["api_key"], endpoint["provider"]))
+            return stack.pop_all(), stream
+
+    with holding_limits(
+        endpoint["name"],
+        endpoint["concurrency"],
+        estimate_tokens(messages, endpoint["max_tokens"]),
+        routed,
+    ) as (route, stream):
+        with route, stream:
+            yield stream
+
+
+def create_chat_completion(model_type, messages, **kwargs):
+    """`chat.completions.create` for `model_type` under its rate limits and retries; returns the raw response.
+
+    For callers that need the full response or extra request fields (evaluation scripts); the
+    shared clients have SDK retries turned off, so they must not be called directly.
+    """
+    endpoint = _resolve_endpoint(model_type)
+    return _limited_create(endpoint, messages, lambda client: client.chat.completions.create(
+        model=endpoint["model"],
+        messages=messages,
+        **kwargs,
+    ))
+
+
+def _offline_engine(endpoint):
+    return get_offline_engine(endpoint["name"], endpoint["model"])
+
+
+def _create_completion(endpoint, messages, temperature):
+    if endpoint["engine"] == "offline":
+        # Concurrent callers are batched together by the engine's worker thread.
+        return _offline_engine(endpoint).complete(messages, temperature, endpoint["max_tokens"]) or None
+
+    if endpoint["provider"] == "local":
+
         max_attempts = 3
         for attempt in range(max_attempts):
             try:
-                response = client.chat.completions.create(
+                response = _limited_create(endpoint, messages, lambda client: client.chat.completions.create(
 
-                    model=model_full_path,
+                    model=endpoint["model"],
                     messages=messages,
                     temperature=temperature,
                     timeout=30*60,
-                    max_tokens=4096,
+                    max_tokens=endpoint["max_tokens"],
                     
-                )
+                ))
                 result = response.choices[0].message
                 answer = result.content
                 if answer:  # 如果answer不为空，直接返回
@@ -45,6 +208,7 @@ def completion_with_backoff(messages, model_type, backend='OpenRouter', temperat
                 # 如果answer为空且不是最后一次尝试，继续下一次循环
                 if attempt < max_attempts - 1:
                     print("API CALL Empty response received. Retrying...")
+                    time.sleep(_empty_response_backoff(attempt))
                     continue
             except KeyError:
 
@@ -57,18 +221,13 @@ def completion_with_backoff(messages, model_type, backend='OpenRouter', temperat
         return None
 
     else:
-        api_config = get_api_config(model_type)
-        client = openai.OpenAI(
-            api_key=api_config["api_key"],
-            base_url=api_config["base_url"],
-        )
 
         try:
-            response = client.chat.completions.create(
-            model=model_type,
+            response = _limited_create(endpoint, messages, lambda client: client.chat.completions.create(
+            model=endpoint["model"],
             messages=messages,
             temperature=temperature,
-        )
+        ))
             result = response.choices[0].message
             answer = result.content
             return answer
@@ -83,11 +242,36 @@ def completion_with_backoff(messages, model_type, backend='OpenRouter', temperat
             return e
 
 
-def completion_with_log(messages, model_type, enable_log=False):
+def _flight_key(model_type, messages, temperature, max_tokens, cache_key):
+    # Sampled requests are expected to differ, so only deterministic ones are coalesced.
+    if not llm_single_flight or temperature:
+        return None
+    return cache_key or llm_cache.make_key(model_type, messages, temperature, max_tokens)
+
+
+def completion_with_backoff(messages, model_type, backend='OpenRouter', temperature=0.0, use_cache=True):
+
+    endpoint = _resolve_endpoint(model_type)
+    cache_key, cached = llm_cache.lookup(model_type, messages, temperature, endpoint["max_tokens"], use_cache)
+    if cached is not None:
+        return cached
+
+    def request():
+        answer = _create_completion(endpoint, messages, temperature)
+        llm_cache.store(cache_key, model_type, answer)
+        return answer
+
+    flight_key = _flight_key(model_type, messages, temperature, endpoint["max_tokens"], cache_key)
+    if flight_key is None:
+        return request()
+    return _IN_FLIGHT.do(flight_key, request)
+
+
+def completion_with_log(messages, model_type, enable_log=False, use_cache=True):
     if enable_log:
         logging.info('========CHAT HISTORY========')
         print_chat_message(messages)
-    response = completion_with_backoff(messages, model_type)
+    response = completion_with_backoff(messages, model_type, use_cache=use_cache)
     if enable_log:
         logging.info('========RESPONSE========')
         logging.info(response)
@@ -95,20 +279,216 @@ def completion_with_log(messages, model_type, enable_log=False):
     return response
 
 
-def completion_for_4v(messages, model_type):
-    api_config = get_api_config(model_type)
-    client = openai.OpenAI(
-        api_key=api_config["api_key"],
-        base_url=api_config["base_url"],
-    )
+def completion_for_4v(messages, model_type, use_cache=True):
+    cache_key, cached = llm_cache.lookup(model_type, messages, global_temperature, None, use_cache)
+    if cached is not None:
+        return cached
+
+    flight_key = _flight_key(model_type, messages, global_temperature, None, cache_key)
+    if flight_key is None:
+        return _create_completion_for_4v(messages, model_type, cache_key)
+    return _IN_FLIGHT.do(flight_key, lambda: _create_completion_for_4v(messages, model_type, cache_key))
+
+
+def _create_completion_for_4v(messages, model_type, cache_key):
+    endpoint = _resolve_endpoint(model_type)
+
+    if endpoint["engine"] == "offline":
+        answer = _offline_engine(endpoint).complete(messages, global_temperature, endpoint["max_tokens"]) or None
+    else:
+        # Local models are served under their configured name, on whichever replica _route() picks.
+        response = _limited_create(endpoint, messages, lambda client: client.chat.completions.create(
+            model=endpoint["model"],
+            messages=messages,
+            temperature=global_temperature,
+            # max_tokens=2000
+        ))
+
+        result = response.choices[0].message
+        answer = result.content
+    llm_cache.store(cache_key, model_type, answer)
+    return answer
+
+
+def stream_completion(messages, model_type, temperature=0.0, use_cache=True):
+    """Yield the reply as text deltas while the model is still generating.
 
-    response = client.chat.completions.create(
-        model=model_type,
+    A cached reply is yielded as a single delta. The full reply is cached only when the stream
+    is consumed to the end. API errors are raised, not returned.
+    """
+    endpoint = _resolve_endpoint(model_type)
+    cache_key, cached = llm_cache.lookup(model_type, messages, temperature, endpoint["max_tokens"], use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    if endpoint["engine"] == "offline":
+        answer = _offline_engine(endpoint).complete(messages, temperature, endpoint["max_tokens"])
+        llm_cache.store(cache_key, model_type, answer)
+        yield answer
+        return
+
+    request_kwargs = {}
+    if endpoint["provider"] == "local":
+        request_kwargs = {"timeout": 30*60, "max_tokens": endpoint["max_tokens"]}
+
+    parts = []
+    with _limited_stream(endpoint, messages, lambda client: client.chat.completions.create(
+        model=endpoint["model"],
         messages=messages,
-        temperature=global_temperature,
-        # max_tokens=2000
+        temperature=temperature,
+        stream=True,
+        **request_kwargs,
+    )) as stream:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    llm_cache.store(cache_key, model_type, ''.join(parts))
+
+
+def completion_with_stream(messages, model_type, on_delta, backend='OpenRouter', temperature=0.0, use_cache=True):
+    """Streaming counterpart of completion_with_backoff: calls on_delta(text) per chunk, returns the full reply."""
+    parts = []
+    try:
+        for delta in stream_completion(messages, model_type, temperature=temperature, use_cache=use_cache):
+            parts.append(delta)
+            on_delta(delta)
+    except Exception as e:
+        print(e)
+        print(traceback.format_exc())
+        return e
+    return ''.join(parts)
+
+
+def _async_state():
+    loop = asyncio.get_running_loop()
+    state = _ASYNC_STATE.get(loop)
+    if state is None:
+        state = {"clients": {}, "semaphores": {}, "in_flight": AsyncSingleFlight()}
+        _ASYNC_STATE[loop] = state
+    return state
+
+
+def get_async_client(base_url, api_key, provider):
+    clients = _async_state()["clients"]
+    key = (base_url, api_key, provider)
+    if key not in clients:
+        clients[key] = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_http_limits(), http2=_http2_available()),
+        )
+    return clients[key]
+
+
+def _get_semaphore(endpoint):
+    semaphores = _async_state()["semaphores"]
+    key = endpoint["concurrency_key"]
+    if key not in semaphores:
+        semaphores[key] = asyncio.Semaphore(endpoint["concurrency"])
+    return semaphores[key]
+
+
+async def acompletion(messages, model_type, backend='OpenRouter', temperature=0.0, use_cache=True):
+    """Async counterpart of completion_with_backoff with the same return contract."""
+    endpoint = _resolve_endpoint(model_type)
+    cache_key, cached = llm_cache.lookup(model_type, messages, temperature, endpoint["max_tokens"], use_cache)
+    if cached is not None:
+        return cached
+
+    async def request():
+        answer = await _acreate_completion(endpoint, messages, temperature)
+        llm_cache.store(cache_key, model_type, answer)
+        return answer
+
+    flight_key = _flight_key(model_type, messages, temperature, endpoint["max_tokens"], cache_key)
+    if flight_key is None:
+        return await request()
+    return await _async_state()["in_flight"].do(flight_key, request)
+
+
+async def _alimited_create(endpoint, messages, request):
+    async def routed():
+        with _route(endpoint) as base_url:
+            return await request(get_async_client(base_url, endpoint["api_key"], endpoint["provider"]))
+
+    return await acall_with_limits(
+        endpoint["name"],
+        endpoint["concurrency"],
+        estimate_tokens(messages, endpoint["max_tokens"]),
+        routed,
     )
 
-    result = response.choices[0].message
-    answer = result.content
-    return answer
+
+async def _acreate_completion(endpoint, messages, temperature):
+    if endpoint["engine"] == "offline":
+        # No semaphore here: the more requests are queued at once, the bigger the vLLM batch.
+        future = _offline_engine(endpoint).submit(messages, temperature, endpoint["max_tokens"])
+        return await asyncio.wrap_future(future) or None
+
+    async with _get_semaphore(endpoint):
+        if endpoint["provider"] == "local":
+            max_attempts = 3
+            for attempt in range(max_attempts):
+                try:
+                    response = await _alimited_create(endpoint, messages, lambda client: client.chat.completions.create(
+                        model=endpoint["model"],
+                        messages=messages,
+                        temperature=temperature,
+                        timeout=30*60,
+                        max_tokens=endpoint["max_tokens"],
+                    ))
+                    answer = response.choices[0].message.content
+                    if answer:
+                        return answer
+                    if attempt < max_attempts - 1:
+                        print("API CALL Empty response received. Retrying...")
+                        await asyncio.sleep(_empty_response_backoff(attempt))
+                except KeyError:
+                    return None
+                except openai.BadRequestError as e:
+                    return e
+            return None
+
+        try:
+            response = await _alimited_create(endpoint, messages, lambda client: client.chat.completions.create(
+                model=endpoint["model"],
+                messages=messages,
+                temperature=temperature,
+            ))
+            return response.choices[0].message.content
+        except Exception as e:
+            print(e)
+            print(traceback.format_exc())
+            return e
+
+
+async def agather_completions(messages_list, model_type, backend='OpenRouter', temperature=0.0, use_cache=True):
+    return await asyncio.gather(*[
+        acompletion(messages, model_type, backend=backend, temperature=temperature, use_cache=use_cache)
+        for messages in messages_list
+    ])
+
+
+async def aclose_clients():
+    clients = _async_state()["clients"]
+    for client in clients.values():
+        await client.close()
+    clients.clear()
+
+
+def completion_batch(messages_list, model_type, backend='OpenRouter', temperature=0.0, use_cache=True):
+    """Run many completions concurrently from synchronous code; results keep the input order."""
+    async def _run():
+        try:
+            return await agather_completions(messages_list, model_type, backend=backend, temperature=temperature,
+                                             use_cache=use_cache)
+        finally:
+            await aclose_clients()
+
+    return asyncio.run(_run())
@@ -1,9 +1,17 @@
 import ast
 import os
 import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agents.chat_context import compact_history
+from agents.code_preflight import check_code
+from agents.config.execution import plot_candidates, plot_candidate_temperature
 from agents.generic_agent import GenericAgent
-from agents.openai_chatComplete import completion_with_backoff
-from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
+from agents.openai_chatComplete import completion_with_backoff, completion_with_stream
+from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code, CodeBlockStream
+from agents.utils import run_code_result
 from agents.utils import print_filesys_struture
 from agents.utils import change_directory
 from agents.plot_agent.prompt import INITIAL_SYSTEM_PROMPT, INITIAL_USER_PROMPT, VIS_SYSTEM_PROMPT, VIS_USER_PROMPT, ERROR_PROMPT, ZERO_SHOT_COT_PROMPT
@@ -17,6 +25,24 @@ class PlotAgent(GenericAgent):
         self.chat_history = []
         self.query = kwargs.get('query', '')
         self.data_information = kwargs.get('data_information', None)
+        # Optional callable(delta=None, reset=False, code_block=None) fed while replies stream in.
+        self.stream_callback = kwargs.get('stream_callback', None)
+        # Best-of-N: >1 generates and runs that many candidates at once for the first attempt.
+        self.candidates = kwargs.get('candidates', plot_candidates)
+
+    def _complete(self, messages, model_type):
+        if self.stream_callback is None:
+            return completion_with_backoff(messages, model_type)
+
+        self.stream_callback(reset=True)
+        code_blocks = CodeBlockStream()
+
+        def on_delta(delta):
+            self.stream_callback(delta=delta)
+            for code_block in code_blocks.feed(delta):
+                self.stream_callback(code_block=code_block)
+
+        return completion_with_stream(messages, model_type, on_delta)
 
     def _workspace_path(self):
         if isinstance(self.workspace, dict):
@@ -92,6 +118,11 @@ class PlotAgent(GenericAgent):
         return code.rstrip() + f"\n\n{candidate}()\n"
 
     def generate(self, user_prompt, model_type, query_type, file_name):
+        messages = self._prompt_messages(user_prompt, query_type, file_name)
+        self.chat_history = self.chat_history + messages
+        return self._complete(messages, model_type)
+
+    def _prompt_messages(self, user_prompt, query_type, file_name):
 
         workspace_structure = print_filesys_struture(self._workspace_path())
         
@@ -112,8 +143,7 @@ class PlotAgent(GenericAgent):
             messages.append({"role": "user", "content": fill_in_placeholders(VIS_USER_PROMPT, information)})
             # print(messages)
 
-        self.chat_history = self.chat_history + messages
-        return completion_with_backoff(messages, model_type)
+        return messages
 
     def get_code(self, response):
 
@@ -144,7 +174,130 @@ class PlotAgent(GenericAgent):
                     return '\n'.join(code_lines)
         return all_code_blocks_combined
 
-    def run(self, query=None, model_type='google/gemini-3-flash-preview', query_type='initial', file_name='plot.png', queries=None, individual_workspace=None):
+    def _extract_code(self, result, model_type, image_file, query, first_attempt):
+        if model_type != 'gpt-4':
+            code = self.get_code(result)
+            if code.strip() == '':
+                code = self.get_code2(result,image_file) #第二次尝试获得代码
+                if code.strip() == '':
+                    code = result  #只能用原始回答
+                    if code.strip() == '' and first_attempt: #有可能是因为没有extend query写好了代码，所以他不写代码
+                        code = self.get_code(query)
+        else:
+            code = self.get_code(result)
+        code = self._strip_blocking_show_calls(code)
+        return self._ensure_entrypoint(code)
+
+    def _make_sandbox(self, workspace_path, image_file):
+        # A private copy of the workspace's files, so candidates running side by side can neither
+        # change the shared inputs nor see each other's images or outputs.
+        sandbox = tempfile.mkdtemp(prefix='plot_candidate_')
+        for name in os.listdir(workspace_path):
+            if name == image_file or name.startswith('code_action_'):
+                continue
+            source = os.path.join(workspace_path, name)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(sandbox, name))
+            elif os.path.isfile(source):
+                shutil.copy2(source, os.path.join(sandbox, name))
+        return sandbox
+
+    @staticmethod
+    def _file_state(directory):
+        """{relative path: (size, mtime_ns)} of every file under `directory`."""
+        state = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                info = os.lstat(path)
+                state[os.path.relpath(path, directory)] = (info.st_size, info.st_mtime_ns)
+        return state
+
+    def _run_candidate(self, index, messages, model_type, query_type, image_file, query, stop, claim):
+        temperature = 0.0 if index == 0 else plot_candidate_temperature
+        result = completion_with_backoff(messages, model_type, temperature=temperature)
+        outcome = {'index': index, 'result': result, 'code': '', 'log': '', 'error': None, 'won': False}
+        if not isinstance(result, str):
+            outcome['log'] = 'TOO LONG FOR MODEL'
+            return outcome
+
+        code = self._extract_code(result, model_type, image_file, query, True)
+        outcome['code'] = code
+        file_name = f'code_action_{self._sanitize_model_type(model_type)}_{query_type}_0.py'
+        outcome['error'] = check_code(code, self._workspace_path(), target_file=image_file, file_name=file_name)
+        if outcome['error'] is not None:
+            outcome['log'] = outcome['error']
+            return outcome
+        if stop.is_set():
+            return outcome
+
+        sandbox = self._make_sandbox(self._workspace_path(), image_file)
+        try:
+            inputs = self._file_state(sandbox)
+            with open(os.path.join(sandbox, file_name), 'w', encoding='utf-8') as f:
+                f.write(code)
+            execution = run_code_result(sandbox, file_name, cancel=stop)
+            outcome['log'] = execution.output
+            if not is_run_code_success(execution):
+                outcome['error'] = get_error_message(execution)
+            elif not self._target_image_exists(sandbox, image_file):
+                outcome['log'] = outcome['log'] + '\n' + 'No plot generated.'
+                outcome['error'] = f'No plot generated. When you complete a plot, remember to save it to a png file. The file name should be """{image_file}""".'
+            else:
+                outcome['won'] = claim(sandbox, inputs)
+        finally:
+            shutil.rmtree(sandbox, ignore_errors=True)
+        return outcome
+
+    def _best_of_n(self, messages, model_type, query_type, image_file, query, candidates):
+        """Generate and execute `candidates` answers concurrently; the first that saves the plot wins.
+
+        Returns (winning outcome, None), or (None, outcome of the temperature-0 candidate) when none worked.
+        """
+        workspace_path = self._workspace_path()
+        stop = threading.Event()
+        lock = threading.Lock()
+
+        def claim(sandbox, inputs):
+            with lock:
+                if stop.is_set():
+                    return False
+                # Publish the winner as if it had run in the workspace (its script, log, image and any
+                # other file it created or changed), then kill the other scripts.
+                for relative, state in self._file_state(sandbox).items():
+                    if inputs.get(relative) == state:
+                        continue
+                    target = os.path.join(workspace_path, relative)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copy2(os.path.join(sandbox, relative), target)
+                stop.set()
+                return True
+
+        executor = ThreadPoolExecutor(max_workers=candidates)
+        futures = [
+            executor.submit(self._run_candidate, index, messages, model_type, query_type, image_file, query, stop, claim)
+            for index in range(candidates)
+        ]
+        try:
+            for future in as_completed(futures):
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    print(f'Plot candidate failed: {e!r}')
+                    continue
+                if outcome['won']:
+                    print(f"========Plot AGENT best-of-{candidates}: candidate {outcome['index']} succeeded========")
+                    return outcome, None
+            try:
+                return None, futures[0].result()
+            except Exception as e:
+                return None, {'index': 0, 'result': e, 'code': '', 'log': 'TOO LONG FOR MODEL', 'error': None, 'won': False}
+        finally:
+            stop.set()
+            # Losers still waiting on the model finish in the background and skip execution.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, query=None, model_type='google/gemini-3-flash-preview', query_type='initial', file_name='plot.png', queries=None, individual_workspace=None, candidates=None):
         try_count = 0
         image_file = file_name
         code = ''
@@ -155,23 +308,32 @@ class PlotAgent(GenericAgent):
                 query = queries
         if query is None:
             query = self.query
-        result = self.generate(query, model_type=model_type, query_type=query_type, file_name=file_name)
+        candidates = self.candidates if candidates is None else candidates
+        if candidates > 1:
+            messages = self._prompt_messages(query, query_type, file_name)
+            self.chat_history = self.chat_history + messages
+            winner, first = self._best_of_n(messages, model_type, query_type, image_file, query, candidates)
+            if winner is not None:
+                self.chat_history.append({"role": "assistant", "content": winner['result']})
+                return winner['log'], winner['code']
+            # Nothing worked: the temperature-0 candidate becomes the first attempt of the repair loop.
+            result, code = first['result'], first['code']
+            if not isinstance(result, str):
+                return 'TOO LONG FOR MODEL', code
+            self.chat_history.append({"role": "assistant", "content": result})
+            self.chat_history.append({"role": "user", "content": fill_in_placeholders(ERROR_PROMPT,
+                                                                                  {'error_message': first['error'],
+                                                                                   'data_information': self.data_information})})
+            log = first['log']
+            try_count = 1
+            result = self._complete(compact_history(self.chat_history, model_type), model_type)
+        else:
+            result = self.generate(query, model_type=model_type, query_type=query_type, file_name=file_name)
         while try_count < 4:
             
             if not isinstance(result, str):  # 如果返回的不是字符串，那么就是出错了
                 return 'TOO LONG FOR MODEL', code
-            if model_type != 'gpt-4':
-                code = self.get_code(result)
-                if code.strip() == '':
-                    code = self.get_code2(result,image_file) #第二次尝试获得代码
-                    if code.strip() == '':
-                        code = result  #只能用原始回答
-                        if code.strip() == '' and try_count == 0: #有可能是因为没有extend query写好了代码，所以他不写代码
-                            code = self.get_code(query)
-            else:
-                code = self.get_code(result)
-            code = self._strip_blocking_show_calls(code)
-            code = self._ensure_entrypoint(code)
+            code = self._extract_code(result, model_type, image_file, query, try_count == 0)
             self.chat_history.append({"role": "assistant", "content": result if result.strip() != '' else ''})
 
 
@@ -180,10 +342,16 @@ class PlotAgent(GenericAgent):
             workspace_path = self._workspace_path()
             with open(os.path.join(workspace_path, file_name), 'w', encoding='utf-8') as f:
                 f.write(code)
-            error = None
-            log = run_code(workspace_path, file_name)
+            # Code that cannot work (syntax, undefined names, missing modules, no savefig) goes back to the model without a run.
+            error = check_code(code, workspace_path, target_file=image_file, file_name=file_name)
+            if error is not None:
+                log = error
+                execution = None
+            else:
+                execution = run_code_result(workspace_path, file_name)
+                log = execution.output
 
-            if is_run_code_success(log):
+            if execution is not None and is_run_code_success(execution):
                 if not self._target_image_exists(workspace_path, image_file):
                     log = log + '\n' + 'No plot generated.'
                     
@@ -191,20 +359,20 @@ class PlotAgent(GenericAgent):
                                                                                           {'error_message': f'No plot generated. When you complete a plot, remember to save it to a png file. The file name should be """{image_file}""".',
                                                                                            'data_information': self.data_information})})
                     try_count += 1
-                    result = completion_with_backoff(self.chat_history, model_type=model_type)
+                    result = self._complete(compact_history(self.chat_history, model_type), model_type)
 
 
                 else:
                     return log, code
 
             else:
-                error = get_error_message(log) if error is None else error
+                error = get_error_message(execution) if error is None else error
                 # TODO error prompt
                 self.chat_history.append({"role": "user", "content": fill_in_placeholders(ERROR_PROMPT,
                                                                                           {'error_message': error,
                                                                                            'data_information': self.data_information})})
                 try_count += 1
-                result = completion_with_backoff(self.chat_history, model_type=model_type)
+                result = self._complete(compact_history(self.chat_history, model_type), model_type)
                 # print(result)
 
         return log, ''
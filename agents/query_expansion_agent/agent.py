@@ -1,5 +1,5 @@
 from agents.generic_agent import GenericAgent
-from agents.openai_chatComplete import completion_with_log
+from agents.openai_chatComplete import completion_with_log, completion_with_stream
 from agents.utils import fill_in_placeholders
 from agents.query_expansion_agent.prompt import SYSTEM_PROMPT, EXPERT_USER_PROMPT
 
@@ -8,6 +8,7 @@ class QueryExpansionAgent(GenericAgent):
         super().__init__(workspace, **kwargs)
         self.chat_history = []
         self.model_type = kwargs.get('model_type', 'gpt-4o')
+        self.stream_callback = kwargs.get('stream_callback', None)
 
     def run(self, instruction, **kwargs):
         expanded_queries = []
@@ -19,7 +20,12 @@ class QueryExpansionAgent(GenericAgent):
         messages = []
         messages.append({"role": "system", "content": fill_in_placeholders(SYSTEM_PROMPT, information)})
         messages.append({"role": "user", "content": fill_in_placeholders(EXPERT_USER_PROMPT, information)})
-        expanded_query_instruction = completion_with_log(messages, self.model_type)
+        if self.stream_callback is None:
+            expanded_query_instruction = completion_with_log(messages, self.model_type)
+        else:
+            self.stream_callback(reset=True)
+            expanded_query_instruction = completion_with_stream(
+                messages, self.model_type, lambda delta: self.stream_callback(delta=delta))
         expanded_queries.append(expanded_query_instruction)
 
         return expanded_queries
@@ -0,0 +1,237 @@
+import asyncio
+import email.utils
+import threading
+import time
+from contextlib import contextmanager
+
+import openai
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from agents.config.openai import llm_rate_limits, llm_default_rpm, llm_default_tpm
+from agents.config.openai import llm_max_retries, llm_backoff_base, llm_backoff_max
+
+
+class TokenBucket:
+    """Per-minute budget that refills continuously. A rate of 0 means unlimited."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Take `amount` from the bucket and return how many seconds to wait before spending it."""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class ModelLimiter:
+    """Request/token budgets plus an AIMD concurrency window shared by every caller of one model.
+
+    A 429 halves the window and pauses the model for the server's Retry-After; each success
+    grows the window again by roughly one slot per window's worth of requests.
+    """
+
+    def __init__(self, rpm, tpm, max_concurrency):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.cond = threading.Condition()
+
+    def try_enter(self):
+        with self.cond:
+            if self.in_flight < max(1, int(self.concurrency)):
+                self.in_flight += 1
+                return True
+            return False
+
+    def enter(self):
+        with self.cond:
+            while self.in_flight >= max(1, int(self.concurrency)):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def leave(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def delay(self, estimated_tokens):
+        pause = self.blocked_until - time.monotonic()
+        return max(pause, self.requests.reserve(1), self.tokens.reserve(estimated_tokens), 0.0)
+
+    def on_success(self):
+        with self.cond:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / max(self.concurrency, 1.0))
+
+    def on_throttle(self, retry_after):
+        with self.cond:
+            self.concurrency = max(1.0, self.concurrency / 2)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + (retry_after or 0.0))
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(model, max_concurrency):
+    limiter = _LIMITERS.get(model)
+    if limiter is None:
+        with _LIMITERS_LOCK:
+            limiter = _LIMITERS.get(model)
+            if limiter is None:
+                budget = llm_rate_limits.get(model, {})
+                limiter = ModelLimiter(
+                    budget.get("rpm", llm_default_rpm),
+                    budget.get("tpm", llm_default_tpm),
+                    budget.get("concurrency", max_concurrency),
+                )
+                _LIMITERS[model] = limiter
+    return limiter
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Rough token count (4 characters per token) used to charge the tokens-per-minute bucket."""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                else:
+                    images += 1
+    return chars // 4 + images * 1000 + (max_tokens or 0)
+
+
+def is_retryable(exc):
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def retry_after_seconds(exc):
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None  # Malformed header: fall back to the normal backoff.
+    return max(0.0, retry_at.timestamp() - time.time()) if retry_at else None
+
+
+_jittered_backoff = wait_random_exponential(multiplier=llm_backoff_base, max=llm_backoff_max)
+
+
+def _wait(retry_state):
+    # Never retry sooner than the server asked; add jittered exponential backoff on top.
+    retry_after = retry_after_seconds(retry_state.outcome.exception()) or 0.0
+    return retry_after + _jittered_backoff(retry_state)
+
+
+def _record_failure(limiter, exc):
+    if isinstance(exc, openai.RateLimitError) or getattr(exc, "status_code", None) == 429:
+        limiter.on_throttle(retry_after_seconds(exc))
+
+
+def _retrying(cls):
+    return cls(
+        stop=stop_after_attempt(llm_max_retries),
+        wait=_wait,
+        retry=retry_if_exception(is_retryable),
+        reraise=True,
+    )
+
+
+def call_with_limits(model, max_concurrency, estimated_tokens, request):
+    """Run `request()` within the model's budgets, retrying throttled and transient failures."""
+    limiter = get_limiter(model, max_concurrency)
+    for attempt in _retrying(Retrying):
+        with attempt:
+            # Wait for the budget before taking a slot, so a waiting caller does not hold one.
+            time.sleep(limiter.delay(estimated_tokens))
+            limiter.enter()
+            try:
+                result = request()
+            except Exception as e:
+                _record_failure(limiter, e)
+                raise
+            finally:
+                limiter.leave()
+            limiter.on_success()
+    return result
+
+
+@contextmanager
+def holding_limits(model, max_concurrency, estimated_tokens, request):
+    """call_with_limits for results that are used after `request()` returns (streamed replies).
+
+    Opening is retried the same way, but the slot stays taken until the with block ends.
+    """
+    limiter = get_limiter(model, max_concurrency)
+    for attempt in _retrying(Retrying):
+        with attempt:
+            time.sleep(limiter.delay(estimated_tokens))
+            limiter.enter()
+            try:
+                result = request()
+            except Exception as e:
+                _record_failure(limiter, e)
+                limiter.leave()
+                raise
+    try:
+        yield result
+    finally:
+        limiter.leave()
+    limiter.on_success()
+
+
+async def acall_with_limits(model, max_concurrency, estimated_tokens, request):
+    """Async variant of call_with_limits; `request` returns an awaitable."""
+    limiter = get_limiter(model, max_concurrency)
+    async for attempt in _retrying(AsyncRetrying):
+        with attempt:
+            await asyncio.sleep(limiter.delay(estimated_tokens))
+            while not limiter.try_enter():
+                await asyncio.sleep(0.05)
+            try:
+                result = await request()
+            except Exception as e:
+                _record_failure(limiter, e)
+                raise
+            finally:
+                limiter.leave()
+            limiter.on_success()
+    return result
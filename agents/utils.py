@@ -1,16 +1,20 @@
-from collections import defaultdict
-from copy import deepcopy
 import fnmatch
+from functools import lru_cache
 import logging
 import re
+import signal
 from typing import Dict
 
 import os
 from contextlib import contextmanager
 
+from agents.code_execution import ExecutionResult, run_python
+from agents.workspace_tree import render_workspace_tree
+
 
 @contextmanager
 def change_directory(directory):
+    # os.chdir is process-wide and races with other threads; code execution passes cwd= instead.
     current_directory = os.getcwd()
     
     try:
@@ -34,14 +38,56 @@ def get_workspace_structure(work_directory):
         return result
     return generate_directory_structure(work_directory)
 
-def fill_in_placeholders(prompt_messages,placeholders: dict):
-
-    filled_messages = deepcopy(prompt_messages)
-    
-    for key, value in placeholders.items():
-        if value is not None:
-            filled_messages = filled_messages.replace("{{" + str(key) + "}}", str(value))
-    return filled_messages
+class PromptTemplate:
+    """A prompt with `{{name}}` slots, split once into literal text and slot names."""
+
+    slot_pattern = re.compile(r'\{\{([^{}]*)\}\}')
+
+    def __init__(self, text):
+        self.text = text
+        self.literals = []
+        self.slots = []
+        position = 0
+        for match in self.slot_pattern.finditer(text):
+            self.literals.append(text[position:match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.literals.append(text[position:])
+        self.placeholders = frozenset(self.slots)
+        self.pairs = tuple(zip(self.slots, self.literals[1:]))
+        self.raw_slots = {name: '{{' + name + '}}' for name in self.slots}
+
+    def render(self, placeholders: dict, strict=False):
+        if strict:
+            given = {str(key) for key, value in placeholders.items() if value is not None}
+            missing = self.placeholders - given
+            unused = given - self.placeholders
+            if missing:
+                raise KeyError(f'Prompt placeholders without a value: {sorted(missing)}')
+            if unused:
+                raise ValueError(f'Values for placeholders the prompt does not have: {sorted(unused)}')
+        if any(type(key) is not str for key in placeholders):
+            placeholders = {str(key): value for key, value in placeholders.items()}
+
+        # None values and unknown names leave the slot as it is, like the old per-key str.replace.
+        parts = [self.literals[0]]
+        append = parts.append
+        for name, literal in self.pairs:
+            value = placeholders.get(name)
+            append(self.raw_slots[name] if value is None else str(value))
+            append(literal)
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=512)
+def compile_prompt(prompt_messages) -> PromptTemplate:
+    return PromptTemplate(prompt_messages)
+
+
+def fill_in_placeholders(prompt_messages, placeholders: dict, strict=False):
+    # Prompts are module-level constants, so each one is parsed once and then rendered with a single join.
+    # strict=True raises on slots without a value and on values without a slot.
+    return compile_prompt(prompt_messages).render(placeholders, strict=strict)
 
 def _check_ignorement(path:str,ignored_list)->bool:
     for pattern in ignored_list:
@@ -49,38 +95,11 @@ def _check_ignorement(path:str,ignored_list)->bool:
             return True
     return False
 
-def print_filesys_struture(work_directory,return_root=False,max_entry_nums_for_level=100,ignored_list=[])->str:
-    full_repr = ''
-    if return_root:
-        full_repr += f'Global Root Work Directory: {work_directory}\n'
-
-    folder_counts =  defaultdict(lambda: 0)
-    for root, dirs, files in os.walk(work_directory):
-        if _check_ignorement(root,ignored_list):
-            continue
-        level = root.replace(work_directory, '').count(os.sep)
-        indent = ' ' * 4 * (level)
-        
-        folder_counts[root] += 1
-        if folder_counts[root] > max_entry_nums_for_level:
-            full_repr += f'{indent}`wrapped`\n'
-        
-        full_repr += f'{indent}- {os.path.basename(root)}/\n'
-        
-        idx = 0
-        subindent = ' ' * 4 * (level + 1) + '- '
-        for f in files:
-            if _check_ignorement(f,ignored_list):
-                continue
-            
-            idx += 1
-            if idx > max_entry_nums_for_level:
-                full_repr += f'{subindent}`wrapped`\n'
-                break
-            full_repr += f'{subindent}{f}\n'
-
-
-    return full_repr
+def print_filesys_struture(work_directory,return_root=False,max_entry_nums_for_level=100,ignored_list=[],max_depth=None,max_lines=None)->str:
+    # Rendered from a cached index that only re-lists directories whose mtime changed;
+    # max_depth/max_lines default to WORKSPACE_TREE_MAX_DEPTH/WORKSPACE_TREE_MAX_LINES (0 = unlimited).
+    return render_workspace_tree(work_directory, return_root, max_entry_nums_for_level, ignored_list,
+                                 _check_ignorement, max_depth=max_depth, max_lines=max_lines)
 
 
 def get_code(response):
@@ -92,25 +111,87 @@ def get_code(response):
     return all_code_blocks_combined
 
 
-def run_code(workspace, code_file, log_file=None)->str:
+class CodeBlockStream:
+    """Incrementally extract ```python blocks from a streamed reply, as soon as each fence closes."""
+
+    pattern = re.compile(r'```python\s*([\s\S]+?)\s*```', re.MULTILINE)
+
+    def __init__(self):
+        self.text = ''
+        self.position = 0
+        self.blocks = []
+
+    def feed(self, delta):
+        self.text += delta
+        completed = []
+        while True:
+            match = self.pattern.search(self.text, self.position)
+            if match is None:
+                break
+            completed.append(match.group(1))
+            self.position = match.end()
+        self.blocks.extend(completed)
+        return completed
+
+
+def run_code_result(workspace, code_file, log_file=None, env=None, timeout=None, cancel=None):
+    """Like run_code, but returns the sandbox's ExecutionResult (exit code, duration, peak RSS, ...)."""
     if log_file is None:
         log_file = code_file + '.log'
 
-    with change_directory(workspace):
-        os.system(f'python "{code_file}" > "{log_file}" 2>&1')
-        with open(log_file,'r') as f:
-            log = f.read()
+    # Runs in the warm interpreter pool with cwd= (no os.chdir), output interleaved as with 2>&1.
+    result = run_python(code_file, workspace, merge_stderr=True, timeout=timeout, env=env, cancel=cancel)
+    with open(os.path.join(workspace, log_file), 'w') as f:
+        f.write(result.output)
+
+    return result
+
+
+def run_code(workspace, code_file, log_file=None, env=None, timeout=None)->str:
+    return run_code_result(workspace, code_file, log_file, env=env, timeout=timeout).output
 
-    return log
+
+def _killed_message(result):
+    if result.cancelled:
+        return 'Execution was cancelled.'
+    if result.timed_out:
+        return 'TimeoutError: the script exceeded the wall-clock time limit and was killed.'
+    if result.returncode == -getattr(signal, 'SIGXCPU', 0):
+        return 'TimeoutError: the script exceeded the CPU time limit and was killed.'
+    return f'The script was killed by signal {-result.returncode}.'
 
 
 def is_run_code_success(log):
+    # An ExecutionResult is judged by its exit status; plain log strings by scanning for errors.
+    if isinstance(log, ExecutionResult):
+        return log.success
     if 'Traceback (most recent call last):' in log or 'Error:' in log:
         return False
     else:
         return True
 
+# Lines of output handed to the repair prompt when a failed run recorded no exception.
+_ERROR_TAIL_LINES = 20
+
+
+def _exit_message(result):
+    # e.g. sys.exit("bye") or os._exit(3): no exception record, but the reason is usually in stderr.
+    tail = result.output.strip().splitlines()[-_ERROR_TAIL_LINES:]
+    message = f'The script exited with status {result.returncode}.'
+    if tail:
+        message += ' Last lines of its output:\n' + '\n'.join(tail)
+    return message
+
+
 def get_error_message(log):
+    if isinstance(log, ExecutionResult):
+        if log.killed:
+            return _killed_message(log)
+        if log.exception:
+            return log.format_exception()
+        result, log = log, log.output
+        if not result.success and 'Traceback (most recent call last):' not in log and 'Error:' not in log:
+            return _exit_message(result)
     if 'Traceback (most recent call last):' in log:
         return log.split('Traceback (most recent call last):')[1]
     elif 'Error:' in log:
@@ -19,7 +19,8 @@ from .prompt import (
     CAP_NO_PRESERVE_CORRECT_PARTS_SYSTEM_PROMPT,
     CAP_NO_PRESERVE_CORRECT_PARTS_USER_PROMPT,
 )
-from agents.openai_chatComplete import completion_for_4v
+from agents.config.openai import global_temperature
+from agents.openai_chatComplete import completion_for_4v, completion_with_stream
 from agents.utils import fill_in_placeholders
 from agents.generic_agent import GenericAgent
 
@@ -55,6 +56,7 @@ class VisualRefineAgent(GenericAgent):
         self.code = kwargs.get('code', '')
         self.query = kwargs.get('query', '')
         self.prompt_variant = kwargs.get('prompt_variant', 'default')
+        self.stream_callback = kwargs.get('stream_callback', None)
 
     def _get_prompts(self):
         prompt_map = {
@@ -102,6 +104,12 @@ class VisualRefineAgent(GenericAgent):
                                     },
                                     ]
                         })
-        visual_feedback = completion_for_4v(messages, model_type)
-
+        if self.stream_callback is None:
+            return completion_for_4v(messages, model_type)
+
+        self.stream_callback(reset=True)
+        visual_feedback = completion_with_stream(
+            messages, model_type, lambda delta: self.stream_callback(delta=delta), temperature=global_temperature)
+        if isinstance(visual_feedback, Exception):
+            raise visual_feedback
         return visual_feedback
\ No newline at end of file
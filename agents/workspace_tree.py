@@ -0,0 +1,150 @@
+"""Cached directory index behind `print_filesys_struture`.
+
+Agents render the workspace tree into nearly every prompt, often for a shared parent workspace
+with thousands of files. The index keeps each directory's listing together with the directory's
+mtime; a later call only stats the directories and re-lists the ones whose mtime moved (an entry
+was added, removed or renamed), and reuses the previously rendered text when nothing changed.
+The output is identical to the old `os.walk` rendering.
+"""
+import os
+import threading
+import time
+
+from agents.config.workspace import workspace_tree_max_depth, workspace_tree_max_lines
+
+# A directory modified this recently may change again within the same mtime tick; list it again next time.
+_RACY_SECONDS = 2.0
+
+
+class _DirNode:
+    __slots__ = ('mtime', 'missing', 'dirs', 'files', 'children')
+
+    def __init__(self):
+        self.mtime = None
+        self.missing = True
+        self.dirs = []       # Subdirectories in listing order, as os.walk reports them.
+        self.files = []
+        self.children = {}   # Subdirectories os.walk descends into (not symlinks) -> _DirNode.
+
+
+def _scan(node, path):
+    dirs, files, children = [], [], {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                files.append(entry.name)
+                continue
+            dirs.append(entry.name)
+            try:
+                is_symlink = entry.is_symlink()
+            except OSError:
+                is_symlink = False
+            if not is_symlink:
+                children[entry.name] = node.children.get(entry.name) or _DirNode()
+    node.dirs, node.files, node.children = dirs, files, children
+
+
+def _refresh(node, path):
+    """Bring `node` up to date with `path`; returns True if any listing below it changed."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        changed = not node.missing
+        node.mtime, node.missing, node.dirs, node.files, node.children = None, True, [], [], {}
+        return changed
+
+    changed = False
+    node.missing = False
+    if node.mtime is None or node.mtime != mtime:
+        try:
+            _scan(node, path)
+        except OSError:
+            node.dirs, node.files, node.children = [], [], {}
+        changed = True
+        racy = time.time() - mtime / 1e9 < _RACY_SECONDS
+        node.mtime = None if racy else mtime
+
+    for name, child in node.children.items():
+        if _refresh(child, os.path.join(path, name)):
+            changed = True
+    return changed
+
+
+class WorkspaceTree:
+    def __init__(self):
+        self.root = _DirNode()
+        self.version = 0
+        self.rendered = {}
+        self.lock = threading.Lock()
+
+    def render(self, work_directory, return_root, max_entries, ignored_list, check_ignorement, max_depth, max_lines):
+        with self.lock:
+            if _refresh(self.root, work_directory):
+                self.version += 1
+            key = (work_directory, return_root, max_entries, tuple(ignored_list), max_depth, max_lines)
+            cached = self.rendered.get(key)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            text = self._render(work_directory, return_root, max_entries, ignored_list, check_ignorement,
+                                max_depth, max_lines)
+            self.rendered[key] = (self.version, text)
+            return text
+
+    def _render(self, work_directory, return_root, max_entries, ignored_list, check_ignorement, max_depth, max_lines):
+        lines = []
+        if return_root:
+            lines.append(f'Global Root Work Directory: {work_directory}\n')
+
+        def walk(node, root, depth):
+            if max_lines and len(lines) >= max_lines:
+                return False
+            # Same traversal and indentation as the original os.walk loop, ignored roots included.
+            if not check_ignorement(root, ignored_list):
+                level = root.replace(work_directory, '').count(os.sep)
+                indent = ' ' * 4 * (level)
+                lines.append(f'{indent}- {os.path.basename(root)}/\n')
+                subindent = ' ' * 4 * (level + 1) + '- '
+                idx = 0
+                for f in node.files:
+                    if check_ignorement(f, ignored_list):
+                        continue
+                    if max_lines and len(lines) >= max_lines:
+                        return False
+                    idx += 1
+                    if idx > max_entries:
+                        lines.append(f'{subindent}`wrapped`\n')
+                        break
+                    lines.append(f'{subindent}{f}\n')
+                if max_depth and depth >= max_depth and node.dirs:
+                    lines.append(f'{subindent}`wrapped`\n')
+            if max_depth and depth >= max_depth:
+                return True  # Subdirectories past the depth budget stay collapsed.
+            for name in node.dirs:
+                child = node.children.get(name)
+                if child is not None and not walk(child, os.path.join(root, name), depth + 1):
+                    return False
+            return True
+
+        if not self.root.missing:
+            if not walk(self.root, work_directory, 0):
+                lines.append('`wrapped`\n')
+        return ''.join(lines)
+
+
+_TREES = {}
+_TREES_LOCK = threading.Lock()
+
+
+def render_workspace_tree(work_directory, return_root, max_entries, ignored_list, check_ignorement,
+                          max_depth=None, max_lines=None):
+    if max_depth is None:
+        max_depth = workspace_tree_max_depth
+    if max_lines is None:
+        max_lines = workspace_tree_max_lines
+    with _TREES_LOCK:
+        tree = _TREES.setdefault(os.path.abspath(work_directory), WorkspaceTree())
+    return tree.render(work_directory, return_root, max_entries, ignored_list, check_ignorement, max_depth, max_lines)
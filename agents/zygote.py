@@ -0,0 +1,235 @@
+"""Fork server for running generated scripts without paying interpreter start-up and imports each time.
+
+The zygote is a single-threaded process that imports the heavy libraries once and then serves
+requests on a Unix socket. For every script it forks a supervisor, which forks the child that
+actually runs the script (as `python script.py` would, in its own session) and reports the exit
+status back over the socket. The zygote itself never waits on anything but `accept()`.
+
+Run as `python agents/zygote.py <socket path> <comma-separated modules to preload>`; apart from
+those modules it only imports the standard library. agents/code_execution.py manages it, and
+also uses `python agents/zygote.py --run <request json>` to run one script the same way in a
+fresh interpreter where fork() is not available.
+
+Uncaught exceptions go through a sys.excepthook that prints the usual traceback and also writes
+it as JSON (type, message, offending line number, frames) to the request's `exception` file.
+"""
+import gc
+import importlib
+import json
+import os
+import runpy
+import signal
+import socket
+import sys
+import traceback
+
+
+def _preload(modules):
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # Optional libraries: a script that needs one will report the ImportError itself.
+            pass
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg')
+    # Keep preloaded objects out of the collector so forked children share their pages.
+    gc.collect()
+    gc.freeze()
+
+
+def _script_traceback(tb, script):
+    # Drop the runpy frames so the traceback looks like the one `python script.py` prints.
+    while tb is not None and os.path.abspath(tb.tb_frame.f_code.co_filename) != script:
+        tb = tb.tb_next
+    return tb
+
+
+def _exception_record(exc_type, exc_value, tb, script):
+    frames = [
+        {'file': frame.filename, 'lineno': frame.lineno, 'function': frame.name, 'line': frame.line}
+        for frame in traceback.extract_tb(tb)
+    ]
+    script_frames = [frame for frame in frames if os.path.abspath(frame['file']) == script]
+    lineno = script_frames[-1]['lineno'] if script_frames else None
+    line = script_frames[-1]['line'] if script_frames else None
+    if isinstance(exc_value, SyntaxError) and exc_value.filename and os.path.abspath(exc_value.filename) == script:
+        lineno, line = exc_value.lineno, (exc_value.text or '').strip()
+    type_name = exc_type.__qualname__
+    if exc_type.__module__ not in ('builtins', '__main__'):
+        type_name = f'{exc_type.__module__}.{type_name}'  # As traceback prints it.
+    return {
+        'type': type_name,
+        'message': str(exc_value),
+        'lineno': lineno,
+        'line': line,
+        'frames': frames,
+    }
+
+
+def _install_excepthook(script, exception_path):
+    def excepthook(exc_type, exc_value, tb):
+        tb = _script_traceback(tb, script)
+        traceback.print_exception(exc_type, exc_value, tb)
+        if exception_path:
+            with open(exception_path, 'w', encoding='utf-8') as f:
+                json.dump(_exception_record(exc_type, exc_value, tb, script), f)
+
+    sys.excepthook = excepthook
+
+
+def _apply_limits(limits):
+    try:
+        import resource
+    except ImportError:
+        return  # Windows: only the wall-clock timeout applies.
+    if limits.get('memory'):
+        resource.setrlimit(resource.RLIMIT_AS, (limits['memory'], limits['memory']))
+    if limits.get('cpu'):
+        resource.setrlimit(resource.RLIMIT_CPU, (limits['cpu'], limits['cpu'] + 5))
+
+
+def _run_script(request):
+    try:
+        os.setsid()
+    except (OSError, AttributeError):
+        pass  # Already a session leader (started with start_new_session), or not supported.
+    _apply_limits(request.get('limits', {}))
+    os.chdir(request['cwd'])
+    for key, value in request.get('env', {}).items():
+        os.environ[key] = value
+    stdout = os.open(request['stdout'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    stderr = stdout if request['merge_stderr'] else os.open(request['stderr'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(stdout, 1)
+    os.dup2(stderr, 2)
+    sys.stdin = open(os.devnull)
+
+    script = os.path.abspath(request['script'])
+    sys.argv = [request['script']]
+    sys.path[0] = os.path.dirname(script)
+    _install_excepthook(script, request.get('exception'))
+    code = 0
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        sys.excepthook(*sys.exc_info())
+        code = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(code)
+
+
+def _supervise(conn, request):
+    # The script may only start once the client has been told it started: a client that sees
+    # the connection drop before that runs it elsewhere, so it must not have run here.
+    go, ready = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        os.close(ready)
+        if os.read(go, 1) != b'1':
+            os._exit(1)  # The supervisor died before reporting the start.
+        os.close(go)
+        _run_script(request)
+    os.close(go)
+
+    # The client needs the pid (= process group) to cancel the script.
+    conn.sendall((json.dumps({'pid': pid}) + '\n').encode('utf-8'))
+    os.write(ready, b'1')
+    os.close(ready)
+
+    timed_out = False
+    timeout = request.get('timeout')
+    if timeout:
+        def kill(signum, frame):
+            nonlocal timed_out
+            timed_out = True
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        signal.signal(signal.SIGALRM, kill)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    while True:
+        try:
+            _, status, rusage = os.wait4(pid, 0)
+            break
+        except InterruptedError:
+            continue
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    # Negative codes mean "killed by signal", matching subprocess.
+    returncode = os.waitstatus_to_exitcode(status)
+    peak_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+    reply = {'returncode': returncode, 'timed_out': timed_out, 'peak_rss': peak_rss}
+    conn.sendall((json.dumps(reply) + '\n').encode('utf-8'))
+    conn.close()
+
+
+def _read_request(conn):
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = conn.recv(65536)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+
+def serve(socket_path, preload):
+    parent = os.getppid()
+    _preload(preload)
+    # Supervisors are reaped automatically; the zygote never blocks on them.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server.bind(socket_path)
+    server.listen(128)
+    server.settimeout(1.0)
+    print('ready', flush=True)
+
+    while True:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            # Exit together with the process that started us, even if it died without cleaning up.
+            if os.getppid() != parent:
+                os._exit(0)
+            continue
+        conn.settimeout(None)
+        try:
+            request = _read_request(conn)
+        except (OSError, ValueError):
+            conn.close()
+            continue
+        if request is None:
+            conn.close()
+            continue
+        if os.fork() == 0:
+            server.close()
+            # The supervisor must be able to wait for its own child.
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                _supervise(conn, request)
+            finally:
+                os._exit(0)
+        conn.close()
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--run':
+        _run_script(json.loads(sys.argv[2]))
+    else:
+        serve(sys.argv[1], [name for name in sys.argv[2].split(',') if name])
@@ -83,7 +83,11 @@ def handle_benchmark(data):
         print(f"执行 mainworkflow, 使用模型: {model}")
 
         def update_callback(expanded_instruction=None, code=None, visual_feedback=None, figure=None,
-                            terminal_output=None):
+                            terminal_output=None, stream_target=None, stream_delta=None, stream_reset=False,
+                            stream_code_block=None):
+            if stream_target:
+                emit('stream_update', {'target': stream_target, 'delta': stream_delta, 'reset': stream_reset,
+                                       'code_block': stream_code_block})
             if expanded_instruction:
                 emit('expanded_instruction_update', {'expanded_instruction': expanded_instruction, 'append': True})
             if code:
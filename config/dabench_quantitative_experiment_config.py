@@ -4,6 +4,11 @@ from agents.error_verifier_agent.prompt import RUBBER_DUCK_EVAL_SYSTEM_PROMPT, R
 
 AGENT_CONFIG = {
     'workspace': './workspace/InfiAgent',
+    # Instructions are independent; raise max_workers to run them concurrently ('thread', 'process' or 'asyncio').
+    'max_workers': 1,
+    'executor': 'thread',
+    # Set to a file path (e.g. './workspace/InfiAgent/dabench_journal.jsonl') to resume interrupted runs.
+    'journal': None,
     'agents': [
         {
             'name': 'dabench_quantitative_exp_agent',
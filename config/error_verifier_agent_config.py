@@ -16,7 +16,9 @@ AGENT_CONFIG = {
                 'eval': RUBBER_DUCK_EVAL_PROMPT
             },
             'kwargs': {
-                'query': 'Your default query here'
+                'query': 'Your default query here',
+                # rubber_duck_eval: error versions of one query verified concurrently (1 = serial)
+                'version_workers': 1
             }
         },
     ]
@@ -10,8 +10,8 @@ if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
 from agents.plot_agent import PlotAgent
-from openai import OpenAI
 from agents.config.openai import get_api_config
+from agents.openai_chatComplete import create_chat_completion
 from matplotbench_runtime import (
     copy_benchmark_inputs,
     ensure_example_workspace,
@@ -60,13 +60,8 @@ def gpt_4_evaluate(code, query, image, eval_model):
     else:
         executable = 'True'
 
-    api_config = get_api_config(eval_model)
-    client = OpenAI(
-        api_key=api_config["api_key"],
-        base_url=api_config["base_url"], )
-
-    response = client.chat.completions.create(
-        model=eval_model,
+    response = create_chat_completion(
+        eval_model,
         temperature=0.2,
         messages=[
             {
@@ -111,15 +106,11 @@ def gpt_4v_evaluate(ground_truth, image, rollback, benchmark_dir, eval_model):
         benchmark_dir,
     )
 
-    api_config = get_api_config(eval_model)
-    client = OpenAI(
-        api_key=api_config["api_key"],
-        base_url=api_config["base_url"],)
     base64_image1 = encode_image(reference_path)
     base64_image2 = encode_image(generated_path)
 
-    response = client.chat.completions.create(
-      model=eval_model,
+    response = create_chat_completion(
+      eval_model,
       temperature=0.2,
       messages=[
         {
@@ -170,16 +161,11 @@ def rubric_vlm_evaluate(query, ground_truth, image, rollback, benchmark_dir, eva
         benchmark_dir,
     )
 
-    api_config = get_api_config(eval_model)
-    client = OpenAI(
-        api_key=api_config["api_key"],
-        base_url=api_config["base_url"],
-    )
     base64_reference = encode_image(reference_path)
     base64_generated = encode_image(generated_path)
 
-    response = client.chat.completions.create(
-      model=eval_model,
+    response = create_chat_completion(
+      eval_model,
       temperature=0.2,
       messages=[
         {
@@ -1,3 +1,5 @@
+# "port" may also be a list of ports, or use "endpoints": ["http://host:port/v1", ...], to spread
+# requests across several vLLM replicas of the same model.
 MODEL_CONFIG ={
     "Magicoder-S-DS-6.7B":{
         "model": "path/to/Magicoder-S-DS-6.7B",
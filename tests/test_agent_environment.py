@@ -0,0 +1,56 @@
+import pickle
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from agents.agent_environment.agent import AgentEnvironment, ExecutionContext  # noqa: E402
+from agents.agent_environment.journal import WorkflowJournal  # noqa: E402
+
+
+class RecordingAgent:
+    def __init__(self, workspace, **kwargs):
+        self.workspace = workspace
+        self.kwargs = kwargs
+        self.chat_history = []
+
+
+def test_parallel_instructions_get_their_own_agents(tmp_path):
+    env = AgentEnvironment(str(tmp_path), {'max_workers': 4})
+    env.add_agent('plot', RecordingAgent, prejudge=False)
+
+    assert env._agents_for_context(False)['plot'] is env.agents['plot']
+    first, second = env._agents_for_context(True), env._agents_for_context(True)
+    assert first['plot'] is not second['plot'] and first['plot'] is not env.agents['plot']
+    assert first['plot'].kwargs == {'prejudge': False}
+
+
+def test_contexts_fill_in_their_own_copy_of_the_workflow(tmp_path):
+    workflow = [{'agent': 'plot', 'method': 'run', 'args': {}}]
+    ctx = ExecutionContext({'id': 1}, str(tmp_path), {}, workflow)
+    ctx.workflow[0]['args']['code'] = 'print(1)'
+    assert workflow[0]['args'] == {}
+
+
+def test_environment_pickles_for_the_process_executor(tmp_path):
+    env = AgentEnvironment(str(tmp_path), {'executor': 'process'})
+    env.add_agent('plot', RecordingAgent)
+    copy = pickle.loads(pickle.dumps(env))
+    assert copy.agents['plot'].workspace == str(tmp_path)
+    with copy.output_lock:
+        pass
+
+
+def test_only_successful_json_steps_are_journaled(tmp_path):
+    env = AgentEnvironment(str(tmp_path), {})
+    journal = WorkflowJournal(str(tmp_path / 'journal.jsonl'), [])
+    ctx = ExecutionContext({'id': 1}, str(tmp_path), {}, [])
+    step = {'agent': 'plot', 'method': 'run', 'output': 'plot_result'}
+
+    ctx.data_store['plot_result'] = {'log': 'ok', 'result': 'print(1)'}
+    assert env._journal_step(journal, ctx, '0', step, {'plot_run': ctx.data_store['plot_result']})
+    assert not env._journal_step(journal, ctx, '1', step, {'plot_run': None})
+    ctx.data_store['plot_result'] = {'log': 'ok', 'result': object()}
+    assert not env._journal_step(journal, ctx, '2', step, {'plot_run': ctx.data_store['plot_result']})
+
+    assert list(WorkflowJournal(str(tmp_path / 'journal.jsonl'), []).finished_steps(1)) == ['0']
@@ -0,0 +1,69 @@
+from agents.chat_context import compact_history
+from agents.plot_agent import agent as plot_agent_module
+from agents.plot_agent.agent import PlotAgent
+
+
+def _task(name):
+    return [{'role': 'system', 'content': f'system for {name}'}, {'role': 'user', 'content': f'task {name}'}]
+
+
+def _attempt(number, error):
+    return [{'role': 'assistant', 'content': f'code {number}'}, {'role': 'user', 'content': error}]
+
+
+def test_keeps_task_and_latest_turn_and_folds_older_errors():
+    messages = _task('a') + _attempt(1, 'NameError: x') + _attempt(2, 'KeyError: y')
+    sent = compact_history(messages, keep_turns=1, budget=0)
+
+    assert [m['content'] for m in sent[:3]] == ['system for a', 'task a', 'code 2']
+    assert sent[-1]['content'].startswith('KeyError: y')
+    assert '- attempt 1: NameError: x' in sent[-1]['content']
+    assert len(messages) == 6  # The caller's history is left untouched.
+
+
+def test_anchors_on_the_latest_task_prompt():
+    messages = _task('a') + _attempt(1, 'NameError: x') + _task('b') + _attempt(2, 'KeyError: y')
+    sent = compact_history(messages, keep_turns=1, budget=0)
+
+    assert [m['content'] for m in sent] == ['system for b', 'task b', 'code 2', 'KeyError: y']
+
+
+def test_short_history_of_a_later_task_drops_earlier_tasks():
+    messages = _task('a') + _attempt(1, 'NameError: x') + _task('b')
+    assert compact_history(messages, keep_turns=1, budget=0) == _task('b')
+
+
+def test_keep_turns_zero_sends_everything():
+    messages = _task('a') + _attempt(1, 'NameError: x') + _task('b')
+    assert compact_history(messages, keep_turns=0, budget=0) == messages
+
+
+def test_budget_cuts_the_longest_message():
+    messages = _task('a') + [{'role': 'assistant', 'content': 'x' * 40000}, {'role': 'user', 'content': 'Error'}]
+    sent = compact_history(messages, keep_turns=1, budget=2000)
+    assert 'characters omitted to fit the context budget' in sent[2]['content']
+    assert len(sent[2]['content']) < 40000
+
+
+def test_plot_agent_retries_with_the_current_instruction(tmp_path, monkeypatch):
+    sent = []
+
+    def fake_completion(messages, model_type, *args, **kwargs):
+        sent.append(messages)
+        image = 'first.png' if len(sent) <= 2 else 'second.png'
+        if len(sent) % 2 == 1:
+            # Fails the static check (undefined name), so the agent asks for a repair.
+            return f"```python\nprint(undefined_name)\nopen('{image}', 'wb')\n```"
+        return f"```python\nopen('{image}', 'wb').write(b'png')\n```"
+
+    monkeypatch.setattr(plot_agent_module, 'completion_with_backoff', fake_completion)
+    agent = PlotAgent(str(tmp_path), candidates=1)
+
+    agent.run(query='plot the first thing', model_type='test-model', file_name='first.png')
+    agent.run(query='plot the second thing', model_type='test-model', file_name='second.png')
+
+    assert len(sent) == 4
+    retry = '\n'.join(m['content'] for m in sent[3])
+    assert 'plot the second thing' in retry
+    assert 'plot the first thing' not in retry
+    assert (tmp_path / 'first.png').exists() and (tmp_path / 'second.png').exists()
@@ -0,0 +1,54 @@
+import pytest
+
+from agents import code_preflight
+from agents.code_preflight import check_code
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(code_preflight, 'code_preflight_enabled', True)
+
+
+def test_runnable_code_passes(tmp_path):
+    code = ("import json\n"
+            "try:\n    import not_installed_fancy_module\nexcept ImportError:\n    pass\n"
+            "def total(rows):\n    global seen\n    seen = len(rows)\n    return sum(rows)\n"
+            "print(json.dumps(total([1, 2])), seen, __name__, len)\n"
+            "open('plot.png', 'wb')\n")
+    assert check_code(code, str(tmp_path), target_file='out/plot.png') is None
+
+
+def test_syntax_errors_are_reported_like_a_traceback():
+    error = check_code("x = (1,\nprint(x)\n", file_name='plot.py')
+    assert error.startswith('\n  File "plot.py", line 1')
+    assert 'SyntaxError' in error
+
+
+def test_undefined_names_report_the_first_read():
+    error = check_code("def f():\n    return undefined_b\nprint(undefined_a)\nf()\n")
+    assert "line 2" in error and "NameError: name 'undefined_b' is not defined" in error
+
+
+def test_missing_modules_but_not_workspace_modules(tmp_path):
+    assert 'ModuleNotFoundError' in check_code("import not_installed_fancy_module\n", str(tmp_path))
+    (tmp_path / 'helpers.py').write_text('')
+    assert check_code("from helpers import load\nload()\n", str(tmp_path)) is None
+
+
+def test_target_paths_built_at_runtime_are_left_to_the_run(tmp_path):
+    (tmp_path / 'plotting.py').write_text('')  # Stands in for matplotlib / PIL, which may not be installed.
+    assert check_code("import os\nfrom plotting import plt\nstem, out = 'plot', '.'\n"
+                      "plt.savefig(os.path.join(out, f'{stem}.png'))\n", str(tmp_path), target_file='plot.png') is None
+    assert check_code("from plotting import image\nname = 'plot'\nimage.save(name + '.png')\n",
+                      str(tmp_path), target_file='plot.png') is None
+
+
+def test_missing_target_file_and_undecidable_code():
+    assert 'No plot generated' in check_code("print('done')\n", target_file='plot.png')
+    assert check_code("from os.path import *\nprint(join('a', 'b'))\n") is None
+    assert check_code("exec('y = 1')\nprint(y)\n") is None
+
+
+def test_disabled_check_returns_none(monkeypatch):
+    monkeypatch.setattr(code_preflight, 'code_preflight_enabled', False)
+    assert check_code("x = (") is None
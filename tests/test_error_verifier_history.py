@@ -0,0 +1,58 @@
+import json
+
+from agents.error_verifier_agent import agent as verifier_module
+from agents.error_verifier_agent.agent import ErrorVerifierAgent
+
+VERDICT = json.dumps({'cause_line': 'a = 2', 'effect_line': 'a = 2', 'error_type': 'ValueError',
+                      'error_message': 'boom'})
+SCORES = json.dumps({'cause_line_score': 1, 'effect_line_score': 1, 'error_type_score': 1,
+                     'error_message_score': 1})
+
+
+def _agent(monkeypatch, workspace, **kwargs):
+    def fake_completion(messages, model_type, backend='OpenRouter', temperature=0.0, use_cache=True):
+        return SCORES if 'Ground truth' in messages[-1]['content'] else VERDICT
+
+    monkeypatch.setattr(verifier_module, 'completion_with_backoff', fake_completion)
+    prompts = {'system': 'You verify code.', 'user': '{{query}}\n{{code}}',
+               'eval': 'Ground truth: {{ground_truth}}\nPrediction: {{eval_dict}}'}
+    return ErrorVerifierAgent(str(workspace), prompts=prompts, prejudge=False, **kwargs)
+
+
+def _query(n):
+    status = {'exception': {'type': 'ValueError', 'message': 'boom'}}
+    versions = [{'modified_code': f'a = {i}\nraise ValueError()', 'cause_error_line': 'a = 1',
+                 'effect_error_line': 'a = 1', 'execution_status': status} for i in range(n)]
+    return {'id': 7, 'question': 'Why does it fail?', 'error_versions': versions}
+
+
+def test_generate_records_the_sequential_history(monkeypatch, tmp_path):
+    agent = _agent(monkeypatch, tmp_path)
+    agent.generate('q1', 'm', 'a = 1')
+    agent.generate('q2', 'm', 'a = 2', record=False)
+    assert [m['role'] for m in agent.chat_history] == ['system', 'user']
+
+
+def test_parallel_versions_leave_the_shared_history_alone(monkeypatch, tmp_path):
+    agent = _agent(monkeypatch, tmp_path, version_workers=8)
+    _, results = agent.rubber_duck_eval(_query(32), 'm', str(tmp_path), str(tmp_path))
+    assert len(results) == 32
+    assert agent.chat_history == []
+
+
+def test_self_consistency_samples_build_their_own_messages(monkeypatch, tmp_path):
+    agent = _agent(monkeypatch, tmp_path)
+    _, results = agent.rubber_duck_eval_self_consistency(_query(2), 'm', str(tmp_path), str(tmp_path),
+                                                         n_samples=6, early_stop=False)
+    assert len(results) == 2
+    assert agent.chat_history == []
+
+
+def test_samples_needed_stops_once_the_vote_is_settled(tmp_path):
+    agent = ErrorVerifierAgent(str(tmp_path), prompts={})
+    a = {'cause_line': 'a = 1', 'effect_line': 'b = 2'}
+    b = {'cause_line': 'a = 2', 'effect_line': 'b = 2'}
+    assert agent._samples_needed([], 5) == 3
+    assert agent._samples_needed([a, a, a], 2) == 0
+    assert agent._samples_needed([a, a, b], 2) == 1
+    assert agent._samples_needed([a, b], 3) == 2
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from agents.error_verifier_agent import agent as verifier_module
+from agents.error_verifier_agent.agent import ErrorVerifierAgent
+
+FULL = {'cause_line_score': 1, 'effect_line_score': 0, 'error_type_score': 1, 'error_message_score': 0.5}
+INFORMATION = {'ground_truth': {'cause_error_line': 'a = 1'}, 'eval_dict': {'cause_line': 'a = 2'}}
+
+
+def _agent(replies, monkeypatch):
+    calls = []
+
+    def fake_completion(messages, model_type, backend='OpenRouter', temperature=0.0, use_cache=True):
+        calls.append(use_cache)
+        return replies[min(len(calls), len(replies)) - 1]
+
+    monkeypatch.setattr(verifier_module, 'completion_with_backoff', fake_completion)
+    agent = ErrorVerifierAgent('.', prompts={'eval': 'Ground truth: {{ground_truth}}\nPrediction: {{eval_dict}}'},
+                               prejudge=False)
+    return agent, calls
+
+
+def test_judge_accepts_a_complete_result(monkeypatch):
+    agent, calls = _agent([json.dumps(FULL)], monkeypatch)
+    assert agent._judge_one(INFORMATION) == FULL
+    assert calls == [True]
+
+
+@pytest.mark.parametrize('reply', [
+    {'cause_line_score': 1, 'effect_line_score': 1},                      # Missing scores.
+    dict(FULL, error_message_score=3),                                    # Out of range.
+    dict(FULL, error_type_score='yes'),                                   # Not a number.
+])
+def test_judge_rejects_incomplete_results(reply, monkeypatch):
+    agent, _ = _agent([json.dumps(reply)], monkeypatch)
+    with pytest.raises(ValueError):
+        agent._judge_one(INFORMATION)
+
+
+def test_retries_bypass_the_cache_until_a_valid_result(monkeypatch):
+    partial = json.dumps({'cause_line_score': 1})
+    agent, calls = _agent([partial, partial, json.dumps(FULL)], monkeypatch)
+    assert agent._judge(INFORMATION) == FULL
+    assert calls == [True, False, False]
+
+
+def test_judge_raises_when_every_attempt_is_invalid(monkeypatch):
+    agent, calls = _agent(['no json here'], monkeypatch)
+    with pytest.raises(ValueError):
+        agent._judge(INFORMATION)
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize('judge_batch_size', [1, 2])
+def test_multi_eval_grades_every_detected_error(judge_batch_size, monkeypatch, tmp_path):
+    detected = [{'cause_line': 'a = 1'}, {'cause_line': 'b = 2'}]
+
+    def fake_completion(messages, model_type, backend='OpenRouter', temperature=0.0, use_cache=True):
+        content = messages[-1]['content']
+        if '#### Task 2' in content:
+            return json.dumps([dict(FULL, task=1), dict(FULL, task=2)])
+        if 'Ground truth' in content:
+            return json.dumps(FULL)
+        return json.dumps(detected)
+
+    monkeypatch.setattr(verifier_module, 'completion_with_backoff', fake_completion)
+    prompts = {'system': 'You verify code.', 'user': '{{query}}\n{{code}}',
+               'eval': 'Ground truth: {{ground_truth}}\nPrediction: {{llm_output_error}}'}
+    agent = ErrorVerifierAgent(str(tmp_path), prompts=prompts, prejudge=False, judge_batch_size=judge_batch_size)
+    query = {'id': 9, 'question': 'Why?', 'modified_code': 'a = 1\nb = 2',
+             'execution_outputs': ['Traceback (most recent call last):\nKeyError: x'],
+             'cause_error_lines': ['a = 1'], 'effect_error_lines': ['a = 1']}
+
+    _, results = agent.multi_rubber_duck_eval(query, 'm', str(tmp_path), str(tmp_path))
+    assert results == [[FULL, FULL]]
@@ -0,0 +1,69 @@
+import os
+
+from agents.code_execution import execute_script
+
+RANDOM_SCRIPT = "import random\nprint(random.random())\n"
+PLOT_SCRIPT = "open('plot.png', 'w').write('from the script')\nprint('saved')\n"
+
+
+def _write(path, content):
+    path.write_text(content)
+    return path.name
+
+
+def test_reruns_by_default(tmp_path):
+    name = _write(tmp_path / 'script.py', RANDOM_SCRIPT)
+    first = execute_script(name, str(tmp_path))
+    second = execute_script(name, str(tmp_path))
+
+    assert first.success and second.success
+    assert not second.cached
+    assert first.output != second.output
+
+
+def test_unchanged_rerun_is_a_hit_when_enabled(tmp_path):
+    name = _write(tmp_path / 'script.py', PLOT_SCRIPT)
+    first = execute_script(name, str(tmp_path), use_cache=True)
+    second = execute_script(name, str(tmp_path), use_cache=True)
+
+    assert not first.cached
+    assert second.cached
+    assert second.output == first.output
+
+
+def test_changed_input_misses(tmp_path):
+    (tmp_path / 'data.csv').write_text('a\n1\n')
+    name = _write(tmp_path / 'script.py', "print(open('data.csv').read())\n")
+    execute_script(name, str(tmp_path), use_cache=True)
+    (tmp_path / 'data.csv').write_text('a\n2\n')
+
+    result = execute_script(name, str(tmp_path), use_cache=True)
+    assert not result.cached
+    assert '2' in result.output
+
+
+def test_overwritten_output_misses(tmp_path):
+    name = _write(tmp_path / 'script.py', PLOT_SCRIPT)
+    execute_script(name, str(tmp_path), use_cache=True)
+    (tmp_path / 'plot.png').write_text('written by another script')
+
+    result = execute_script(name, str(tmp_path), use_cache=True)
+    assert not result.cached
+    assert (tmp_path / 'plot.png').read_text() == 'from the script'
+
+
+def test_deleted_output_misses(tmp_path):
+    name = _write(tmp_path / 'script.py', PLOT_SCRIPT)
+    execute_script(name, str(tmp_path), use_cache=True)
+    (tmp_path / 'plot.png').unlink()
+
+    assert not execute_script(name, str(tmp_path), use_cache=True).cached
+    assert (tmp_path / 'plot.png').exists()
+
+
+def test_touched_but_identical_output_still_hits(tmp_path):
+    name = _write(tmp_path / 'script.py', PLOT_SCRIPT)
+    execute_script(name, str(tmp_path), use_cache=True)
+    os.utime(tmp_path / 'plot.png', ns=(1, 1))
+
+    assert execute_script(name, str(tmp_path), use_cache=True).cached
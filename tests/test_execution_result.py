@@ -0,0 +1,45 @@
+from agents.error_verifier_agent.agent import execution_error_message
+from agents.utils import get_error_message, is_run_code_success, run_code_result
+
+
+def test_success_follows_the_exit_status_not_the_output(tmp_path):
+    (tmp_path / 'warns.py').write_text("print('ValueError: only a message in the data')\n")
+    (tmp_path / 'fails.py').write_text("def f(x):\n    return 1 / x\n\nf(0)\n")
+
+    warns = run_code_result(str(tmp_path), 'warns.py')
+    fails = run_code_result(str(tmp_path), 'fails.py')
+
+    assert is_run_code_success(warns)
+    assert not is_run_code_success(fails)
+    assert fails.exception['type'] == 'ZeroDivisionError'
+    assert fails.exception['line'] == 'return 1 / x'
+    message = get_error_message(fails)
+    assert 'line 2, in f' in message and message.rstrip().endswith('ZeroDivisionError: division by zero')
+
+
+def test_syntax_errors_are_recorded_without_frames(tmp_path):
+    (tmp_path / 'broken.py').write_text("x = (1,\n")
+    result = run_code_result(str(tmp_path), 'broken.py')
+    assert result.exception['type'] == 'SyntaxError'
+    assert result.exception['frames'] == []
+    assert 'SyntaxError' in get_error_message(result)
+
+
+def test_summaries_feed_the_verifier_error_message(tmp_path):
+    (tmp_path / 'fails.py').write_text("raise KeyError('price')\n")
+    summary = run_code_result(str(tmp_path), 'fails.py').summary()
+    assert execution_error_message({'execution_status': summary}) == "KeyError: 'price'"
+    killed = {'execution_status': {'returncode': -9, 'exception': None}, 'execution_output': ''}
+    assert execution_error_message(killed) == 'The script was killed by signal 9.'
+
+
+def test_exits_without_an_exception_report_the_output_tail(tmp_path):
+    (tmp_path / 'bye.py').write_text("import sys\nprint('loading')\nsys.exit('bye: no rows matched')\n")
+    (tmp_path / 'quiet.py').write_text("import os\nos._exit(3)\n")
+
+    bye = run_code_result(str(tmp_path), 'bye.py')
+    quiet = run_code_result(str(tmp_path), 'quiet.py')
+
+    assert not bye.success and bye.exception is None
+    assert get_error_message(bye).endswith('bye: no rows matched')
+    assert get_error_message(quiet) == 'The script exited with status 3.'
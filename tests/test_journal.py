@@ -0,0 +1,37 @@
+
+import pytest
+
+pytest.importorskip('pandas')  # agents.agent_environment imports the environment, which needs pandas.
+
+from agents.agent_environment.journal import WorkflowJournal  # noqa: E402
+
+WORKFLOW = [{'agent': 'analyst', 'method': 'run', 'output': 'code'}]
+
+
+def test_finished_steps_and_status_survive_a_restart(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = WorkflowJournal(str(path), WORKFLOW)
+    journal.record_step(3, '0', {'analyst_run': {'log': 'ok', 'result': [1, 2.5, None]}}, {'code': 'print(1)'})
+    journal.record_status(3, 'done')
+
+    resumed = WorkflowJournal(str(path), WORKFLOW)
+    assert resumed.finished_steps(3)['0']['data_store'] == {'code': 'print(1)'}
+    assert resumed.status(3) == 'done'
+    assert WorkflowJournal(str(path), WORKFLOW + [{'agent': 'other'}]).finished_steps(3) == {}
+
+
+@pytest.mark.parametrize('result', [object(), ('log', 'result'), {1: 'int key'}, {'nested': [{'x': {2}}]}])
+def test_non_json_values_are_refused(tmp_path, result):
+    path = tmp_path / 'journal.jsonl'
+    journal = WorkflowJournal(str(path), WORKFLOW)
+    with pytest.raises(TypeError):
+        journal.record_step(3, '0', {'analyst_run': result}, {})
+    assert not path.exists()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    WorkflowJournal(str(path), WORKFLOW).record_step(3, '0', {}, {})
+    with open(path, 'a') as f:
+        f.write('{"workflow": "trunc')
+    assert list(WorkflowJournal(str(path), WORKFLOW).finished_steps(3)) == ['0']
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from agents.json_extract import JsonStream, extract_json, matches_schema, repair_json
+
+CODE_REPLY = '''Here is the fix:
+{"cause_line": "print("total: " + str(x))", "effect_line": "x = df['a'].sum()\n", "ok": True,}
+'''
+SUGGESTIONS = {'mean': [{'error_code': 'x = 1', 'error_type': 'off by one'}],
+               'filter': [{'error_code': 'y = 2'}]}
+
+
+def test_repair_json_fixes_common_llm_mistakes():
+    repaired = json.loads(repair_json(CODE_REPLY[CODE_REPLY.index('{'):]))
+    assert repaired == {'cause_line': 'print("total: " + str(x))', 'effect_line': "x = df['a'].sum()\n",
+                        'ok': True}
+
+
+def test_extract_json_skips_prose_braces_and_prefers_the_last_value():
+    reply = 'Format like {"cause_line": "..."}; see [notes {here}].\nAnswer: {"cause_line": "a = 1"}'
+    assert extract_json(reply, kind=dict, required=('cause_line',)) == {'cause_line': 'a = 1'}
+    assert extract_json(reply, kind=dict, prefer='first') == {'cause_line': '...'}
+
+
+def test_extract_json_raises_without_a_matching_value():
+    with pytest.raises(ValueError):
+        extract_json('no json at all', kind=dict)
+    with pytest.raises(ValueError):
+        extract_json('[1, 2]', kind=dict)
+    with pytest.raises(ValueError):
+        extract_json(None)
+
+
+def test_stream_reports_values_as_they_close():
+    text = 'Sure. {"a": [1, {"b": "}"}]} then {"a": 2}'
+    stream = JsonStream(kind=dict, required=('a',))
+    seen = []
+    for i in range(0, len(text), 3):
+        seen.extend(stream.feed(text[i:i + 3]))
+    seen.extend(stream.finish())
+    assert seen == [{'a': [1, {'b': '}'}]}, {'a': 2}]
+
+
+def test_stream_waits_for_the_delta_that_settles_an_unescaped_quote():
+    stream = JsonStream(kind=dict)
+    assert stream.feed('{"code": "print("') == []
+    assert stream.feed('hi")"}') == [{'code': 'print("hi")'}]
+
+
+def test_value_item_required_checks_a_dict_of_lists():
+    assert matches_schema(SUGGESTIONS, kind=dict, value_item_required=('error_code',))
+    assert not matches_schema({'error_code': 'x = 1'}, kind=dict, value_item_required=('error_code',))
+    assert not matches_schema({'mean': [{'explanation': 'x'}]}, kind=dict, value_item_required=('error_code',))
+
+
+def test_suggestions_do_not_fall_back_to_an_inner_error_object():
+    # The outer object does not parse, so only the inner {"error_code": ...} object balances.
+    reply = '{"mean": [{"error_code": "x = 1"}]'
+    with pytest.raises(ValueError):
+        extract_json(reply, kind=dict, value_item_required=('error_code',))
+    assert extract_json(json.dumps(SUGGESTIONS), kind=dict, value_item_required=('error_code',)) == SUGGESTIONS
@@ -0,0 +1,55 @@
+import time
+
+from agents import llm_cache
+from agents.llm_cache import CompletionCache, make_key
+
+MESSAGES = [{'role': 'user', 'content': 'Plot the data.'}]
+
+
+def test_key_covers_the_whole_request():
+    key = make_key('m', MESSAGES, 0.0)
+    assert key == make_key('m', [dict(MESSAGES[0])], 0.0)
+    assert key != make_key('other', MESSAGES, 0.0)
+    assert key != make_key('m', MESSAGES, 0.0, max_tokens=10)
+    assert key != make_key('m', [{'role': 'user', 'content': 'Plot the data!'}], 0.0)
+
+
+def test_round_trip_and_ttl(tmp_path):
+    cache = CompletionCache(str(tmp_path / 'cache.sqlite'), ttl=0.2)
+    cache.put('k', 'm', 'answer')
+    assert cache.get('k') == 'answer'
+    time.sleep(0.3)
+    assert cache.get('k') is None
+    assert cache.get('missing') is None
+
+
+def test_eviction_drops_the_least_recently_used(tmp_path):
+    cache = CompletionCache(str(tmp_path / 'cache.sqlite'), max_bytes=250)
+    cache.put('a', 'm', 'x' * 100)
+    time.sleep(0.01)
+    cache.put('b', 'm', 'y' * 100)
+    time.sleep(0.01)
+    assert cache.get('a')  # Touch 'a', so 'b' is now the oldest.
+    time.sleep(0.01)
+    cache.put('c', 'm', 'z' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+
+
+def test_sampled_requests_bypass_the_cache_by_default(monkeypatch):
+    monkeypatch.setattr(llm_cache, 'llm_cache_enabled', True)
+    monkeypatch.setattr(llm_cache, 'llm_cache_nondeterministic', False)
+    assert llm_cache.is_cacheable(0.0)
+    assert not llm_cache.is_cacheable(0.7)
+    assert not llm_cache.is_cacheable(0.0, use_cache=False)
+    assert llm_cache.lookup('m', MESSAGES, 0.7) == (None, None)
+
+
+def test_only_real_answers_are_stored(monkeypatch, tmp_path):
+    cache = CompletionCache(str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(llm_cache, 'get_cache', lambda: cache)
+    llm_cache.store('k1', 'm', '')
+    llm_cache.store('k2', 'm', RuntimeError('boom'))
+    llm_cache.store(None, 'm', 'answer')
+    llm_cache.store('k3', 'm', 'answer')
+    assert (cache.get('k1'), cache.get('k2'), cache.get('k3')) == (None, None, 'answer')
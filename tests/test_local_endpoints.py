@@ -0,0 +1,54 @@
+import httpx
+import openai
+import pytest
+
+from agents import local_endpoints
+from agents.local_endpoints import ReplicaPool, replica_urls
+
+URLS = ['http://replica-a/v1', 'http://replica-b/v1', 'http://replica-c/v1']
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ReplicaPool, '_start_prober', lambda self: None)
+    return ReplicaPool(URLS)
+
+
+def test_requests_go_to_the_least_busy_replica(pool):
+    first, second, third = pool.acquire(), pool.acquire(), pool.acquire()
+    assert {first.base_url, second.base_url, third.base_url} == set(URLS)
+    pool.release(second, 0.1)
+    assert pool.acquire() is second
+
+
+def test_connection_errors_take_a_replica_out_of_rotation(pool):
+    error = openai.APIConnectionError(request=httpx.Request('POST', URLS[0]))
+    with pytest.raises(openai.APIConnectionError):
+        with pool.route() as base_url:
+            assert base_url == URLS[0]
+            raise error
+    assert not pool.replicas[0].healthy
+    assert all(pool.acquire().base_url != URLS[0] for _ in range(4))
+
+
+def test_slow_replicas_are_ejected(pool, monkeypatch):
+    monkeypatch.setattr(local_endpoints, 'local_min_samples', 2)
+    monkeypatch.setattr(local_endpoints, 'local_slow_factor', 3.0)
+    a, b, c = pool.replicas
+    for replica, latency in ((b, 0.1), (c, 0.1), (a, 1.0), (a, 1.0)):
+        replica.outstanding += 1
+        pool.release(replica, latency)
+    assert not a.available(local_endpoints.time.monotonic())
+    assert a.latency is None and a.samples == 0
+
+
+def test_every_replica_down_still_routes(pool):
+    for replica in pool.replicas:
+        replica.healthy = False
+    assert pool.acquire().base_url in URLS
+
+
+def test_replica_urls_from_ports_or_endpoints():
+    assert replica_urls({'port': 8000}) == ['http://localhost:8000/v1']
+    assert replica_urls({'port': [8000, 8001]}) == ['http://localhost:8000/v1', 'http://localhost:8001/v1']
+    assert replica_urls({'endpoints': URLS, 'port': 1}) == URLS
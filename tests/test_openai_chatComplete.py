@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from agents import openai_chatComplete, rate_limiter
+
+VISION_MESSAGES = [{'role': 'user', 'content': [
+    {'type': 'text', 'text': 'Describe the plot.'},
+    {'type': 'image_url', 'image_url': {'url': 'data:image/png;base64,AAAA'}},
+]}]
+
+
+class FakeClient:
+    def __init__(self, calls, base_url):
+        self.calls = calls
+        self.base_url = base_url
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls.append(dict(kwargs, base_url=self.base_url))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='a bar chart'))])
+
+
+def test_vision_call_uses_the_local_model_name_and_replica(monkeypatch):
+    calls = []
+    monkeypatch.setitem(openai_chatComplete.MODEL_CONFIG, 'test-vision-local',
+                        {'endpoints': ['http://replica-a/v1'], 'model': '/models/served-vision', 'engine': 'server'})
+    monkeypatch.setattr(openai_chatComplete, 'get_client',
+                        lambda base_url, api_key, provider: FakeClient(calls, base_url))
+
+    answer = openai_chatComplete.completion_for_4v(VISION_MESSAGES, 'test-vision-local', use_cache=False)
+
+    assert answer == 'a bar chart'
+    assert calls[0]['model'] == '/models/served-vision'
+    assert calls[0]['base_url'] == 'http://replica-a/v1'
+
+
+def test_vision_call_uses_the_offline_engine(monkeypatch):
+    seen = []
+
+    class FakeEngine:
+        def complete(self, messages, temperature, max_tokens):
+            seen.append(messages)
+            return 'offline answer'
+
+    monkeypatch.setitem(openai_chatComplete.MODEL_CONFIG, 'test-vision-offline',
+                        {'port': 1, 'model': '/models/offline-vision', 'engine': 'offline'})
+    monkeypatch.setattr(openai_chatComplete, 'get_offline_engine', lambda name, model: FakeEngine())
+
+    def no_server(*args, **kwargs):
+        raise AssertionError('offline mode must not call the server')
+
+    monkeypatch.setattr(openai_chatComplete, 'get_client', no_server)
+
+    assert openai_chatComplete.completion_for_4v(VISION_MESSAGES, 'test-vision-offline', use_cache=False) == 'offline answer'
+    assert seen == [VISION_MESSAGES]
+
+
+def test_clients_are_pooled_per_endpoint(monkeypatch):
+    monkeypatch.setattr(openai_chatComplete, '_CLIENTS', {})
+    first = openai_chatComplete.get_client('http://pooled-a/v1', 'key', 'test')
+    assert openai_chatComplete.get_client('http://pooled-a/v1', 'key', 'test') is first
+    assert openai_chatComplete.get_client('http://pooled-b/v1', 'key', 'test') is not first
+    assert first.max_retries == 0
+    openai_chatComplete.close_clients()
+    assert openai_chatComplete._CLIENTS == {}
+
+
+def test_completion_batch_keeps_order_and_caps_concurrency(monkeypatch):
+    state = {'running': 0, 'peak': 0}
+
+    class FakeAsyncClient:
+        def __init__(self):
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+        async def create(self, **kwargs):
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            await asyncio.sleep(0.02)
+            state['running'] -= 1
+            reply = kwargs['messages'][0]['content'].upper()
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+        async def close(self):
+            pass
+
+    monkeypatch.setitem(openai_chatComplete.MODEL_CONFIG, 'test-batch-local',
+                        {'endpoints': ['http://replica-batch/v1'], 'model': '/models/batch', 'engine': 'server'})
+    monkeypatch.setitem(openai_chatComplete.provider_concurrency, 'local', 2)
+    monkeypatch.setattr(openai_chatComplete, 'get_async_client', lambda base_url, api_key, provider: FakeAsyncClient())
+
+    prompts = [[{'role': 'user', 'content': f'q{index}'}] for index in range(6)]
+    answers = openai_chatComplete.completion_batch(prompts, 'test-batch-local', use_cache=False)
+
+    assert answers == [f'Q{index}' for index in range(6)]
+    assert state['peak'] == 2
+
+
+def test_offline_batch_queues_every_request_before_any_answer(monkeypatch):
+    class BatchingEngine:
+        def __init__(self, size):
+            self.size = size
+            self.pending = []
+
+        def submit(self, messages, temperature, max_tokens):
+            future = Future()
+            self.pending.append((messages, future))
+            # Fail instead of hanging if the rest of the batch never arrives.
+            threading.Timer(5, lambda: future.done() or future.set_exception(TimeoutError('batch never filled'))).start()
+            if len(self.pending) == self.size:
+                # Answer only once the whole batch is queued, as one vLLM call would.
+                for queued, queued_future in self.pending:
+                    queued_future.set_result('answer to ' + queued[0]['content'])
+            return future
+
+    engine = BatchingEngine(5)
+    monkeypatch.setitem(openai_chatComplete.MODEL_CONFIG, 'test-batch-offline',
+                        {'port': 1, 'model': '/models/offline', 'engine': 'offline'})
+    monkeypatch.setattr(openai_chatComplete, 'get_offline_engine', lambda name, model: engine)
+
+    prompts = [[{'role': 'user', 'content': f'q{index}'}] for index in range(5)]
+    answers = openai_chatComplete.completion_batch(prompts, 'test-batch-offline', use_cache=False)
+    assert answers == [f'answer to q{index}' for index in range(5)]
+
+
+def test_direct_callers_get_rate_limited_retries(monkeypatch):
+    attempts = []
+    response = httpx.Response(429, request=httpx.Request('POST', 'http://replica-eval/v1'))
+
+    def create(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise openai.RateLimitError('slow down', response=response, body=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='[FINAL SCORE]: 80'))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(rate_limiter, '_jittered_backoff', lambda retry_state: 0.0)
+    monkeypatch.setitem(openai_chatComplete.MODEL_CONFIG, 'test-eval-local',
+                        {'endpoints': ['http://replica-eval/v1'], 'model': '/models/eval', 'engine': 'server'})
+    monkeypatch.setattr(openai_chatComplete, 'get_client', lambda base_url, api_key, provider: client)
+
+    result = openai_chatComplete.create_chat_completion('test-eval-local', VISION_MESSAGES, temperature=0.2,
+                                                        max_tokens=1000)
+    assert result.choices[0].message.content == '[FINAL SCORE]: 80'
+    assert len(attempts) == 2
+    assert attempts[1]['model'] == '/models/eval' and attempts[1]['max_tokens'] == 1000
@@ -0,0 +1,68 @@
+import os
+import threading
+
+from agents.plot_agent import agent as plot_module
+from agents.plot_agent.agent import PlotAgent
+
+FAILS = "```python\nraise ValueError('bad column')\nopen('plot.png', 'wb')\n```"
+SLOW = "```python\nimport time\ntime.sleep(20)\nopen('plot.png', 'wb').write(b'slow')\n```"
+FAST = "```python\nopen('plot.png', 'wb').write(b'fast')\n```"
+
+
+def _fake_completion(monkeypatch, sampled_replies, repair_reply=None):
+    lock = threading.Lock()
+    calls = []
+
+    def fake(messages, model_type, temperature=0.0, **kwargs):
+        with lock:
+            calls.append((temperature, messages))
+            if temperature == 0.0:
+                # The temperature-0 candidate, then the repair loop's calls.
+                return FAILS if len([c for c in calls if c[0] == 0.0]) == 1 else repair_reply
+            return sampled_replies.pop(0)
+
+    monkeypatch.setattr(plot_module, 'completion_with_backoff', fake)
+    return calls
+
+
+def test_first_working_candidate_wins_and_cancels_the_rest(monkeypatch, tmp_path):
+    _fake_completion(monkeypatch, [SLOW, FAST])
+    agent = PlotAgent(str(tmp_path), candidates=3)
+
+    log, code = agent.run('Plot the data.', model_type='m', file_name='plot.png')
+
+    assert "b'fast'" in code
+    assert (tmp_path / 'plot.png').read_bytes() == b'fast'
+    published = [name for name in os.listdir(tmp_path) if name.startswith('code_action_')]
+    assert sorted(published) == ['code_action_m_initial_0.py', 'code_action_m_initial_0.py.log']
+    assert agent.chat_history[-1] == {'role': 'assistant', 'content': FAST}
+
+
+def test_without_a_winner_the_temperature_0_candidate_is_repaired(monkeypatch, tmp_path):
+    calls = _fake_completion(monkeypatch, [FAILS, FAILS], repair_reply=FAST)
+    agent = PlotAgent(str(tmp_path), candidates=3)
+
+    log, code = agent.run('Plot the data.', model_type='m', file_name='plot.png')
+
+    assert "b'fast'" in code and (tmp_path / 'plot.png').read_bytes() == b'fast'
+    repair_messages = calls[-1][1]
+    assert 'bad column' in repair_messages[-1]['content']
+
+
+def test_candidates_work_on_copies_and_the_winner_publishes_all_its_outputs(monkeypatch, tmp_path):
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'data' / 'input.csv').write_text('a\n1\n')
+    clobber = ("```python\nopen('data/input.csv', 'w').write('clobbered')\n"
+               "raise ValueError('bad')\nopen('plot.png', 'wb')\n```")
+    writes = ("```python\nimport os\nassert open('data/input.csv').read() == 'a\\n1\\n'\n"
+              "os.makedirs('out', exist_ok=True)\nopen('out/stats.txt', 'w').write('n=1')\n"
+              "open('plot.png', 'wb').write(b'fast')\n```")
+    _fake_completion(monkeypatch, [clobber, writes])
+    agent = PlotAgent(str(tmp_path), candidates=3)
+
+    log, code = agent.run('Plot the data.', model_type='m', file_name='plot.png')
+
+    assert "b'fast'" in code
+    assert (tmp_path / 'data' / 'input.csv').read_text() == 'a\n1\n'
+    assert (tmp_path / 'out' / 'stats.txt').read_text() == 'n=1'
+    assert (tmp_path / 'plot.png').read_bytes() == b'fast'
@@ -0,0 +1,36 @@
+import pytest
+
+from agents.utils import PromptTemplate, fill_in_placeholders
+
+PROMPT = "Question: {{query}}\nCode:\n```python\n{{code}}\n```\nFiles: {{workspace_structure}} {{query}} {{ }}"
+
+
+def _replace_render(prompt, placeholders):
+    """The per-key str.replace rendering the templates replaced."""
+    for key, value in placeholders.items():
+        if value is not None:
+            prompt = prompt.replace('{{' + str(key) + '}}', str(value))
+    return prompt
+
+
+@pytest.mark.parametrize('placeholders', [
+    {'query': 'Why?', 'code': 'print({"a": 1})', 'workspace_structure': '- data/'},
+    {'query': 'Why?', 'code': None},                        # None and missing keys leave the slot.
+    {'query': 3, 'unused': 'x', 'code': ''},
+    {},
+])
+def test_renders_like_str_replace(placeholders):
+    assert fill_in_placeholders(PROMPT, placeholders) == _replace_render(PROMPT, placeholders)
+
+
+def test_non_string_keys():
+    assert PromptTemplate('{{1}} and {{2}}').render({1: 'one', 2: None}) == 'one and {{2}}'
+
+
+def test_strict_mode_reports_missing_and_unused_values():
+    template = PromptTemplate('{{a}} {{b}}')
+    assert template.render({'a': 1, 'b': 2}, strict=True) == '1 2'
+    with pytest.raises(KeyError):
+        template.render({'a': 1, 'b': None}, strict=True)
+    with pytest.raises(ValueError):
+        template.render({'a': 1, 'b': 2, 'c': 3}, strict=True)
@@ -0,0 +1,93 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from agents import rate_limiter
+from agents.rate_limiter import ModelLimiter, TokenBucket, call_with_limits, estimate_tokens, retry_after_seconds
+
+
+def _error_with_headers(headers):
+    return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+
+def test_token_bucket_allows_capacity_then_waits():
+    bucket = TokenBucket(60)  # One token per second.
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_zero_rate_is_unlimited():
+    assert TokenBucket(0).reserve(10 ** 9) == 0.0
+
+
+def test_retry_after_seconds_and_milliseconds():
+    assert retry_after_seconds(_error_with_headers({'retry-after': '3'})) == 3.0
+    assert retry_after_seconds(_error_with_headers({'retry-after-ms': '1500'})) == 1.5
+
+
+def test_retry_after_http_date():
+    date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 30))
+    assert 25 <= retry_after_seconds(_error_with_headers({'retry-after': date})) <= 31
+
+
+@pytest.mark.parametrize('value', ['', 'soon', 'Mon, 99 Foo 2024'])
+def test_malformed_retry_after_falls_back_to_backoff(value):
+    assert retry_after_seconds(_error_with_headers({'retry-after': value})) is None
+
+
+def test_estimate_tokens_counts_text_and_images():
+    messages = [{'role': 'user', 'content': [{'type': 'text', 'text': 'x' * 400}, {'type': 'image_url'}]}]
+    assert estimate_tokens(messages, max_tokens=10) == 100 + 1000 + 10
+
+
+def test_waiting_for_the_budget_does_not_hold_a_slot(monkeypatch):
+    limiter = ModelLimiter(rpm=60, tpm=0, max_concurrency=1)
+    monkeypatch.setitem(rate_limiter._LIMITERS, 'test-limited-model', limiter)
+    limiter.requests.reserve(60)  # Empty the request bucket: the next call waits about a second.
+
+    thread = threading.Thread(target=call_with_limits, args=('test-limited-model', 1, 0, lambda: 'ok'))
+    thread.start()
+    time.sleep(0.3)
+    assert limiter.in_flight == 0
+    thread.join()
+    assert limiter.in_flight == 0
+
+
+def test_throttled_call_with_malformed_retry_after_is_retried(monkeypatch):
+    monkeypatch.setattr(rate_limiter, '_jittered_backoff', lambda retry_state: 0.0)
+    monkeypatch.setitem(rate_limiter._LIMITERS, 'test-throttled-model', ModelLimiter(rpm=0, tpm=0, max_concurrency=2))
+    response = httpx.Response(429, headers={'retry-after': 'soon'}, request=httpx.Request('POST', 'http://llm.test/v1'))
+    attempts = []
+
+    def request():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise openai.RateLimitError('slow down', response=response, body=None)
+        return 'ok'
+
+    assert call_with_limits('test-throttled-model', 2, 0, request) == 'ok'
+    assert len(attempts) == 2
+
+
+def test_holding_limits_retries_the_open_and_keeps_the_slot(monkeypatch):
+    monkeypatch.setattr(rate_limiter, '_jittered_backoff', lambda retry_state: 0.0)
+    limiter = ModelLimiter(rpm=0, tpm=0, max_concurrency=2)
+    monkeypatch.setitem(rate_limiter._LIMITERS, 'test-held-model', limiter)
+    response = httpx.Response(503, request=httpx.Request('POST', 'http://llm.test/v1'))
+    attempts = []
+
+    def open_stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise openai.InternalServerError('busy', response=response, body=None)
+        return 'stream'
+
+    with rate_limiter.holding_limits('test-held-model', 2, 0, open_stream) as stream:
+        assert stream == 'stream'
+        assert limiter.in_flight == 1
+    assert limiter.in_flight == 0
+    assert len(attempts) == 2
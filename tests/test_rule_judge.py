@@ -0,0 +1,56 @@
+import pytest
+
+from agents.error_verifier_agent import agent as verifier_module
+from agents.error_verifier_agent.agent import ErrorVerifierAgent
+from agents.error_verifier_agent.rule_judge import compare_errors, compare_lines, prejudge
+
+GROUND_TRUTH = {'cause_error_line': "df = df[df['age'] > 30]", 'effect_error_line': "mean = df['age'].mean()",
+                'execution_output': 'Traceback ...\nKeyError: \'age\''}
+
+
+@pytest.mark.parametrize('truth, prediction, score', [
+    ("x = foo(a, b)", "x=foo(a,b)  ", 1),                         # Same AST.
+    ("for i in range(n):", "for i in range(n) :", 1),             # Compound header.
+    ("x = foo(a, b)", "x = foo(a, b)  # the bug", 1),
+    ("x = foo(a, b)", "plt.savefig('out.png')", 0),
+    ("x = foo(a, b)", "", 0),
+    ("x = foo(a, b)", "x = foo(a, c)", None),                     # Close but different: left to the judge.
+    ("", "x = 1", None),
+])
+def test_compare_lines(truth, prediction, score):
+    assert compare_lines(truth, prediction) == score
+
+
+def test_compare_errors():
+    output = GROUND_TRUTH['execution_output']
+    assert compare_errors(output, {'error_type': 'KeyError', 'error_message': "KeyError: 'age'"}) == (1, 1.0)
+    assert compare_errors(output, {'error_type': 'builtins.KeyError', 'error_message': "'age'."}) == (1, 1.0)
+    assert compare_errors(output, {'error_type': 'ZeroDivisionError', 'error_message': 'division by zero'}) == (0, 0.0)
+    assert compare_errors(output, {'error_message': ''}) == (0, 0.0)
+    assert compare_errors('no exception here', {'error_type': 'KeyError'}) == (None, None)
+
+
+def test_prejudge_settles_only_clear_cut_cases():
+    exact = {'cause_line': GROUND_TRUTH['cause_error_line'], 'effect_line': GROUND_TRUTH['effect_error_line'],
+             'error_type': 'KeyError', 'error_message': "KeyError: 'age'"}
+    wrong = {'cause_line': 'import numpy as np', 'effect_line': 'plt.show()', 'error_type': 'ZeroDivisionError',
+             'error_message': 'division by zero'}
+    mixed = dict(exact, effect_line='plt.show()')
+
+    assert prejudge({'ground_truth': GROUND_TRUTH, 'eval_dict': exact})['error_message_score'] == 1.0
+    assert prejudge({'ground_truth': GROUND_TRUTH, 'eval_dict': wrong})['cause_line_score'] == 0
+    assert prejudge({'ground_truth': GROUND_TRUTH, 'eval_dict': mixed}) is None
+    other = dict(GROUND_TRUTH, cause_error_line='x = 1')
+    assert prejudge({'ground_truth': [other, GROUND_TRUTH], 'llm_output_error': exact})['cause_line_score'] == 1
+    assert prejudge({'ground_truth': [other], 'llm_output_error': wrong}) is None
+
+
+def test_verifier_skips_the_llm_for_settled_cases(monkeypatch, tmp_path):
+    def no_llm(*args, **kwargs):
+        raise AssertionError('a clear-cut case must not reach the LLM judge')
+
+    monkeypatch.setattr(verifier_module, 'completion_with_backoff', no_llm)
+    agent = ErrorVerifierAgent(str(tmp_path), prompts={'eval': '{{ground_truth}} {{eval_dict}}'})
+    prediction = {'cause_line': GROUND_TRUTH['cause_error_line'], 'effect_line': GROUND_TRUTH['effect_error_line'],
+                  'error_type': 'KeyError', 'error_message': "'age'"}
+    assert agent._judge({'ground_truth': GROUND_TRUTH, 'eval_dict': prediction})['cause_line_score'] == 1
@@ -0,0 +1,25 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.utils import run_code
+
+SCRIPT = "import os\nopen('where.txt', 'w').write(os.getcwd())\nprint(os.environ.get('RUN_TAG', 'none'))\n"
+
+
+def test_concurrent_runs_use_their_own_directories(tmp_path):
+    workspaces = []
+    for index in range(6):
+        workspace = tmp_path / f'ws{index}'
+        workspace.mkdir()
+        (workspace / 'script.py').write_text(SCRIPT)
+        workspaces.append(workspace)
+    cwd = os.getcwd()
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        outputs = list(pool.map(lambda ws: run_code(str(ws), 'script.py', env={'RUN_TAG': ws.name}), workspaces))
+
+    assert os.getcwd() == cwd
+    assert outputs == [f'{ws.name}\n' for ws in workspaces]
+    for workspace in workspaces:
+        assert os.path.realpath((workspace / 'where.txt').read_text()) == os.path.realpath(workspace)
+        assert (workspace / 'script.py.log').read_text() == f'{workspace.name}\n'
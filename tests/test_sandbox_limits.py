@@ -0,0 +1,32 @@
+import pytest
+
+from agents.code_execution import run_python
+
+resource = pytest.importorskip('resource')
+
+# Reserves 12 GiB of address space without touching it, as numpy/BLAS arenas do.
+RESERVE = """
+import mmap
+regions = [mmap.mmap(-1, 4 * 1024 ** 3, flags=mmap.MAP_PRIVATE) for _ in range(3)]
+print('reserved')
+"""
+
+
+def test_large_virtual_reservations_work_by_default(tmp_path):
+    (tmp_path / 'reserve.py').write_text(RESERVE)
+    result = run_python('reserve.py', str(tmp_path))
+    assert result.success, result.output
+    assert 'reserved' in result.output
+
+
+def test_address_space_limit_applies_when_configured(tmp_path):
+    (tmp_path / 'reserve.py').write_text(RESERVE)
+    result = run_python('reserve.py', str(tmp_path), memory_mb=512)
+    assert not result.success
+    assert result.exception['type'] in ('OSError', 'MemoryError')
+
+
+def test_wall_clock_timeout_kills_the_script(tmp_path):
+    (tmp_path / 'sleep.py').write_text("import time\ntime.sleep(30)\n")
+    result = run_python('sleep.py', str(tmp_path), timeout=1)
+    assert result.killed and result.timed_out
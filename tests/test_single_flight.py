@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'answer'
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(flight.do, 'key', slow) for _ in range(8)]
+        started.wait(5)
+        time.sleep(0.2)  # Let the other callers join the running call.
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == ['answer'] * 8
+    assert len(calls) == 1
+
+
+def test_errors_reach_every_waiter_and_are_not_remembered():
+    flight = SingleFlight()
+    with pytest.raises(RuntimeError):
+        flight.do('key', lambda: (_ for _ in ()).throw(RuntimeError('boom')))
+    assert flight.do('key', lambda: 'retried') == 'retried'
+
+
+def test_async_callers_share_one_execution():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'answer'
+
+    async def main():
+        flight = AsyncSingleFlight()
+        results = await asyncio.gather(*[flight.do('key', fetch) for _ in range(5)])
+        again = await flight.do('key', fetch)
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert results == ['answer'] * 5 and again == 'answer'
+    assert len(calls) == 2
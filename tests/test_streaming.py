@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+from agents import openai_chatComplete, rate_limiter
+from agents.plot_agent import agent as plot_module
+from agents.plot_agent.agent import PlotAgent
+from agents.rate_limiter import ModelLimiter
+from agents.utils import CodeBlockStream
+
+REPLY = ['Here:\n```py', 'thon\nimport matplotlib\n', 'plt.plot([1])\n``', '`\nDone.']
+
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+                       for delta in deltas] + [SimpleNamespace(choices=[])]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+def test_code_blocks_are_reported_when_their_fence_closes():
+    blocks = CodeBlockStream()
+    reported = [blocks.feed(delta) for delta in REPLY]
+    assert reported == [[], [], [], ['import matplotlib\nplt.plot([1])']]
+
+
+def test_completion_with_stream_forwards_deltas(monkeypatch):
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return FakeStream(REPLY)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setitem(openai_chatComplete.MODEL_CONFIG, 'test-stream-local',
+                        {'endpoints': ['http://replica-stream/v1'], 'model': '/models/stream', 'engine': 'server'})
+    monkeypatch.setattr(openai_chatComplete, 'get_client', lambda base_url, api_key, provider: client)
+
+    deltas = []
+    answer = openai_chatComplete.completion_with_stream([{'role': 'user', 'content': 'plot'}], 'test-stream-local',
+                                                        deltas.append, use_cache=False)
+    assert answer == ''.join(REPLY)
+    assert deltas == REPLY
+    assert requests[0]['stream'] is True
+
+
+def test_plot_agent_streams_deltas_and_code_blocks(monkeypatch, tmp_path):
+    events = []
+
+    def fake_stream(messages, model_type, on_delta):
+        for delta in REPLY:
+            on_delta(delta)
+        return ''.join(REPLY)
+
+    monkeypatch.setattr(plot_module, 'completion_with_stream', fake_stream)
+    agent = PlotAgent(str(tmp_path), stream_callback=lambda **event: events.append(event))
+    assert agent._complete([{'role': 'user', 'content': 'plot'}], 'm') == ''.join(REPLY)
+    assert events[0] == {'reset': True}
+    assert [event['delta'] for event in events if 'delta' in event] == REPLY
+    assert [event['code_block'] for event in events if 'code_block' in event] == ['import matplotlib\nplt.plot([1])']
+
+
+def test_stream_holds_its_slot_and_replica_until_read_or_closed(monkeypatch):
+    limiter = ModelLimiter(rpm=0, tpm=0, max_concurrency=4)
+    monkeypatch.setitem(rate_limiter._LIMITERS, 'test-stream-held', limiter)
+    monkeypatch.setitem(openai_chatComplete.MODEL_CONFIG, 'test-stream-held',
+                        {'endpoints': ['http://replica-held/v1'], 'model': '/models/held', 'engine': 'server'})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: FakeStream(REPLY))))
+    monkeypatch.setattr(openai_chatComplete, 'get_client', lambda base_url, api_key, provider: client)
+    replica = openai_chatComplete._resolve_endpoint('test-stream-held')['replicas'].replicas[0]
+    messages = [{'role': 'user', 'content': 'plot'}]
+
+    stream = openai_chatComplete.stream_completion(messages, 'test-stream-held', use_cache=False)
+    assert next(stream) == REPLY[0]
+    assert limiter.in_flight == 1 and replica.outstanding == 1
+    assert list(stream) == REPLY[1:]
+    assert limiter.in_flight == 0 and replica.outstanding == 0
+    assert replica.samples == 1
+
+    stream = openai_chatComplete.stream_completion(messages, 'test-stream-held', use_cache=False)
+    next(stream)
+    stream.close()
+    assert limiter.in_flight == 0 and replica.outstanding == 0
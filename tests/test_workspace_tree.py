@@ -0,0 +1,60 @@
+import os
+
+from agents.utils import print_filesys_struture
+
+
+def _walk_render(work_directory, max_entries=100):
+    """The os.walk rendering the cached tree replaced."""
+    text = ''
+    for root, dirs, files in os.walk(work_directory):
+        level = root.replace(work_directory, '').count(os.sep)
+        text += f"{' ' * 4 * level}- {os.path.basename(root)}/\n"
+        subindent = ' ' * 4 * (level + 1) + '- '
+        for idx, f in enumerate(files):
+            if idx >= max_entries:
+                text += f'{subindent}`wrapped`\n'
+                break
+            text += f'{subindent}{f}\n'
+    return text
+
+
+def _make_tree(root):
+    (root / 'data' / 'raw').mkdir(parents=True)
+    (root / 'data' / 'raw' / 'a.csv').write_text('x')
+    (root / 'plots').mkdir()
+    for index in range(5):
+        (root / 'plots' / f'p{index}.png').write_text('x')
+    (root / 'main.py').write_text('x')
+
+
+def test_matches_the_os_walk_rendering(tmp_path):
+    _make_tree(tmp_path)
+    root = str(tmp_path)
+    assert print_filesys_struture(root, max_depth=0, max_lines=0) == _walk_render(root)
+    assert print_filesys_struture(root, max_entry_nums_for_level=3, max_depth=0, max_lines=0) == _walk_render(root, 3)
+
+
+def test_new_and_removed_files_show_up(tmp_path):
+    _make_tree(tmp_path)
+    root = str(tmp_path)
+    print_filesys_struture(root, max_depth=0, max_lines=0)
+    (tmp_path / 'data' / 'raw' / 'b.csv').write_text('x')
+    os.remove(tmp_path / 'main.py')
+    text = print_filesys_struture(root, max_depth=0, max_lines=0)
+    assert '- b.csv' in text and 'main.py' not in text
+    assert text == _walk_render(root)
+
+
+def test_depth_and_line_budgets(tmp_path):
+    _make_tree(tmp_path)
+    root = str(tmp_path)
+    shallow = print_filesys_struture(root, max_depth=1, max_lines=0)
+    assert '- raw/' not in shallow and '`wrapped`' in shallow
+    short = print_filesys_struture(root, max_depth=0, max_lines=3)
+    assert short.count('\n') == 4 and short.endswith('`wrapped`\n')
+
+
+def test_ignored_patterns(tmp_path):
+    _make_tree(tmp_path)
+    text = print_filesys_struture(str(tmp_path), ignored_list=['*.png'], max_depth=0, max_lines=0)
+    assert '.png' not in text and '- plots/' in text
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from agents.code_execution import Zygote, run_python
+from agents.config.execution import zygote_enabled
+
+# Appends a line, then kills its supervisor if it runs under the zygote (never the test process).
+KILL_SUPERVISOR = """
+import os, signal, time
+with open('runs.txt', 'a') as f:
+    f.write('ran\\n')
+with open(f'/proc/{os.getppid()}/cmdline', 'rb') as f:
+    parent = f.read().split(b'\\0')
+if any(arg.endswith(b'agents/zygote.py') for arg in parent) and b'--run' not in parent:
+    os.kill(os.getppid(), signal.SIGKILL)
+    time.sleep(5)
+"""
+
+
+@pytest.mark.skipif(not (zygote_enabled and Zygote.supported() and os.path.exists('/proc/self/cmdline')),
+                    reason='needs the fork-based zygote and /proc')
+def test_script_is_not_rerun_when_the_zygote_dies_mid_run(tmp_path):
+    (tmp_path / 'script.py').write_text(KILL_SUPERVISOR)
+    result = run_python('script.py', str(tmp_path), timeout=30)
+
+    assert (tmp_path / 'runs.txt').read_text() == 'ran\n'
+    assert result.killed
+    assert 'execution server died' in result.output
+
+
+def test_runs_scripts_and_reports_exit_status(tmp_path):
+    (tmp_path / 'ok.py').write_text("print('hello')\n")
+    (tmp_path / 'fail.py').write_text("raise ValueError('boom')\n")
+
+    ok = run_python('ok.py', str(tmp_path))
+    fail = run_python('fail.py', str(tmp_path))
+
+    assert ok.success and ok.output == 'hello\n'
+    assert not fail.success and not fail.killed
+    assert fail.exception['type'] == 'ValueError'
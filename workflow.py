@@ -72,6 +72,17 @@ def uses_structured_visual_reasoning(prompt_variant):
     return prompt_variant != 'default'
 
 
+def stream_to(update_callback, target):
+    """Adapt update_callback into the stream_callback agents call while a reply is generated."""
+    if update_callback is None:
+        return None
+
+    def stream_callback(delta=None, reset=False, code_block=None):
+        update_callback(stream_target=target, stream_delta=delta, stream_reset=reset, stream_code_block=code_block)
+
+    return stream_callback
+
+
 def mainworkflow(
     expert_instruction,
     simple_instruction,
@@ -99,7 +110,8 @@ def mainworkflow(
     print(f"Using model: {model}")
 
 
-    query_expansion_agent = QueryExpansionAgent(config, model_type=model)
+    query_expansion_agent = QueryExpansionAgent(config, model_type=model,
+                                                stream_callback=stream_to(update_callback, 'expanded_instruction'))
     expanded_simple_instruction = query_expansion_agent.run(simple_instruction)
     if isinstance(expanded_simple_instruction, list):
         expanded_simple_instruction = expanded_simple_instruction[0] if expanded_simple_instruction else simple_instruction
@@ -111,7 +123,7 @@ def mainworkflow(
         update_callback(expanded_instruction=expanded_simple_instruction)
 
     print('=========Plotting=========')
-    action_agent = PlotAgent(config, query=expanded_simple_instruction)
+    action_agent = PlotAgent(config, query=expanded_simple_instruction, stream_callback=stream_to(update_callback, 'code'))
     print(f'========={model} Plotting=========')
 
     novice_log, novice_code = action_agent.run_initial(model, 'novice.png')
@@ -136,6 +148,7 @@ def mainworkflow(
             query=simple_instruction,
             code=novice_code,
             prompt_variant=prompt_variant,
+            stream_callback=stream_to(update_callback, 'visual_feedback'),
         )
         visual_feedback = visual_refine_agent.run(model, 'novice', 'novice_final.png')
         log_text_block("Visual Feedback", visual_feedback)
@@ -155,11 +168,12 @@ def mainworkflow(
         else:
             final_instruction = '\n\n' + visual_feedback
         log_text_block("Final Refinement Instruction", final_instruction)
-        action_agent = PlotAgent(config, query=final_instruction)
+        action_agent = PlotAgent(config, query=final_instruction, stream_callback=stream_to(update_callback, 'code'))
         novice_log, novice_code = action_agent.run_vis(model, 'novice_final.png')
         logging.info(novice_log)
 
         if update_callback:
+            update_callback(code=novice_code)
             update_callback(figure=os.path.join(workspace, 'novice_final.png'))
 
     result = {